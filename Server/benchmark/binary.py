@@ -0,0 +1,145 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Stored incident size and decode throughput
+
+Compares incidents stored as JSON text with incidents stored in the binary
+format (see L{ims.binary}): bytes per incident, incidents decoded per second
+with and without lazy report entries (as storage reads them), and incidents
+encoded per second.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from time import time
+
+from twisted.python import usage
+
+import ims.data
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.binary import incident_to_data, incident_from_data
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 2000, "Number of incidents to build.", int],
+        ["entries", "e", 10, "Report entries per incident.", int],
+        ["repeat", "r", 5, "Number of passes; the best is reported.", int],
+    ]
+
+
+
+def create_incidents(count, entries):
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number)
+        yield Incident(
+            number=number,
+            rangers=[Ranger(u"Tulsa", None, None)],
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=[u"Medical"],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Report entry {0}".format(entry),
+                    created=created + TimeDelta(seconds=entry),
+                )
+                for entry in xrange(entries)
+            ],
+            created=created,
+            dispatched=created + TimeDelta(minutes=1),
+            on_scene=created + TimeDelta(minutes=5),
+            closed=created + TimeDelta(minutes=30),
+            priority=3,
+        )
+
+
+def clear_caches(incidents):
+    ims.data._parsed_rfc3339.clear()
+    ims.data._rendered_rfc3339.clear()
+
+    for incident in incidents:
+        incident._json_cache = None
+
+
+def best_rate(f, items, repeat, setup):
+    best = None
+    for _ in xrange(repeat):
+        setup()
+        start = time()
+        for item in items:
+            f(item)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(items) / best
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    incidents = list(
+        create_incidents(options["incidents"], options["entries"])
+    )
+
+    def cold():
+        clear_caches(incidents)
+
+    print "{0} incidents, {1} report entries each".format(
+        options["incidents"], options["entries"]
+    )
+    print ""
+    print "{0:<8} {1:>16} {2:>18} {3:>18} {4:>18}".format(
+        "format", "size (bytes)", "decode (inc/s)", "lazy (inc/s)",
+        "encode (inc/s)",
+    )
+
+    for data_format in ("json", "binary"):
+        stored = [
+            (incident.number, incident_to_data(incident, data_format))
+            for incident in incidents
+        ]
+
+        def decode((number, data)):
+            incident_from_data(data, number)
+
+        def decode_lazy((number, data)):
+            incident_from_data(data, number, lazy=True)
+
+        def encode(incident):
+            incident_to_data(incident, data_format)
+
+        print "{0:<8} {1:>16.0f} {2:>18.0f} {3:>18.0f} {4:>18.0f}".format(
+            data_format,
+            float(sum(len(data) for number, data in stored)) / len(stored),
+            best_rate(decode, stored, options["repeat"], cold),
+            best_rate(decode_lazy, stored, options["repeat"], cold),
+            best_rate(encode, incidents, options["repeat"], cold),
+        )
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
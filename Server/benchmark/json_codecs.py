@@ -0,0 +1,105 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+JSON codec throughput
+
+Compares the available JSON codecs (see L{ims.data.json_codecs}) at decoding
+and encoding the incidents in the test corpus, and at encoding an incident
+list like the one served by C{/incidents}.
+"""
+
+import sys
+import tarfile
+from hashlib import sha1 as etag_hash
+from time import time
+
+from twisted.python import usage
+from twisted.python.filepath import FilePath
+
+from ims.data import json_codecs
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["repeat", "r", 100, "Number of passes; the best is reported.", int],
+        ["list-size", "l", 5000, "Number of incidents in the list.", int],
+    ]
+
+
+
+def load_corpus():
+    archive = tarfile.open(
+        FilePath(__file__).parent().sibling("test").child("incidents.tgz").path
+    )
+    try:
+        return [
+            archive.extractfile(member).read()
+            for member in archive.getmembers()
+            if member.isfile()
+        ]
+    finally:
+        archive.close()
+
+
+def best_rate(f, items, repeat):
+    best = None
+    for _ in xrange(repeat):
+        start = time()
+        for item in items:
+            f(item)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(items) / best
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    corpus = load_corpus()
+    roots = [json_codecs[-1].decode(data) for data in corpus]
+    incident_list = [
+        (number, etag_hash(str(number)).hexdigest())
+        for number in xrange(options["list-size"])
+    ]
+
+    print "{0} incidents in corpus, {1} incidents in list".format(
+        len(corpus), options["list-size"]
+    )
+    print ""
+    print "{0:<12} {1:>20} {2:>20} {3:>16}".format(
+        "codec", "decode (incident/s)", "encode (incident/s)", "list (list/s)"
+    )
+
+    for codec in json_codecs:
+        print "{0:<12} {1:>20.0f} {2:>20.0f} {3:>16.1f}".format(
+            codec.name,
+            best_rate(codec.decode, corpus, options["repeat"]),
+            best_rate(codec.encode, roots, options["repeat"]),
+            best_rate(codec.encode, [incident_list], options["repeat"]),
+        )
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
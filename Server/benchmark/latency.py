@@ -0,0 +1,210 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Request latency while reports are being generated
+
+Serves a generated data store and measures the latency of C{/ping} and
+C{/incidents/<number>} requests while other clients repeatedly load the
+daily report, first with storage accessed in the reactor thread
+(C{StorageThreads = 0}) and then with storage accessed in a thread pool.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from random import randint
+from tempfile import mkdtemp
+from time import sleep, time
+
+from twisted.python import usage
+from twisted.python.filepath import FilePath
+from twisted.internet import reactor
+from twisted.internet.defer import inlineCallbacks, returnValue
+from twisted.internet.defer import DeferredList
+from twisted.internet.task import react
+from twisted.web.client import getPage
+from twisted.web.server import Site
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.store import Storage
+from ims.config import Configuration
+from ims.protocol import IncidentManagementSystem
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 500, "Number of incidents to store.", int],
+        [
+            "disk-latency", "l", 1.0,
+            "Milliseconds to add to each incident read.", float
+        ],
+        ["reporters", "r", 2, "Number of clients loading reports.", int],
+        ["duration", "d", 10.0, "Seconds to measure for.", float],
+        ["threads", "t", 4, "Storage threads to compare against.", int],
+    ]
+
+
+
+def create_incidents(path, count):
+    storage = Storage(path, sync=False)
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number)
+        storage.write_incident(Incident(
+            number=number,
+            rangers=[Ranger(u"Tulsa", None, None)],
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=[u"Medical"],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Report entry {0}".format(entry),
+                    created=created + TimeDelta(seconds=entry),
+                )
+                for entry in xrange(5)
+            ],
+            created=created,
+            priority=3,
+        ))
+
+
+def slow_disk(storage, latency):
+    read = storage.read_incident_with_number_raw
+
+    def slow_read(number):
+        sleep(latency)
+        return read(number)
+
+    storage.read_incident_with_number_raw = slow_read
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+@inlineCallbacks
+def measure(root, options, threads):
+    configFile = root.child("imsd.conf")
+    configFile.setContent(
+        "[Core]\n"
+        "ServerRoot = {0}\n"
+        "Resources = {1}\n"
+        "CacheSize = 0\n"
+        "StorageThreads = {2}\n"
+        .format(
+            root.path,
+            FilePath(__file__).parent().sibling("resources").path,
+            threads,
+        )
+    )
+    config = Configuration(configFile)
+    slow_disk(config.storage, options["disk-latency"] / 1000)
+
+    ims = IncidentManagementSystem(config)
+    port = reactor.listenTCP(
+        0, Site(ims.app.resource()), interface="127.0.0.1"
+    )
+    base_url = "http://127.0.0.1:{0}".format(port.getHost().port)
+
+    deadline = time() + options["duration"]
+    latencies = {"/ping": [], "/incidents/<number>": []}
+    reports = []
+
+    @inlineCallbacks
+    def load_reports():
+        while time() < deadline:
+            yield getPage(base_url + "/reports/daily")
+            reports.append(None)
+
+    @inlineCallbacks
+    def probe():
+        while time() < deadline:
+            for name, path in (
+                ("/ping", "/ping"),
+                (
+                    "/incidents/<number>",
+                    "/incidents/{0}".format(randint(1, options["incidents"]))
+                ),
+            ):
+                start = time()
+                yield getPage(base_url + path)
+                latencies[name].append(time() - start)
+
+    yield DeferredList(
+        [load_reports() for _ in xrange(options["reporters"])] + [probe()],
+        fireOnOneErrback=True, consumeErrors=True,
+    )
+
+    yield port.stopListening()
+    config.async_storage.stop()
+
+    returnValue((latencies, len(reports)))
+
+
+@inlineCallbacks
+def benchmark(reactor, options):
+    root = FilePath(mkdtemp(prefix="ims-benchmark-"))
+    try:
+        create_incidents(root.child("data"), options["incidents"])
+
+        print (
+            "{0} incidents, {1:g}ms disk latency, {2} report clients, "
+            "{3:g}s per run"
+            .format(
+                options["incidents"], options["disk-latency"],
+                options["reporters"], options["duration"],
+            )
+        )
+        print ""
+        print "{0:<10} {1:<22} {2:>8} {3:>9} {4:>9} {5:>8}".format(
+            "threads", "request", "count", "p50 (ms)", "p99 (ms)", "reports"
+        )
+
+        for threads in (0, options["threads"]):
+            latencies, reports = yield measure(root, options, threads)
+
+            for name in sorted(latencies):
+                samples = latencies[name]
+                print (
+                    "{0:<10} {1:<22} {2:>8} {3:>9.1f} {4:>9.1f} {5:>8}".format(
+                        threads, name, len(samples),
+                        percentile(samples, 0.50) * 1000,
+                        percentile(samples, 0.99) * 1000,
+                        reports,
+                    )
+                )
+    finally:
+        root.remove()
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    react(benchmark, (options,))
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
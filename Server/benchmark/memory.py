@@ -0,0 +1,172 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Memory used by cached incidents
+
+Builds a synthetic corpus of incidents and reports the number of bytes each
+incident occupies, counting every object reachable from it once.  The
+corpus is built with dictionary-backed copies of the data model classes (the
+layout before C{__slots__} were added), then with the data model classes
+themselves, first without and then with shared strings for ranger handles,
+incident types and report entry authors.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from gc import get_referents
+
+from twisted.python import usage
+
+import ims.data
+from ims.data import Incident, ReportEntry, Ranger, Location
+
+
+
+default_intern_table_size = ims.data.intern_table_size
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 20000, "Number of incidents to build.", int],
+        ["entries", "e", 10, "Report entries per incident.", int],
+    ]
+
+
+
+def dict_backed(cls):
+    """
+    A copy of C{cls} without C{__slots__}, whose instances store their
+    attributes in a C{__dict__}.
+    """
+    namespace = dict(
+        (name, value) for name, value in cls.__dict__.iteritems()
+        if name != "__slots__" and name not in cls.__slots__
+    )
+    return type(cls.__name__, (object,), namespace)
+
+
+def handle(number):
+    # A new string for each call, as when parsing, from a vocabulary of 2000
+    return u"Ranger {0}".format(number % 2000)
+
+
+def create_incidents(count, entries, classes):
+    incident_class, entry_class, ranger_class, location_class = classes
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number)
+        yield incident_class(
+            number=number,
+            rangers=[
+                ranger_class(handle(number), None, None),
+                ranger_class(handle(number + 1), None, None),
+            ],
+            location=location_class(
+                u"Camp {0}".format(number % 500), u"5:45 & Esplanade"
+            ),
+            incident_types=[u"Type {0}".format(number % 20)],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                entry_class(
+                    author=handle(number + entry),
+                    text=u"Report entry {0} for incident {1}".format(
+                        entry, number
+                    ),
+                    created=created + TimeDelta(seconds=entry),
+                )
+                for entry in xrange(entries)
+            ],
+            created=created,
+            priority=3,
+        )
+
+
+def deep_size(objects):
+    """
+    Compute the size in bytes of some objects and everything they refer to,
+    excluding types and shared constants.
+    """
+    seen = set(id(o) for o in (None, True, False))
+    pending = list(objects)
+    total = 0
+
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        pending.extend(get_referents(obj))
+
+    return total
+
+
+def measure(options, classes, shared):
+    ims.data._interned_text.clear()
+    if shared:
+        ims.data.intern_table_size = default_intern_table_size
+    else:
+        ims.data.intern_table_size = 0
+
+    try:
+        incidents = list(create_incidents(
+            options["incidents"], options["entries"], classes
+        ))
+        return deep_size(incidents) / float(len(incidents))
+    finally:
+        ims.data.intern_table_size = default_intern_table_size
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    classes = (Incident, ReportEntry, Ranger, Location)
+
+    print "{0} incidents, {1} report entries each".format(
+        options["incidents"], options["entries"]
+    )
+    print ""
+    print "{0:<22} {1:>18} {2:>10}".format(
+        "layout", "bytes per incident", "saving"
+    )
+
+    baseline = None
+
+    for name, layout, shared in (
+        ("__dict__", [dict_backed(cls) for cls in classes], False),
+        ("__slots__", classes, False),
+        ("__slots__, interned", classes, True),
+    ):
+        size = measure(options, layout, shared)
+        if baseline is None:
+            baseline = size
+
+        print "{0:<22} {1:>18.0f} {2:>9.1f}%".format(
+            name, size, 100 * (1 - size / baseline)
+        )
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
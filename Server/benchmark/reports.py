@@ -0,0 +1,164 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Daily report generation time
+
+Generates the data for the daily report table from a synthetic corpus of
+incidents, first with incidents hashed and compared on every field (as they
+were before incidents were hashed by number), then with L{Incident} itself.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from time import time
+
+from twisted.python import usage
+from twisted.python.filepath import FilePath
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.element.report_daily import DailyReportElement
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 20000, "Number of incidents to build.", int],
+        ["entries", "e", 10, "Report entries per incident.", int],
+        ["repeat", "r", 3, "Number of passes; the best is reported.", int],
+    ]
+
+
+
+class FieldHashedIncident(Incident):
+    """
+    An incident that is hashed and compared on every field.
+    """
+
+    def __hash__(self):
+        return hash((
+            self.number,
+            tuple(self.rangers),
+            self.location,
+            tuple(self.incident_types),
+            self.summary,
+            tuple(self.report_entries),
+            self.created,
+            self.dispatched,
+            self.on_scene,
+            self.closed,
+            self.priority,
+        ))
+
+
+    def __eq__(self, other):
+        if isinstance(other, Incident):
+            return (
+                self.number == other.number and
+                self.rangers == other.rangers and
+                self.location == other.location and
+                self.incident_types == other.incident_types and
+                self.summary == other.summary and
+                self.report_entries == other.report_entries and
+                self.created == other.created and
+                self.dispatched == other.dispatched and
+                self.on_scene == other.on_scene and
+                self.closed == other.closed and
+                self.priority == other.priority
+            )
+        else:
+            return NotImplemented
+
+
+
+class Configuration(object):
+    Resources = FilePath(__file__).parent().sibling("resources")
+
+
+
+class IncidentManagementSystem(object):
+    config = Configuration()
+
+
+
+def create_incidents(count, entries, incident_class):
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+    minutes = 7 * 24 * 60 / count or 1
+    incident_types = [u"Type {0}".format(n) for n in xrange(10)]
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number * minutes)
+        yield incident_class(
+            number=number,
+            rangers=[Ranger(u"Tulsa", None, None)],
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=incident_types[number % 3::3],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Report entry {0}".format(entry),
+                    created=created + TimeDelta(hours=entry),
+                    system_entry=(entry % 3 == 0),
+                )
+                for entry in xrange(entries)
+            ],
+            created=created,
+            priority=3,
+        )
+
+
+def best_time(incidents, repeat):
+    ims = IncidentManagementSystem()
+    best = None
+    for _ in xrange(repeat):
+        start = time()
+        DailyReportElement(ims, incidents).data(labels=True, totals=True)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    print "{0} incidents, {1} report entries each".format(
+        options["incidents"], options["entries"]
+    )
+    print ""
+    print "{0:<22} {1:>12}".format("incidents", "report (ms)")
+
+    for name, incident_class in (
+        ("hashed on all fields", FieldHashedIncident),
+        ("hashed on number", Incident),
+    ):
+        incidents = list(create_incidents(
+            options["incidents"], options["entries"], incident_class
+        ))
+        print "{0:<22} {1:>12.1f}".format(
+            name, best_time(incidents, options["repeat"]) * 1000
+        )
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
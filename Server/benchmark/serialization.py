@@ -0,0 +1,162 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Incident parse and serialize throughput
+
+Measures how many incidents per second L{Incident.from_json_text} and
+L{Incident.to_json_text} handle, with timestamps handled by
+L{DateTime.strptime} and L{DateTime.strftime}, and with
+L{ims.data.parse_rfc3339} and L{ims.data.render_rfc3339} with and without
+their caches (and the cached JSON on each incident) warmed up.  Parsing is
+also measured with report entries created lazily.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from time import time
+
+from twisted.python import usage
+
+import ims.data
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.data import rfc3339_date_time_format
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 2000, "Number of incidents to build.", int],
+        ["entries", "e", 10, "Report entries per incident.", int],
+        ["repeat", "r", 5, "Number of passes; the best is reported.", int],
+    ]
+
+
+
+def create_incidents(count, entries):
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number)
+        yield Incident(
+            number=number,
+            rangers=[Ranger(u"Tulsa", None, None)],
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=[u"Medical"],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Report entry {0}".format(entry),
+                    created=created + TimeDelta(seconds=entry),
+                )
+                for entry in xrange(entries)
+            ],
+            created=created,
+            dispatched=created + TimeDelta(minutes=1),
+            on_scene=created + TimeDelta(minutes=5),
+            closed=created + TimeDelta(minutes=30),
+            priority=3,
+        )
+
+
+def strptime(text):
+    return DateTime.strptime(text, rfc3339_date_time_format)
+
+
+def strftime(date_time):
+    return date_time.strftime(rfc3339_date_time_format)
+
+
+def clear_caches(incidents):
+    ims.data._parsed_rfc3339.clear()
+    ims.data._rendered_rfc3339.clear()
+
+    for incident in incidents:
+        incident._json_cache = None
+
+
+def best_rate(f, items, repeat, setup):
+    best = None
+    for _ in xrange(repeat):
+        setup()
+        start = time()
+        for item in items:
+            f(item)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(items) / best
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    incidents = list(
+        create_incidents(options["incidents"], options["entries"])
+    )
+    texts = [(i.number, i.to_json_text()) for i in incidents]
+
+    def parse((number, text)):
+        Incident.from_json_text(text, number)
+
+    def parse_lazy((number, text)):
+        Incident.from_json_text(text, number, lazy=True)
+
+    def serialize(incident):
+        incident.to_json_data()
+
+    def cold():
+        clear_caches(incidents)
+
+    def warm():
+        pass
+
+    print "{0} incidents, {1} report entries each".format(
+        options["incidents"], options["entries"]
+    )
+    print ""
+    print "{0:<20} {1:>18} {2:>18}".format(
+        "timestamps", "parse (incident/s)", "render (incident/s)"
+    )
+
+    fast = (ims.data.parse_rfc3339, ims.data.render_rfc3339)
+
+    for name, functions, setup, parser in (
+        ("strptime/strftime", (strptime, strftime), cold, parse),
+        ("rfc3339 (cold)", fast, cold, parse),
+        ("rfc3339 (cached)", fast, warm, parse),
+        ("rfc3339 (lazy)", fast, cold, parse_lazy),
+    ):
+        ims.data.parse_rfc3339, ims.data.render_rfc3339 = functions
+        try:
+            print "{0:<20} {1:>18.0f} {2:>18.0f}".format(
+                name,
+                best_rate(parser, texts, options["repeat"], setup),
+                best_rate(serialize, incidents, options["repeat"], setup),
+            )
+        finally:
+            ims.data.parse_rfc3339, ims.data.render_rfc3339 = fast
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
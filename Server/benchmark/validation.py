@@ -0,0 +1,126 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Incident parse and validation throughput
+
+Measures how many large incidents per second L{Incident.from_json_text}
+parses with and without validation, and how many already-validated
+incidents per second L{Incident.validate} checks again, as
+L{ims.store.Storage.write_incident} does.
+"""
+
+import sys
+from datetime import datetime as DateTime, timedelta as TimeDelta
+from time import time
+
+from twisted.python import usage
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+
+
+
+class Options(usage.Options):
+    optParameters = [
+        ["incidents", "n", 100, "Number of incidents to build.", int],
+        ["entries", "e", 500, "Report entries per incident.", int],
+        ["repeat", "r", 5, "Number of passes; the best is reported.", int],
+    ]
+
+
+
+def create_incidents(count, entries):
+    start = DateTime(2013, 8, 26, 12, 0, 0)
+
+    for number in xrange(1, count + 1):
+        created = start + TimeDelta(minutes=number)
+        yield Incident(
+            number=number,
+            rangers=[Ranger(u"Tulsa", None, None)],
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=[u"Medical"],
+            summary=u"Incident {0}".format(number),
+            report_entries=[
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Report entry {0}".format(entry),
+                    created=created + TimeDelta(seconds=entry),
+                )
+                for entry in xrange(entries)
+            ],
+            created=created,
+            priority=3,
+        )
+
+
+def best_rate(f, items, repeat):
+    best = None
+    for _ in xrange(repeat):
+        start = time()
+        for item in items:
+            f(item)
+        elapsed = time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(items) / best
+
+
+def main(argv):
+    options = Options()
+    try:
+        options.parseOptions(argv[1:])
+    except usage.UsageError as e:
+        sys.stderr.write("{0}\n\n{1}\n".format(e, options))
+        return 64
+
+    texts = [
+        (incident.number, incident.to_json_data())
+        for incident in create_incidents(
+            options["incidents"], options["entries"]
+        )
+    ]
+    incidents = [
+        Incident.from_json_text(text, number) for number, text in texts
+    ]
+
+    def parse((number, text)):
+        Incident.from_json_text(text, number, validate=False)
+
+    def parse_validate((number, text)):
+        Incident.from_json_text(text, number, validate=True)
+
+    def revalidate(incident):
+        incident.validate()
+
+    print "{0} incidents, {1} report entries each".format(
+        options["incidents"], options["entries"]
+    )
+    print ""
+    print "{0:<20} {1:>12}".format("operation", "incident/s")
+
+    for name, f, items in (
+        ("parse", parse, texts),
+        ("parse and validate", parse_validate, texts),
+        ("validate again", revalidate, incidents),
+    ):
+        print "{0:<20} {1:>12.1f}".format(
+            name, best_rate(f, items, options["repeat"])
+        )
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,252 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Asynchronous data store access
+"""
+
+__all__ = [
+    "AsyncStorage",
+]
+
+from twisted.internet.defer import maybeDeferred
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+from ims.store import NoSuchIncidentError
+
+
+
+class AsyncStorage(object):
+    """
+    Runs storage operations in a thread pool, so that slow disks don't block
+    the reactor.  Methods mirror those of L{ims.store.Storage}, but return
+    L{Deferred}s; iterators are returned as lists.
+    """
+
+    def __init__(self, storage, max_threads=4, reactor=None):
+        """
+        @param storage: The storage to access.
+        @type storage: L{ims.store.ReadOnlyStorage}
+
+        @param max_threads: The maximum number of threads to run storage
+            operations in.  If C{0}, storage operations are run synchronously
+            in the reactor thread.
+        @type max_threads: L{int}
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+
+        self.storage = storage
+        self.max_threads = max_threads
+
+        self._reactor = reactor
+        self._pool = None
+
+        # Subscriber -> the wrapper subscribed to the storage for it
+        self._subscribers = {}
+
+
+    def __repr__(self):
+        return "{self.__class__.__name__}({self.storage!r})".format(self=self)
+
+
+    def _start(self):
+        if self._pool is None:
+            self._pool = ThreadPool(
+                minthreads=0, maxthreads=self.max_threads, name=repr(self)
+            )
+            self._pool.start()
+            self._shutdown_trigger = self._reactor.addSystemEventTrigger(
+                "during", "shutdown", self._stop_pool
+            )
+
+
+    def stop(self):
+        """
+        Stop the thread pool, waiting for queued operations to finish.
+        """
+        if self._pool is not None:
+            self._reactor.removeSystemEventTrigger(self._shutdown_trigger)
+            self._stop_pool()
+
+
+    def _stop_pool(self):
+        if self._pool is not None:
+            self._pool.stop()
+            self._pool = None
+
+
+    def run(self, f, *args, **kwargs):
+        """
+        Call a function in the thread pool.
+
+        @param f: The function to call.  It is called with the storage as its
+            first argument, followed by C{args} and C{kwargs}.
+
+        @return: A deferred resulting in the return value of C{f}.
+        @rtype: L{Deferred}
+        """
+        if not self.max_threads:
+            return maybeDeferred(f, self.storage, *args, **kwargs)
+
+        self._start()
+        return deferToThreadPool(
+            self._reactor, self._pool, f, self.storage, *args, **kwargs
+        )
+
+
+    def provision(self):
+        return self.run(lambda storage: storage.provision())
+
+
+    def list_incidents(self):
+        return self.run(lambda storage: list(storage.list_incidents()))
+
+
+    def search_incidents(self, *args, **kwargs):
+        return self.run(
+            lambda storage: list(storage.search_incidents(*args, **kwargs))
+        )
+
+
+    def query_incidents(self, **criteria):
+        return self.run(lambda storage: storage.query_incidents(**criteria))
+
+
+    def etag_for_incident_with_number(self, number):
+        return self.run(
+            lambda storage: storage.etag_for_incident_with_number(number)
+        )
+
+
+    def read_incident_with_number_raw(self, number):
+        return self.run(
+            lambda storage: storage.read_incident_with_number_raw(number)
+        )
+
+
+    def read_incident_with_number(self, number):
+        return self.run(
+            lambda storage: storage.read_incident_with_number(number)
+        )
+
+
+    def read_incidents(self, numbers=None, report_entries=False):
+        """
+        Read a number of incidents in one trip to the thread pool.
+
+        @param numbers: The numbers of the incidents to read.  If C{None},
+            read every incident.
+        @type numbers: iterable of L{int}
+
+        @param report_entries: If true, create the incidents' report entries
+            in the thread pool.  Otherwise, incidents may create them when
+            they are first used, in the reactor thread.
+        @type report_entries: L{bool}
+
+        @return: A deferred resulting in a L{list} of L{Incident}s.
+        @rtype: L{Deferred}
+        """
+        if numbers is not None:
+            numbers = list(numbers)
+
+        def read(storage, numbers=numbers):
+            if numbers is None:
+                numbers = [number for number, etag in storage.list_incidents()]
+            incidents = [
+                storage.read_incident_with_number(number)
+                for number in numbers
+            ]
+            if report_entries:
+                for incident in incidents:
+                    incident.report_entries
+            return incidents
+
+        return self.run(read)
+
+
+    def read_incidents_with_etags(self, numbers):
+        """
+        Read a number of incidents and their etags in one trip to the thread
+        pool.  Unlike L{read_incidents}, missing incidents are not an error.
+
+        @param numbers: The numbers of the incidents to read.
+        @type numbers: iterable of L{int}
+
+        @return: A deferred resulting in a L{list} of
+            C{(number, etag, incident)} tuples, in the order of C{numbers}.
+            The etag and incident are C{None} for missing incidents.
+        @rtype: L{Deferred}
+        """
+        numbers = list(numbers)
+
+        def read(storage):
+            incidents = []
+            for number in numbers:
+                # Read the etag first: if the incident is written in
+                # between, the etag is stale rather than the incident, so
+                # clients will fetch the incident again.
+                try:
+                    etag = storage.etag_for_incident_with_number(number)
+                    incident = storage.read_incident_with_number(number)
+                except NoSuchIncidentError:
+                    incident = etag = None
+                incidents.append((number, etag, incident))
+            return incidents
+
+        return self.run(read)
+
+
+    def write_incident(self, incident):
+        return self.run(lambda storage: storage.write_incident(incident))
+
+
+    def update_incident(self, number, edit, etags=None):
+        """
+        See L{ims.store.Storage.update_incident}.  C{edit} is called in the
+        thread pool.
+        """
+        return self.run(
+            lambda storage: storage.update_incident(number, edit, etags)
+        )
+
+
+    def changes_since(self, sequence):
+        return self.run(lambda storage: storage.changes_since(sequence))
+
+
+    def subscribe(self, subscriber):
+        """
+        See L{ims.store.ReadOnlyStorage.subscribe}.  C{subscriber} is called
+        in the reactor thread.
+        """
+        if self.max_threads:
+            def notify(*args):
+                self._reactor.callFromThread(subscriber, *args)
+        else:
+            notify = subscriber
+
+        self._subscribers[subscriber] = notify
+        self.storage.subscribe(notify)
+
+
+    def unsubscribe(self, subscriber):
+        self.storage.unsubscribe(self._subscribers.pop(subscriber))
+
+
+    def next_incident_number(self):
+        return self.run(lambda storage: storage.next_incident_number())
@@ -0,0 +1,464 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Compact binary incident encoding
+
+An encoded incident is L{binary_magic} followed by a sequence of fields.
+Each field is a one-byte tag (see L{BinaryTag}), the length of its payload
+as a 32-bit unsigned integer, and the payload.  Fields with unknown tags are
+skipped; fields that are absent are C{None}.  Integers are little-endian,
+strings are UTF-8 with a 32-bit length prefix and timestamps are whole
+seconds since the epoch (in UTC) as 64-bit signed integers.
+
+Report entries are stored in a single field: a 32-bit count, then for each
+entry its created time, a flags byte, and the lengths of its author and
+text, followed by the author and text themselves.
+"""
+
+__all__ = [
+    "binary_magic",
+    "data_formats",
+    "BinaryTag",
+    "is_binary",
+    "incident_to_binary",
+    "incident_from_binary",
+    "incident_to_data",
+    "incident_from_data",
+]
+
+from datetime import datetime as DateTime
+from struct import Struct, error as StructError
+
+from twisted.python.constants import Values, ValueConstant
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.data import InvalidDataError
+
+
+
+# JSON text never starts with a NUL byte.
+binary_magic = b"\x00IMS\x01"
+
+# Names of the formats incidents can be stored in.
+data_formats = ("json", "binary")
+
+_epoch = DateTime(1970, 1, 1)
+
+# Timestamp recorded for a report entry with no created time.
+_no_time = -(2 ** 63)
+
+# Report entry flags
+_system_entry = 0x01
+_no_author = 0x02
+_no_text = 0x04
+
+_field_header = Struct("<BI")
+_integer = Struct("<q")
+_length = Struct("<I")
+_entry_header = Struct("<qBII")
+
+
+
+class BinaryTag(Values):
+    """
+    Field tags
+    """
+    number           = ValueConstant(1)
+    priority         = ValueConstant(2)
+    summary          = ValueConstant(3)
+    location_name    = ValueConstant(4)
+    location_address = ValueConstant(5)
+    ranger_handles   = ValueConstant(6)
+    incident_types   = ValueConstant(7)
+    created          = ValueConstant(8)
+    dispatched       = ValueConstant(9)
+    on_scene         = ValueConstant(10)
+    closed           = ValueConstant(11)
+    report_entries   = ValueConstant(12)
+
+
+
+def is_binary(data):
+    """
+    Determine whether stored incident data is in the binary format.
+
+    @param data: Stored incident data.
+    @type data: L{bytes}
+
+    @return: C{True} if C{data} is in the binary format, C{False} if it is
+        (presumably) JSON text.
+    @rtype: L{bool}
+    """
+    return data.startswith(binary_magic)
+
+
+def incident_to_binary(incident):
+    """
+    Encode an incident in the binary format.
+
+    @param incident: An incident.
+    @type incident: L{Incident}
+
+    @return: The encoded incident.
+    @rtype: L{bytes}
+    """
+    chunks = [binary_magic]
+
+    def add(tag, payload):
+        chunks.append(_field_header.pack(tag.value, len(payload)))
+        chunks.append(payload)
+
+    add(BinaryTag.number, _integer.pack(incident.number))
+    add(BinaryTag.priority, _integer.pack(incident.priority))
+
+    for tag, text in (
+        (BinaryTag.summary, incident.summary),
+        (BinaryTag.location_name, incident.location.name),
+        (BinaryTag.location_address, incident.location.address),
+    ):
+        if text is not None:
+            add(tag, text.encode("utf-8"))
+
+    add(
+        BinaryTag.ranger_handles,
+        _encode_strings(ranger.handle for ranger in incident.rangers),
+    )
+    add(BinaryTag.incident_types, _encode_strings(incident.incident_types))
+
+    for tag, date_time in (
+        (BinaryTag.created, incident.created),
+        (BinaryTag.dispatched, incident.dispatched),
+        (BinaryTag.on_scene, incident.on_scene),
+        (BinaryTag.closed, incident.closed),
+    ):
+        if date_time is not None:
+            add(tag, _integer.pack(_encode_time(date_time)))
+
+    add(
+        BinaryTag.report_entries,
+        _encode_report_entries(incident.report_entries),
+    )
+
+    return b"".join(chunks)
+
+
+def incident_from_binary(data, number=None, validate=True, lazy=False):
+    """
+    Decode an incident in the binary format.
+
+    @param data: An incident encoded with L{incident_to_binary}.
+    @type data: L{bytes}
+
+    @param number: The number of the incident.
+        If C{data} includes an incident number that is different than
+        C{number}, raise an L{InvalidDataError}.
+    @type number: L{int}
+
+    @param validate: If true, raise L{InvalidDataError} is the data does
+        not validate as a fully-well-formed incident.
+    @type validate: L{bool}
+
+    @param lazy: If true, defer decoding the incident's report entries
+        until they are first accessed.  When C{validate} is also true, the
+        report entries are validated then, rather than now.
+    @type lazy: L{bool}
+
+    @return: The decoded incident.
+    @rtype: L{Incident}
+    """
+    if number is None:
+        raise TypeError("Incident number may not be null")
+    else:
+        number = int(number)
+
+    if not is_binary(data):
+        raise InvalidDataError("Incident data is not in the binary format")
+
+    fields = {}
+    offset = len(binary_magic)
+    end = len(data)
+
+    try:
+        while offset < end:
+            tag, length = _field_header.unpack_from(data, offset)
+            offset += _field_header.size
+            if offset + length > end:
+                raise InvalidDataError("Incident data is truncated")
+            fields[tag] = data[offset:offset + length]
+            offset += length
+
+        def integer(tag):
+            payload = fields.get(tag.value, None)
+            if payload is None:
+                return None
+            return _integer.unpack(payload)[0]
+
+        def text(tag):
+            payload = fields.get(tag.value, None)
+            if payload is None:
+                return None
+            return payload.decode("utf-8")
+
+        def strings(tag):
+            payload = fields.get(tag.value, None)
+            if payload is None:
+                return None
+            return _decode_strings(payload)
+
+        def time(tag):
+            payload = fields.get(tag.value, None)
+            if payload is None:
+                return None
+            return _decode_time(_integer.unpack(payload)[0])
+
+        binary_number = integer(BinaryTag.number)
+
+        if binary_number is not None and binary_number != number:
+            raise InvalidDataError(
+                "Incident number may not be modified: {0} != {1}"
+                .format(binary_number, number)
+            )
+
+        ranger_handles = strings(BinaryTag.ranger_handles)
+        if ranger_handles is None:
+            rangers = None
+        else:
+            rangers = [
+                Ranger(handle, None, None)
+                for handle in ranger_handles
+            ]
+
+        report_entries_data = fields.get(BinaryTag.report_entries.value, b"")
+
+        if lazy:
+            report_entries = ()
+        else:
+            report_entries = report_entries_from_binary(
+                report_entries_data, validate
+            )
+
+        incident = Incident(
+            number=number,
+            priority=integer(BinaryTag.priority),
+            summary=text(BinaryTag.summary),
+            location=Location(
+                name=text(BinaryTag.location_name),
+                address=text(BinaryTag.location_address),
+            ),
+            rangers=rangers,
+            incident_types=strings(BinaryTag.incident_types),
+            report_entries=report_entries,
+            created=time(BinaryTag.created),
+            dispatched=time(BinaryTag.dispatched),
+            on_scene=time(BinaryTag.on_scene),
+            closed=time(BinaryTag.closed),
+        )
+    except InvalidDataError:
+        raise
+    except (StructError, ValueError, OverflowError) as e:
+        raise InvalidDataError("Invalid binary incident data: {0}".format(e))
+
+    if lazy:
+        incident._lazy_report_entries = (
+            report_entries_from_binary, report_entries_data, validate
+        )
+
+    # Report entries are validated as they are created.
+    if validate:
+        incident._validate_fields()
+
+    return incident
+
+
+def incident_to_data(incident, data_format):
+    """
+    Encode an incident for storage.
+
+    @param incident: An incident.
+    @type incident: L{Incident}
+
+    @param data_format: The format to encode C{incident} in; one of
+        L{data_formats}.
+    @type data_format: L{str}
+
+    @return: The encoded incident.
+    @rtype: L{bytes}
+    """
+    if data_format == "binary":
+        return incident_to_binary(incident)
+    elif data_format == "json":
+        return incident.to_json_data()
+    else:
+        raise ValueError("Unknown data format: {0!r}".format(data_format))
+
+
+def incident_from_data(data, number=None, validate=True, lazy=False):
+    """
+    Decode a stored incident, which may be in either the binary format or
+    JSON text.  Arguments are as for L{incident_from_binary}.
+
+    @return: The decoded incident.
+    @rtype: L{Incident}
+    """
+    if is_binary(data):
+        return incident_from_binary(data, number, validate, lazy)
+    else:
+        return Incident.from_json_text(data, number, validate, lazy)
+
+
+def report_entries_from_binary(data, validate=False):
+    """
+    Decode the report entries field of an incident in the binary format.
+
+    @param data: The encoded report entries.
+    @type data: L{bytes}
+
+    @param validate: If true, validate each report entry as it is created.
+    @type validate: L{bool}
+
+    @return: The report entries.
+    @rtype: L{list} of L{ReportEntry}
+    """
+    if not data:
+        return []
+
+    report_entries = []
+
+    try:
+        count = _length.unpack_from(data)[0]
+        offset = _length.size
+
+        for _ in xrange(count):
+            created, flags, author_length, text_length = (
+                _entry_header.unpack_from(data, offset)
+            )
+            offset += _entry_header.size
+
+            if flags & _no_author:
+                author = None
+            else:
+                author = data[offset:offset + author_length].decode("utf-8")
+            offset += author_length
+
+            if flags & _no_text:
+                text = None
+            else:
+                text = data[offset:offset + text_length].decode("utf-8")
+            offset += text_length
+
+            if created == _no_time:
+                created = None
+            else:
+                created = _decode_time(created)
+
+            report_entry = ReportEntry(
+                author=author,
+                text=text,
+                created=created,
+                system_entry=flags & _system_entry,
+            )
+
+            # Validate each entry as it is created, rather than walking the
+            # entries again afterwards.
+            if validate:
+                report_entry.validate()
+
+            report_entries.append(report_entry)
+    except InvalidDataError:
+        raise
+    except (StructError, ValueError, OverflowError) as e:
+        raise InvalidDataError(
+            "Invalid binary report entry data: {0}".format(e)
+        )
+
+    if offset > len(data):
+        raise InvalidDataError("Report entry data is truncated")
+
+    return report_entries
+
+
+def _encode_report_entries(report_entries):
+    chunks = [_length.pack(len(report_entries))]
+
+    for entry in report_entries:
+        flags = 0
+
+        if entry.system_entry:
+            flags |= _system_entry
+
+        if entry.author is None:
+            flags |= _no_author
+            author = b""
+        else:
+            author = entry.author.encode("utf-8")
+
+        if entry.text is None:
+            flags |= _no_text
+            text = b""
+        else:
+            text = entry.text.encode("utf-8")
+
+        if entry.created is None:
+            created = _no_time
+        else:
+            created = _encode_time(entry.created)
+
+        chunks.append(
+            _entry_header.pack(created, flags, len(author), len(text))
+        )
+        chunks.append(author)
+        chunks.append(text)
+
+    return b"".join(chunks)
+
+
+def _encode_strings(strings):
+    chunks = []
+
+    if strings is not None:
+        for string in strings:
+            data = string.encode("utf-8")
+            chunks.append(_length.pack(len(data)))
+            chunks.append(data)
+
+    return b"".join(chunks)
+
+
+def _decode_strings(data):
+    strings = []
+    offset = 0
+    end = len(data)
+
+    while offset < end:
+        length = _length.unpack_from(data, offset)[0]
+        offset += _length.size
+        if offset + length > end:
+            raise InvalidDataError("String data is truncated")
+        strings.append(data[offset:offset + length].decode("utf-8"))
+        offset += length
+
+    return strings
+
+
+def _encode_time(date_time):
+    # Like the JSON encoding, this drops microseconds.
+    delta = date_time - _epoch
+    return delta.days * 86400 + delta.seconds
+
+
+def _decode_time(seconds):
+    return DateTime.utcfromtimestamp(seconds)
@@ -23,6 +23,7 @@ __all__ = [
 ]
 
 import os.path
+from hashlib import sha1 as etag_hash
 from re import compile as regex_compile
 
 from ConfigParser import SafeConfigParser, NoSectionError, NoOptionError
@@ -31,8 +32,21 @@ from twisted.python import log
 from twisted.python.filepath import FilePath
 
 from ims.data import to_json_text, IncidentType
+from ims.binary import data_formats
 from ims.dms import DutyManagementSystem
 from ims.store import Storage, ReadOnlyStorage
+from ims.asyncstore import AsyncStorage
+from ims.logstore import LogStorage, ReadOnlyLogStorage
+from ims.sqlstore import SQLiteStorage, ReadOnlySQLiteStorage
+
+
+
+# Storage backend name -> (read-only class, writable class)
+storageBackends = {
+    "files": (ReadOnlyStorage, Storage),
+    "log": (ReadOnlyLogStorage, LogStorage),
+    "sqlite": (ReadOnlySQLiteStorage, SQLiteStorage),
+}
 
 
 
@@ -51,6 +65,11 @@ class Configuration (object):
             "Core.Resources: {Resources}\n"
             "Core.RejectClients: {RejectClients}\n"
             "Core.ReadOnly: {ReadOnly}\n"
+            "Core.CacheSize: {CacheSize}\n"
+            "Core.StorageBackend: {StorageBackend}\n"
+            "Core.GroupCommitWindow: {GroupCommitWindow}\n"
+            "Core.DataFormat: {DataFormat}\n"
+            "Core.StorageThreads: {StorageThreads}\n"
             "\n"
             "DMS.Hostname: {DMSHost}\n"
             "DMS.Database: {DMSDatabase}\n"
@@ -145,6 +164,47 @@ class Configuration (object):
             valueFromConfig("Core", "ReadOnly", "false") == "true"
         )
 
+        cacheSize = valueFromConfig("Core", "CacheSize", "4096")
+        try:
+            self.CacheSize = int(cacheSize)
+        except ValueError:
+            log.msg("Invalid CacheSize: {0!r}".format(cacheSize))
+            self.CacheSize = 0
+        log.msg("CacheSize: {0}".format(self.CacheSize))
+
+        self.StorageBackend = valueFromConfig(
+            "Core", "StorageBackend", "files"
+        )
+        log.msg("StorageBackend: {0}".format(self.StorageBackend))
+
+        groupCommitWindow = valueFromConfig("Core", "GroupCommitWindow", None)
+        if groupCommitWindow is None:
+            self.GroupCommitWindow = None
+        else:
+            try:
+                self.GroupCommitWindow = float(groupCommitWindow) / 1000
+            except ValueError:
+                log.msg(
+                    "Invalid GroupCommitWindow: {0!r}"
+                    .format(groupCommitWindow)
+                )
+                self.GroupCommitWindow = None
+        log.msg("GroupCommitWindow: {0}".format(self.GroupCommitWindow))
+
+        self.DataFormat = valueFromConfig("Core", "DataFormat", "json")
+        if self.DataFormat not in data_formats:
+            log.msg("Invalid DataFormat: {0!r}".format(self.DataFormat))
+            self.DataFormat = "json"
+        log.msg("DataFormat: {0}".format(self.DataFormat))
+
+        storageThreads = valueFromConfig("Core", "StorageThreads", "4")
+        try:
+            self.StorageThreads = int(storageThreads)
+        except ValueError:
+            log.msg("Invalid StorageThreads: {0!r}".format(storageThreads))
+            self.StorageThreads = 0
+        log.msg("StorageThreads: {0}".format(self.StorageThreads))
+
         self.DMSHost     = valueFromConfig("DMS", "Hostname", None)
         self.DMSDatabase = valueFromConfig("DMS", "Database", None)
         self.DMSUsername = valueFromConfig("DMS", "Username", None)
@@ -185,13 +245,32 @@ class Configuration (object):
             password=self.DMSPassword,
         )
 
+        try:
+            storageClasses = storageBackends[self.StorageBackend]
+        except KeyError:
+            raise ValueError(
+                "Unknown storage backend: {0!r}".format(self.StorageBackend)
+            )
+
         if self.ReadOnly:
-            storageClass = ReadOnlyStorage
+            storageClass = storageClasses[0]
         else:
-            storageClass = Storage
+            storageClass = storageClasses[1]
+
+        storageOptions = dict(cache_size=self.CacheSize)
+        if storageClass is Storage:
+            storageOptions["group_commit"] = self.GroupCommitWindow
+        if storageClass in (Storage, LogStorage):
+            storageOptions["data_format"] = self.DataFormat
 
-        storage = storageClass(self.DataRoot)
+        storage = storageClass(self.DataRoot, **storageOptions)
         storage.provision()
         self.storage = storage
+        self.async_storage = AsyncStorage(
+            storage, max_threads=self.StorageThreads
+        )
 
         self.IncidentTypesJSON = to_json_text(self.IncidentTypes)
+        self.IncidentTypesETag = etag_hash(
+            self.IncidentTypesJSON.encode("utf-8")
+        ).hexdigest()
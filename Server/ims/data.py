@@ -27,18 +27,43 @@ __all__ = [
     "Ranger",
     "Location",
     # "Shift",
+    "IncidentChanges",
+    "diff_incidents",
+    "parse_rfc3339",
+    "render_rfc3339",
+    "JSONCodec",
+    "json_codecs",
     "to_json_text",
+    "to_json_data",
     "from_json_io",
     "from_json_text",
 ]
 
+import json
 from datetime import datetime as DateTime  # , timedelta as TimeDelta
-from json import dumps, load as from_json_io, loads as from_json_text
+from threading import Lock
 
 from twisted.python.constants import Values, ValueConstant
 
 rfc3339_date_time_format = "%Y-%m-%dT%H:%M:%SZ"
 
+# Parsed and rendered timestamps are cached; the caches are emptied when
+# they reach this size.
+rfc3339_cache_size = 4096
+
+_parsed_rfc3339 = {}
+_rendered_rfc3339 = {}
+
+# Ranger handles, incident types and report entry authors come from small
+# vocabularies, so incidents share one copy of each.  The table stops growing
+# when it reaches this size.
+intern_table_size = 65536
+
+_interned_text = {}
+
+# Guards creation of lazy report entries, which may happen in any thread.
+_materialize_lock = Lock()
+
 
 
 class JSON(Values):
@@ -79,6 +104,18 @@ class JSON(Values):
         return cls._states
 
 
+    @classmethod
+    def incident_attributes(cls):
+        """
+        List the constants that name incident attributes, as opposed to
+        report entry or Ranger attributes.
+
+        @return: All incident attribute names.
+        @rtype: L{frozenset} of L{ValueConstant}
+        """
+        return _incident_attributes
+
+
     @classmethod
     def cmpStates(cls, a, b):
         """
@@ -120,6 +157,36 @@ class JSON(Values):
 
 
 
+# Incident attributes that L{diff_incidents} compares by value, in the order
+# their changes are described.
+_diff_value_keys = (
+    JSON.priority,
+    JSON.summary,
+    JSON.location_name,
+    JSON.location_address,
+    JSON.created,
+    JSON.dispatched,
+    JSON.on_scene,
+    JSON.closed,
+)
+
+_diff_keys = frozenset(
+    _diff_value_keys +
+    (JSON.ranger_handles, JSON.incident_types, JSON.report_entries)
+)
+
+# Report entries have a fixed shape; see ReportEntry.to_json_data.
+_report_entry_json_format = (
+    '{{"{0}":%s,"{1}":%s,"{2}":%s,"{3}":%s}}'.format(
+        JSON.author.value,
+        JSON.text.value,
+        JSON.created.value,
+        JSON.system_entry.value,
+    )
+)
+
+
+
 class IncidentType(Values):
     """
     Non-exhautive set of constants for incident types; only incident types
@@ -142,8 +209,25 @@ class Incident(object):
     Incident
     """
 
+    __slots__ = (
+        "number",
+        "rangers",
+        "location",
+        "incident_types",
+        "summary",
+        "_report_entries",
+        "_lazy_report_entries",
+        "created",
+        "dispatched",
+        "on_scene",
+        "closed",
+        "priority",
+        "_json_cache",
+    )
+
+
     @classmethod
-    def from_json_text(cls, text, number=None, validate=True):
+    def from_json_text(cls, text, number=None, validate=True, lazy=False):
         """
         Create an incident from JSON text.
 
@@ -158,13 +242,18 @@ class Incident(object):
         @param validate: If true, raise L{InvalidDataError} is the data does
             not validate as a fully-well-formed incident.
         @type validate: L{bool}
+
+        @param lazy: If true, defer creating the incident's report entries
+            until they are first accessed.  When C{validate} is also true, the
+            report entries are validated then, rather than now.
+        @type lazy: L{bool}
         """
         root = from_json_text(text)
-        return cls.from_json(root, number, validate)
+        return cls.from_json(root, number, validate, lazy)
 
 
     @classmethod
-    def from_json_io(cls, io, number=None, validate=True):
+    def from_json_io(cls, io, number=None, validate=True, lazy=False):
         """
         Create an incident from a file.
 
@@ -180,13 +269,18 @@ class Incident(object):
         @param validate: If true, raise L{InvalidDataError} is the data does
             not validate as a fully-well-formed incident.
         @type validate: L{bool}
+
+        @param lazy: If true, defer creating the incident's report entries
+            until they are first accessed.  When C{validate} is also true, the
+            report entries are validated then, rather than now.
+        @type lazy: L{bool}
         """
         root = from_json_io(io)
-        return cls.from_json(root, number, validate)
+        return cls.from_json(root, number, validate, lazy)
 
 
     @classmethod
-    def from_json(cls, root, number=None, validate=True):
+    def from_json(cls, root, number=None, validate=True, lazy=False):
         """
         Create an incident from a JSON object graph.
 
@@ -201,6 +295,11 @@ class Incident(object):
         @param validate: If true, raise L{InvalidDataError} is the data does
             not validate as a fully-well-formed incident.
         @type validate: L{bool}
+
+        @param lazy: If true, defer creating the incident's report entries
+            until they are first accessed.  When C{validate} is also true, the
+            report entries are validated then, rather than now.
+        @type lazy: L{bool}
         """
         if number is None:
             raise TypeError("Incident number may not be null")
@@ -221,12 +320,6 @@ class Incident(object):
         if type(root) is not dict:
             raise InvalidDataError("JSON incident must be a dict")
 
-        def parse_date(rfc3339):
-            if not rfc3339:
-                return None
-            else:
-                return DateTime.strptime(rfc3339, rfc3339_date_time_format)
-
         location = Location(
             name=root.get(JSON.location_name.value, None),
             address=root.get(JSON.location_address.value, None),
@@ -241,15 +334,14 @@ class Incident(object):
                 for handle in ranger_handles
             ]
 
-        report_entries = [
-            ReportEntry(
-                author=entry.get(JSON.author.value, u"<unknown>"),
-                text=entry.get(JSON.text.value, None),
-                created=parse_date(entry.get(JSON.created.value, None)),
-                system_entry=entry.get(JSON.system_entry.value, False),
+        report_entries_json = root.get(JSON.report_entries.value, ())
+
+        if lazy:
+            report_entries = ()
+        else:
+            report_entries = report_entries_from_json(
+                report_entries_json, validate
             )
-            for entry in root.get(JSON.report_entries.value, ())
-        ]
 
         incident = cls(
             number=number,
@@ -265,8 +357,14 @@ class Incident(object):
             closed=parse_date(root.get(JSON.closed.value, None)),
         )
 
+        if lazy:
+            incident._lazy_report_entries = (
+                report_entries_from_json, report_entries_json, validate
+            )
+
+        # Report entries are validated as they are created.
         if validate:
-            incident.validate()
+            incident._validate_fields()
 
         return incident
 
@@ -332,7 +430,7 @@ class Incident(object):
             rangers = list(rangers)
 
         if incident_types is not None:
-            incident_types = list(incident_types)
+            incident_types = [intern_text(t) for t in incident_types]
 
         if report_entries is not None:
             report_entries = list(report_entries)
@@ -352,6 +450,80 @@ class Incident(object):
         self.closed         = closed
         self.priority       = priority
 
+        self._json_cache = None
+
+
+    @property
+    def report_entries(self):
+        """
+        The report entries associated with the incident.  If the incident was
+        created lazily, they are created (and validated, if requested) on
+        first access.
+
+        @rtype: L{list} of L{ReportEntry}
+        """
+        if self._lazy_report_entries is not None:
+            self._materialize_report_entries()
+        return self._report_entries
+
+
+    @report_entries.setter
+    def report_entries(self, report_entries):
+        self._report_entries = report_entries
+        self._lazy_report_entries = None
+
+
+    def _materialize_report_entries(self):
+        with _materialize_lock:
+            if self._lazy_report_entries is None:
+                return
+
+            load, report_entries_data, validate = self._lazy_report_entries
+
+            report_entries = load(report_entries_data, validate)
+
+            self._report_entries = report_entries
+            self._lazy_report_entries = None
+
+
+    def copy(self):
+        """
+        Copy this incident, so that the copy can be changed without changing
+        this incident.  Report entries, Rangers and strings are shared, since
+        editing an incident replaces them rather than changing them.
+
+        @return: A copy of this incident.
+        @rtype: L{Incident}
+        """
+        incident = Incident.__new__(Incident)
+
+        for name in self.__slots__:
+            if name not in ("_report_entries", "_lazy_report_entries"):
+                setattr(incident, name, getattr(self, name))
+
+        if self.rangers is not None:
+            incident.rangers = list(self.rangers)
+
+        if self.location is not None:
+            incident.location = Location(
+                self.location.name, self.location.address
+            )
+
+        if self.incident_types is not None:
+            incident.incident_types = list(self.incident_types)
+
+        # Read both at once, in case the report entries are being loaded.
+        # Lazily loaded report entries are loaded separately by the copy.
+        with _materialize_lock:
+            report_entries = self._report_entries
+            incident._lazy_report_entries = self._lazy_report_entries
+
+        if report_entries is not None:
+            report_entries = list(report_entries)
+        incident._report_entries = report_entries
+
+        return incident
+
 
     def __str__(self):
         return (
@@ -380,22 +552,17 @@ class Incident(object):
 
 
     def __hash__(self):
-        return hash((
-            self.number,
-            tuple(self.rangers),
-            self.location,
-            tuple(self.incident_types),
-            self.summary,
-            tuple(self.report_entries),
-            self.created,
-            self.dispatched,
-            self.on_scene,
-            self.closed,
-            self.priority,
-        ))
+        # Equal incidents have equal numbers, so the number alone is a valid
+        # hash.  Hashing the other fields would be expensive (the report
+        # entries in particular), and the result would be stale after an
+        # in-place change to the rangers, types or report entries lists.
+        return hash(self.number)
 
 
     def __eq__(self, other):
+        if other is self:
+            return True
+
         if isinstance(other, self.__class__):
             return (
                 self.number == other.number and
@@ -460,6 +627,25 @@ class Incident(object):
         """
         Validate this incident.
 
+        @raise: L{InvalidDataError} if the incident does not validate.
+        """
+        self._validate_fields()
+
+        # Lazy report entries that are to be validated when they are created
+        # are left alone.
+        lazy = self._lazy_report_entries
+        if lazy is None or not lazy[2]:
+            if self.report_entries is not None:
+                for report_entry in self.report_entries:
+                    report_entry.validate()
+
+        return self
+
+
+    def _validate_fields(self):
+        """
+        Validate everything in this incident but its report entries.
+
         @raise: L{InvalidDataError} if the incident does not validate.
         """
         if self.rangers is None:
@@ -488,10 +674,6 @@ class Incident(object):
                 .format(self.summary)
             )
 
-        if self.report_entries is not None:
-            for report_entry in self.report_entries:
-                report_entry.validate()
-
         if (
             self.created is not None and
             type(self.created) is not DateTime
@@ -540,8 +722,6 @@ class Incident(object):
                 .format(self.priority)
             )
 
-        return self
-
 
     def to_json_text(self):
         """
@@ -550,54 +730,166 @@ class Incident(object):
         @return: JSON text describing this incident.
         @rtype: L{unicode}
         """
+        return self.to_json_data().decode("utf-8")
 
-        root = {}
 
-        def render_date(date_time):
-            if not date_time:
-                return None
-            else:
-                return date_time.strftime(rfc3339_date_time_format)
+    def to_json_data(self):
+        """
+        Generate UTF-8 encoded JSON text from this incident.
+
+        The result is cached, and reused for as long as the incident's
+        fields are unchanged.  Report entries are only ever appended to an
+        incident (see L{diff_incidents}), so after entries are appended,
+        only the new entries are encoded and added to the cached JSON.
 
+        @return: UTF-8 encoded JSON text describing this incident.
+        @rtype: L{bytes}
+        """
         if self.incident_types is None:
             incident_types = ()
         else:
-            incident_types = self.incident_types
-
-        root[JSON.number.value] = self.number
-        root[JSON.priority.value] = self.priority
-        root[JSON.summary.value] = self.summary
-        root[JSON.location_name.value] = self.location.name
-        root[JSON.location_address.value] = self.location.address
-        root[JSON.incident_types.value] = incident_types
-
-        root[JSON.created.value] = render_date(self.created)
-        root[JSON.dispatched.value] = render_date(self.dispatched)
-        root[JSON.on_scene.value] = render_date(self.on_scene)
-        root[JSON.closed.value] = render_date(self.closed)
-
-        root[JSON.ranger_handles.value] = [
-            ranger.handle for ranger in self.rangers
-        ]
-
-        root[JSON.report_entries.value] = [
-            {
-                JSON.author.value: entry.author,
-                JSON.text.value: entry.text,
-                JSON.created.value: render_date(entry.created),
-                JSON.system_entry.value: entry.system_entry,
-            }
-            for entry in self.report_entries
-        ]
+            incident_types = tuple(self.incident_types)
 
-        try:
-            return to_json_text(root)
-        except TypeError:
-            raise AssertionError(
-                "{0!r}.to_json_text() generated unserializable data: {1!r}"
-                .format(self.__class__.__name__, root)
+        ranger_handles = tuple(ranger.handle for ranger in self.rangers)
+
+        key = (
+            self.number,
+            self.priority,
+            self.summary,
+            self.location.name,
+            self.location.address,
+            incident_types,
+            ranger_handles,
+            self.created,
+            self.dispatched,
+            self.on_scene,
+            self.closed,
+        )
+
+        report_entries = self.report_entries
+        count = len(report_entries)
+
+        # The cache holds the key, the number of report entries encoded and
+        # the last of them, which identifies the entries without comparing
+        # each one, and the JSON text.
+        cached = self._json_cache
+        if (
+            cached is not None and cached[0] == key and
+            cached[1] <= count and
+            (cached[1] == 0 or report_entries[cached[1] - 1] is cached[2])
+        ):
+            cached_count, data = cached[1], cached[3]
+            if cached_count == count:
+                return data
+
+            # Encode the appended report entries, and splice them in before
+            # the closing "]}".
+            new_entries = ",".join(
+                entry.to_json_data()
+                for entry in report_entries[cached_count:]
+            )
+            if cached_count:
+                new_entries = "," + new_entries
+            data = "{0}{1}]}}".format(data[:-2], new_entries)
+
+        else:
+            root = {}
+
+            root[JSON.number.value] = self.number
+            root[JSON.priority.value] = self.priority
+            root[JSON.summary.value] = self.summary
+            root[JSON.location_name.value] = self.location.name
+            root[JSON.location_address.value] = self.location.address
+            root[JSON.incident_types.value] = incident_types
+
+            root[JSON.created.value] = render_date(self.created)
+            root[JSON.dispatched.value] = render_date(self.dispatched)
+            root[JSON.on_scene.value] = render_date(self.on_scene)
+            root[JSON.closed.value] = render_date(self.closed)
+
+            root[JSON.ranger_handles.value] = ranger_handles
+
+            try:
+                data = to_json_data(root)
+            except TypeError:
+                raise AssertionError(
+                    "{0!r}.to_json_data() generated unserializable data: {1!r}"
+                    .format(self.__class__.__name__, root)
+                )
+
+            # Splice in the report entries, which have a fixed shape and are
+            # encoded separately.
+            data = '{0},"{1}":[{2}]}}'.format(
+                data[:-1], JSON.report_entries.value,
+                ",".join(entry.to_json_data() for entry in report_entries),
             )
 
+        if count:
+            last_entry = report_entries[-1]
+        else:
+            last_entry = None
+
+        self._json_cache = (key, count, last_entry, data)
+
+        return data
+
+
+    def to_json_fields(self, keys):
+        """
+        Describe some of this incident's attributes as a JSON object graph.
+
+        @param keys: The attributes to describe.
+        @type keys: iterable of L{JSON} constants
+
+        @return: A JSON object graph describing the attributes named by
+            C{keys}, as in L{to_json_data}.
+        @rtype: L{dict}
+
+        @raise: L{InvalidDataError} if a key is not an incident attribute.
+        """
+        root = {}
+
+        for key in keys:
+            try:
+                value = _incident_json_fields[key]
+            except KeyError:
+                raise InvalidDataError(
+                    "Not an incident attribute: {0}".format(key.value)
+                )
+            root[key.value] = value(self)
+
+        return root
+
+
+
+# Incident attribute -> function returning its JSON description
+_incident_json_fields = {
+    JSON.number: lambda incident: incident.number,
+    JSON.priority: lambda incident: incident.priority,
+    JSON.summary: lambda incident: incident.summary,
+    JSON.location_name: lambda incident: incident.location.name,
+    JSON.location_address: lambda incident: incident.location.address,
+    JSON.incident_types: lambda incident: list(incident.incident_types or ()),
+    JSON.ranger_handles: lambda incident: [
+        ranger.handle for ranger in incident.rangers
+    ],
+    JSON.report_entries: lambda incident: [
+        {
+            JSON.author.value: entry.author,
+            JSON.text.value: entry.text,
+            JSON.created.value: render_date(entry.created),
+            JSON.system_entry.value: entry.system_entry,
+        }
+        for entry in incident.report_entries
+    ],
+    JSON.created: lambda incident: render_date(incident.created),
+    JSON.dispatched: lambda incident: render_date(incident.dispatched),
+    JSON.on_scene: lambda incident: render_date(incident.on_scene),
+    JSON.closed: lambda incident: render_date(incident.closed),
+}
+
+_incident_attributes = frozenset(_incident_json_fields)
+
 
 
 class ReportEntry(object):
@@ -605,6 +897,15 @@ class ReportEntry(object):
     Report entry
     """
 
+    __slots__ = (
+        "author",
+        "text",
+        "created",
+        "system_entry",
+        "_validated",
+    )
+
+
     def __init__(self, author, text, created=None, system_entry=False):
         """
         @param author: The person who created/entered the entry.
@@ -623,11 +924,13 @@ class ReportEntry(object):
         if created is None:
             created = DateTime.utcnow()
 
-        self.author       = author
+        self.author       = intern_text(author)
         self.text         = text
         self.created      = created
         self.system_entry = bool(system_entry)
 
+        self._validated = None
+
 
     def __str__(self):
         if self.system_entry:
@@ -682,8 +985,21 @@ class ReportEntry(object):
         """
         Validate this report entry.
 
+        Validating an entry again is cheap if its attributes have not been
+        changed since it last validated.
+
         @raise: L{InvalidDataError} if the report entry does not validate.
         """
+        # Compare by identity, not equality, since u"x" == b"x".
+        validated = self._validated
+        if (
+            validated is not None and
+            validated[0] is self.author and
+            validated[1] is self.text and
+            validated[2] is self.created
+        ):
+            return
+
         if self.author is not None and type(self.author) is not unicode:
             raise InvalidDataError(
                 "Report entry author must be unicode, not {0!r}"
@@ -702,6 +1018,33 @@ class ReportEntry(object):
                 .format(self.created)
             )
 
+        self._validated = (self.author, self.text, self.created)
+
+
+    def to_json_data(self):
+        """
+        Generate UTF-8 encoded JSON text from this report entry.
+
+        @return: UTF-8 encoded JSON text describing this report entry.
+        @rtype: L{bytes}
+        """
+        # Report entries have a fixed shape, so format them directly rather
+        # than paying the encoder's per-call setup cost for each one.
+        try:
+            data = _report_entry_json_format % (
+                json_string(self.author),
+                json_string(self.text),
+                json_string(render_date(self.created)),
+                "true" if self.system_entry else "false",
+            )
+        except TypeError:
+            raise AssertionError(
+                "{0!r}.to_json_data() generated unserializable data: {1!r}"
+                .format(self.__class__.__name__, self)
+            )
+
+        return data
+
 
 
 class Ranger(object):
@@ -709,6 +1052,13 @@ class Ranger(object):
     Ranger
     """
 
+    __slots__ = (
+        "handle",
+        "name",
+        "status",
+    )
+
+
     def __init__(self, handle, name, status):
         """
         @param handle: The Ranger's handle.
@@ -724,7 +1074,7 @@ class Ranger(object):
         if not handle:
             raise InvalidDataError("Ranger handle required.")
 
-        self.handle = handle
+        self.handle = intern_text(handle)
         self.name   = name
         self.status = status
 
@@ -776,12 +1126,15 @@ class Ranger(object):
                 "Ranger handle must be unicode, not {0!r}".format(self.handle)
             )
 
-        if type(self.name) is not unicode:
+        # Incidents only refer to Rangers by handle, so name and status may
+        # be unknown.
+
+        if self.name is not None and type(self.name) is not unicode:
             raise InvalidDataError(
-                "Ranger name must be unicode, not {0!r}".format(self.handle)
+                "Ranger name must be unicode, not {0!r}".format(self.name)
             )
 
-        if type(self.status) is not unicode:
+        if self.status is not None and type(self.status) is not unicode:
             raise InvalidDataError(
                 "Ranger status must be unicode, not {0!r}".format(self.status)
             )
@@ -793,6 +1146,12 @@ class Location(object):
     Location
     """
 
+    __slots__ = (
+        "name",
+        "address",
+    )
+
+
     def __init__(self, name=None, address=None):
         """
         @param name: The location's name.
@@ -867,6 +1226,215 @@ class Location(object):
 
 
 
+class IncidentChanges(object):
+    """
+    Changes to an incident, as computed by L{diff_incidents}.
+    """
+
+    __slots__ = (
+        "number",
+        "values",
+        "rangers_added",
+        "rangers_removed",
+        "incident_types_added",
+        "incident_types_removed",
+        "report_entries",
+    )
+
+
+    def __init__(
+        self,
+        number,
+        values=(),
+        rangers_added=(), rangers_removed=(),
+        incident_types_added=(), incident_types_removed=(),
+        report_entries=(),
+    ):
+        """
+        @param number: The number of the changed incident.
+        @type number: L{int}
+
+        @param values: The changed attributes and their new values.
+        @type values: iterable of (L{JSON} constant, value) tuples
+
+        @param rangers_added: The Rangers added to the incident.
+        @type rangers_added: iterable of L{Ranger}
+
+        @param rangers_removed: The handles of the Rangers removed from the
+            incident.
+        @type rangers_removed: iterable of L{unicode}
+
+        @param incident_types_added: The incident types added to the
+            incident.
+        @type incident_types_added: iterable of L{unicode}
+
+        @param incident_types_removed: The incident types removed from the
+            incident.
+        @type incident_types_removed: iterable of L{unicode}
+
+        @param report_entries: The report entries added to the incident.
+        @type report_entries: iterable of L{ReportEntry}
+        """
+        self.number                 = number
+        self.values                 = list(values)
+        self.rangers_added          = list(rangers_added)
+        self.rangers_removed        = list(rangers_removed)
+        self.incident_types_added   = list(incident_types_added)
+        self.incident_types_removed = list(incident_types_removed)
+        self.report_entries         = list(report_entries)
+
+
+    def __repr__(self):
+        return (
+            "{self.__class__.__name__}("
+            "number={self.number!r},"
+            "values={self.values!r},"
+            "rangers_added={self.rangers_added!r},"
+            "rangers_removed={self.rangers_removed!r},"
+            "incident_types_added={self.incident_types_added!r},"
+            "incident_types_removed={self.incident_types_removed!r},"
+            "report_entries={self.report_entries!r})"
+            .format(self=self)
+        )
+
+
+    def __nonzero__(self):
+        return bool(
+            self.values or
+            self.rangers_added or self.rangers_removed or
+            self.incident_types_added or self.incident_types_removed or
+            self.report_entries
+        )
+
+
+    def system_message(self):
+        """
+        Describe these changes, other than added report entries, for a
+        system report entry.
+
+        @return: A description of the changes, or C{None} if there are none
+            to describe.
+        @rtype: L{unicode}
+        """
+        messages = []
+        state_changes = []
+
+        for key, value in self.values:
+            if key in JSON.states():
+                state_changes.append((key, value))
+            else:
+                if not value:
+                    value = u"<no value>"
+                messages.append(
+                    u"Changed {0} to: {1}".format(JSON.describe(key), value)
+                )
+
+        for key, added, removed in (
+            (
+                JSON.ranger_handles,
+                [ranger.handle for ranger in self.rangers_added],
+                self.rangers_removed,
+            ),
+            (
+                JSON.incident_types,
+                self.incident_types_added,
+                self.incident_types_removed,
+            ),
+        ):
+            if added:
+                messages.append(
+                    u"Added to {0}: {1}"
+                    .format(JSON.describe(key), u", ".join(added))
+                )
+            if removed:
+                messages.append(
+                    u"Removed from {0}: {1}"
+                    .format(JSON.describe(key), u", ".join(removed))
+                )
+
+        state = _changed_state(state_changes)
+        if state is not None:
+            messages.append(
+                u"State changed to: {0}".format(JSON.describe(state))
+            )
+
+        if messages:
+            return u"\n".join(messages)
+        else:
+            return None
+
+
+    def apply(self, incident, author=None):
+        """
+        Apply these changes to an incident, in place.
+
+        @param incident: The incident to change.
+        @type incident: L{Incident}
+
+        @param author: If not C{None}, add a system report entry by this
+            author with the L{system_message} for these changes, ahead of any
+            added report entries.
+        @type author: L{unicode}
+
+        @return: C{incident}
+        @rtype: L{Incident}
+        """
+        if incident.number != self.number:
+            raise InvalidDataError(
+                "Changes to incident {0} may not be applied to incident {1}"
+                .format(self.number, incident.number)
+            )
+
+        for key, value in self.values:
+            if key is JSON.location_name or key is JSON.location_address:
+                if incident.location is None:
+                    incident.location = Location()
+                if key is JSON.location_name:
+                    incident.location.name = value
+                else:
+                    incident.location.address = value
+            else:
+                setattr(incident, key.name, value)
+
+        if self.rangers_added or self.rangers_removed:
+            removed = self.rangers_removed
+            rangers = [
+                ranger for ranger in incident.rangers or ()
+                if ranger.handle not in removed
+            ]
+            rangers.extend(self.rangers_added)
+            incident.rangers = rangers
+
+        if self.incident_types_added or self.incident_types_removed:
+            removed = self.incident_types_removed
+            incident_types = [
+                incident_type
+                for incident_type in incident.incident_types or ()
+                if incident_type not in removed
+            ]
+            incident_types.extend(
+                intern_text(t) for t in self.incident_types_added
+            )
+            incident.incident_types = incident_types
+
+        if author is not None:
+            message = self.system_message()
+            if message is not None:
+                incident.report_entries.append(
+                    ReportEntry(
+                        author=author,
+                        text=message,
+                        system_entry=True,
+                    )
+                )
+
+        if self.report_entries:
+            incident.report_entries.extend(self.report_entries)
+
+        return incident
+
+
+
 # class Shift(object):
 #     @classmethod
 #     def from_datetime(cls, position, datetime):
@@ -981,6 +1549,365 @@ class Location(object):
 #         )
 
 
+
+class JSONCodec(object):
+    """
+    JSON encoder and decoder, backed by modules with the same API as the
+    standard library's L{json} module.  Encoded JSON is compact, with no
+    whitespace after separators, and ASCII-only.
+    """
+
+    def __init__(self, encoder_module, decoder_module=None, **encoder_options):
+        """
+        @param encoder_module: The module to use to encode JSON.
+        @type encoder_module: L{json} or a module with the same API
+
+        @param decoder_module: The module to use to decode JSON.  If C{None},
+            C{encoder_module} is used.
+        @type decoder_module: L{json} or a module with the same API
+
+        @param encoder_options: Additional keyword arguments for
+            C{encoder_module}'s C{JSONEncoder}.
+        """
+        if decoder_module is None:
+            decoder_module = encoder_module
+
+        if decoder_module is encoder_module:
+            self.name = encoder_module.__name__
+        else:
+            self.name = "{0}/{1}".format(
+                encoder_module.__name__, decoder_module.__name__
+            )
+
+        self.encode_string = encoder_module.encoder.encode_basestring_ascii
+
+        self._encoder = encoder_module.JSONEncoder(
+            separators=(",", ":"), **encoder_options
+        )
+        self._decoder = decoder_module.JSONDecoder()
+
+
+    def __repr__(self):
+        return "{self.__class__.__name__}({self.name})".format(self=self)
+
+
+    def encode(self, obj):
+        """
+        Convert an object into UTF-8 encoded JSON text.
+
+        @param obj: An object that is serializable to JSON.
+        @type obj: L{object}
+
+        @return: UTF-8 encoded JSON text.
+        @rtype: L{bytes}
+        """
+        return self._encoder.encode(obj)
+
+
+    def decode(self, text):
+        """
+        Convert JSON text into an object.
+
+        @param text: JSON text.
+        @type text: L{unicode} or UTF-8 encoded L{bytes}
+
+        @return: The object described by C{text}.
+        @rtype: L{object}
+        """
+        # Some decoders return strings in bytes input as bytes when they are
+        # ASCII-only; decoding the input first ensures that they are unicode.
+        if type(text) is bytes:
+            text = text.decode("utf-8")
+        return self._decoder.decode(text)
+
+
+
+def _available_json_codecs():
+    codecs = []
+
+    try:
+        import simplejson
+    except ImportError:
+        pass
+    else:
+        # simplejson decodes faster than the standard library, but the
+        # standard library's encoder is as fast or faster for our data.
+        codecs.append(JSONCodec(json, simplejson))
+
+        # Checking every tuple for namedtuple-ness is slow, and we don't
+        # serialize namedtuples.
+        codecs.append(JSONCodec(simplejson, namedtuple_as_object=False))
+
+    codecs.append(JSONCodec(json))
+
+    return codecs
+
+
+# Available JSON codecs, fastest first; the first is the one used.
+json_codecs = _available_json_codecs()
+json_codec = json_codecs[0]
+
+
+
+def parse_date(rfc3339):
+    if not rfc3339:
+        return None
+    else:
+        return parse_rfc3339(rfc3339)
+
+
+def intern_text(text):
+    """
+    Look up the shared copy of a string, adding it to the table of shared
+    strings if it is not already there (and the table is not full).
+
+    @param text: A string.
+    @type text: L{unicode}
+
+    @return: A string equal to C{text}.  If C{text} is not L{unicode}, it is
+        returned unchanged.
+    @rtype: L{unicode}
+    """
+    if type(text) is not unicode:
+        return text
+
+    try:
+        return _interned_text[text]
+    except KeyError:
+        if len(_interned_text) >= intern_table_size:
+            return text
+        return _interned_text.setdefault(text, text)
+
+
+def json_string(value):
+    if value is None:
+        return "null"
+    else:
+        return json_codec.encode_string(value)
+
+
+def render_date(date_time):
+    if not date_time:
+        return None
+    else:
+        return render_rfc3339(date_time)
+
+
+def report_entries_from_json(report_entries_json, validate=False):
+    report_entries = []
+
+    for entry in report_entries_json:
+        report_entry = ReportEntry(
+            author=entry.get(JSON.author.value, u"<unknown>"),
+            text=entry.get(JSON.text.value, None),
+            created=parse_date(entry.get(JSON.created.value, None)),
+            system_entry=entry.get(JSON.system_entry.value, False),
+        )
+
+        # Validate each entry as it is created, rather than walking the
+        # entries again afterwards.
+        if validate:
+            report_entry.validate()
+
+        report_entries.append(report_entry)
+
+    return report_entries
+
+
+def diff_incidents(old, new, keys=None):
+    """
+    Compute the changes that turn one version of an incident into another.
+
+    Rangers (by handle) and incident types are compared as sets, so changing
+    only their order is not a change.  Report entries are only ever added to
+    an incident, so the entries in C{new} beyond the number in C{old} are
+    the added ones.
+
+    @param old: The earlier version of the incident.
+    @type old: L{Incident}
+
+    @param new: The later version of the incident.
+    @type new: L{Incident}
+
+    @param keys: The attributes to compare.  If C{None}, all of them are
+        compared.
+    @type keys: iterable of L{JSON} constants
+
+    @return: The changes from C{old} to C{new}.
+    @rtype: L{IncidentChanges}
+    """
+    if keys is None:
+        keys = _diff_keys
+    elif type(keys) not in (set, frozenset):
+        keys = frozenset(keys)
+
+    changes = IncidentChanges(old.number)
+
+    for key in _diff_value_keys:
+        if key not in keys:
+            continue
+
+        if key is JSON.location_name or key is JSON.location_address:
+            attr_name = key.name[len("location_"):]
+            old_value = getattr(old.location, attr_name, None)
+            new_value = getattr(new.location, attr_name, None)
+        else:
+            old_value = getattr(old, key.name)
+            new_value = getattr(new, key.name)
+
+        if old_value != new_value:
+            changes.values.append((key, new_value))
+
+    if JSON.ranger_handles in keys:
+        old_handles = set(ranger.handle for ranger in old.rangers or ())
+        new_handles = set()
+
+        for ranger in new.rangers or ():
+            if ranger.handle in new_handles:
+                continue
+            new_handles.add(ranger.handle)
+            if ranger.handle not in old_handles:
+                changes.rangers_added.append(ranger)
+
+        for ranger in old.rangers or ():
+            if ranger.handle not in new_handles:
+                changes.rangers_removed.append(ranger.handle)
+
+    if JSON.incident_types in keys:
+        old_types = set(old.incident_types or ())
+        new_types = set()
+
+        for incident_type in new.incident_types or ():
+            if incident_type in new_types:
+                continue
+            new_types.add(incident_type)
+            if incident_type not in old_types:
+                changes.incident_types_added.append(incident_type)
+
+        for incident_type in old.incident_types or ():
+            if incident_type not in new_types:
+                changes.incident_types_removed.append(incident_type)
+
+    if JSON.report_entries in keys:
+        old_count = len(old.report_entries or ())
+        changes.report_entries.extend((new.report_entries or ())[old_count:])
+
+    return changes
+
+
+def _changed_state(state_changes):
+    """
+    Determine the state an incident is in after changes to its state times.
+
+    @param state_changes: The changed state times.
+    @type state_changes: iterable of (L{JSON} state constant, L{DateTime})
+        tuples
+
+    @return: The new state, or C{None} if the changes don't change the
+        state.
+    @rtype: L{JSON} state constant
+    """
+    highest_change = None
+    lowest_change = None
+
+    for state_changed, state_time in state_changes:
+        if state_time is None:
+            if (
+                lowest_change is None or
+                JSON.cmpStates(lowest_change, state_changed) > 0
+            ):
+                lowest_change = state_changed
+        else:
+            if (
+                highest_change is None or
+                JSON.cmpStates(highest_change, state_changed) < 0
+            ):
+                highest_change = state_changed
+
+    if highest_change is not None:
+        return highest_change
+
+    if lowest_change is not None:
+        # The state is the one before the lowest state that was unset.
+        last = None
+        for state in JSON.states():
+            if state == lowest_change:
+                break
+            last = state
+        return last
+
+    return None
+
+
+def parse_rfc3339(text):
+    """
+    Parse a timestamp in L{rfc3339_date_time_format}.
+
+    Timestamps in exactly that format are parsed directly, which is much
+    faster than L{DateTime.strptime}; anything else is handed to
+    L{DateTime.strptime}.
+
+    @param text: An RFC 3339 timestamp.
+    @type text: L{unicode} or L{bytes}
+
+    @return: The time described by C{text}.
+    @rtype: L{DateTime}
+
+    @raise: L{ValueError} if C{text} is not a valid timestamp.
+    """
+    try:
+        return _parsed_rfc3339[text]
+    except KeyError:
+        pass
+
+    if (
+        len(text) == 20 and
+        text[4] == "-" and text[7] == "-" and text[10] == "T" and
+        text[13] == ":" and text[16] == ":" and text[19] == "Z" and (
+            text[0:4] + text[5:7] + text[8:10] +
+            text[11:13] + text[14:16] + text[17:19]
+        ).isdigit()
+    ):
+        date_time = DateTime(
+            int(text[0:4]), int(text[5:7]), int(text[8:10]),
+            int(text[11:13]), int(text[14:16]), int(text[17:19]),
+        )
+    else:
+        date_time = DateTime.strptime(text, rfc3339_date_time_format)
+
+    if len(_parsed_rfc3339) >= rfc3339_cache_size:
+        _parsed_rfc3339.clear()
+    _parsed_rfc3339[text] = date_time
+
+    return date_time
+
+
+def render_rfc3339(date_time):
+    """
+    Render a timestamp in L{rfc3339_date_time_format}.
+
+    @param date_time: A time.
+    @type date_time: L{DateTime}
+
+    @return: An RFC 3339 timestamp.
+    @rtype: L{bytes}
+    """
+    try:
+        return _rendered_rfc3339[date_time]
+    except KeyError:
+        pass
+
+    # isoformat() is much faster than strftime(); drop any microseconds
+    # and time zone offset from its result.
+    text = date_time.isoformat()[:19] + "Z"
+
+    if len(_rendered_rfc3339) >= rfc3339_cache_size:
+        _rendered_rfc3339.clear()
+    _rendered_rfc3339[date_time] = text
+
+    return text
+
+
 def to_json_text(obj):
     """
     Convert an object into JSON text.
@@ -991,4 +1918,44 @@ def to_json_text(obj):
     @return: JSON text.
     @rtype: L{unicode}
     """
-    return dumps(obj, separators=(',', ':')).decode("UTF-8")
+    return to_json_data(obj).decode("UTF-8")
+
+
+def to_json_data(obj):
+    """
+    Convert an object into UTF-8 encoded JSON text.
+
+    @param obj: An object that is serializable to JSON.
+    @type obj: L{object}
+
+    @return: UTF-8 encoded JSON text.
+    @rtype: L{bytes}
+    """
+    return json_codec.encode(obj)
+
+
+def from_json_text(text):
+    """
+    Convert JSON text into an object.
+
+    @param text: JSON text.
+    @type text: L{unicode} or UTF-8 encoded L{bytes}
+
+    @return: The object described by C{text}.
+    @rtype: L{object}
+    """
+    return json_codec.decode(text)
+
+
+def from_json_io(io):
+    """
+    Read JSON text from a file and convert it into an object.
+
+    @param io: An open file containing JSON text.
+    @type io: A file-like object with a C{read} method that returns UTF-8
+        L{bytes}.
+
+    @return: The object described by the text read from C{io}.
+    @rtype: L{object}
+    """
+    return json_codec.decode(io.read())
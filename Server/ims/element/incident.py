@@ -29,12 +29,12 @@ from ims.element.base import BaseElement
 
 
 class IncidentElement(BaseElement):
-    def __init__(self, ims, number):
+    def __init__(self, ims, incident):
         BaseElement.__init__(
             self, ims, "incident",
-            "Incident #{0}".format(number)
+            "Incident #{0}".format(incident.number)
         )
-        self.incident = self.ims.storage.read_incident_with_number(number)
+        self.incident = incident
 
         for attr_name in (
             "number",
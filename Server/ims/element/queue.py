@@ -26,7 +26,6 @@ from twisted.web.template import renderer
 
 from ims.data import to_json_text
 from ims.element.base import BaseElement
-from ims.element.util import incidents_from_query
 from ims.element.util import show_closed_from_query
 from ims.element.util import terms_from_query
 from ims.element.util import since_days_ago_from_query
@@ -35,9 +34,11 @@ from ims.element.util import incidents_as_table
 
 
 class DispatchQueueElement(BaseElement):
-    def __init__(self, ims):
+    def __init__(self, ims, incidents):
         BaseElement.__init__(self, ims, "queue", "Dispatch Queue")
 
+        self.incidents = incidents
+
 
     @renderer
     def data(self, request, tag):
@@ -49,9 +50,7 @@ class DispatchQueueElement(BaseElement):
 
         data = []
 
-        for number, etag in incidents_from_query(self.ims, request):
-            incident = self.ims.storage.read_incident_with_number(number)
-
+        for incident in self.incidents:
             if incident.summary:
                 summary = incident.summary
             elif incident.report_entries:
@@ -81,10 +80,7 @@ class DispatchQueueElement(BaseElement):
     @renderer
     def queue(self, request, tag):
         return tag(incidents_as_table(
-            (
-                self.ims.storage.read_incident_with_number(number)
-                for number, etag in incidents_from_query(self.ims, request)
-            ),
+            self.incidents,
             caption="Dispatch Queue",
             id="dispatch_queue",
         ))
@@ -34,9 +34,11 @@ from ims.element.util import ignore_incident, ignore_entry
 
 
 class DailyReportElement(BaseElement):
-    def __init__(self, ims, template_name="report_daily"):
+    def __init__(self, ims, incidents, template_name="report_daily"):
         BaseElement.__init__(self, ims, template_name, "Daily Report")
 
+        self.incidents = incidents
+
 
     def _index_incidents(self, start_hour=19):
         # 19 == 12 adjusted for timezone from UTC
@@ -44,7 +46,6 @@ class DailyReportElement(BaseElement):
             not hasattr(self, "_incidents_by_date") or
             not hasattr(self, "_incidents_by_type")
         ):
-            storage = self.ims.storage
             incidents_by_date = {}
             incidents_by_type = {}
 
@@ -71,9 +72,7 @@ class DailyReportElement(BaseElement):
 
                 return dates
 
-            for number, etag in storage.list_incidents():
-                incident = storage.read_incident_with_number(number)
-
+            for incident in self.incidents:
                 if ignore_incident(incident):
                     continue
 
@@ -25,8 +25,6 @@ __all__ = [
 from twisted.python.constants import Names, NamedConstant
 from twisted.web.template import renderer, tags
 
-from ims.dms import DirtShift
-from ims.data import Shift
 from ims.element.base import BaseElement
 from ims.element.util import ignore_incident, ignore_entry
 from ims.element.util import num_shifts_from_query
@@ -43,19 +41,25 @@ class Activity(Names):
 
 
 class ShiftReportElement(BaseElement):
-    def __init__(self, ims, template_name="report_shift"):
+    def __init__(self, ims, incidents, template_name="report_shift"):
         BaseElement.__init__(self, ims, template_name, "Shift Summary")
 
+        self.incidents = incidents
+
 
     @property
     def incidents_by_shift(self):
+        # Shift and DirtShift are disabled (commented out) in ims.data and
+        # ims.dms, so import them here rather than at module level.  That
+        # way, the rest of the server (which imports this module) works
+        # without them.
+        from ims.dms import DirtShift
+        from ims.data import Shift
+
         if not hasattr(self, "_incidents_by_shift"):
-            storage = self.ims.storage
             incidents_by_shift = {}
 
-            for number, etag in storage.list_incidents():
-                incident = storage.read_incident_with_number(number)
-
+            for incident in self.incidents:
                 if ignore_incident(incident):
                     continue
 
@@ -28,14 +28,20 @@ __all__ = [
     "since_days_ago_from_query",
     "since_from_query",
     "num_shifts_from_query",
+    "cursor_from_query",
+    "limit_from_query",
+    "fields_from_query",
+    "numbers_from_query",
+    "sequence_from_query",
     "query_value",
 ]
 
 from datetime import datetime as DateTime, timedelta as TimeDelta
 
+from twisted.internet.defer import succeed
 from twisted.web.template import tags
 
-from ims.data import IncidentType
+from ims.data import IncidentType, JSON, InvalidDataError
 
 
 
@@ -56,17 +62,32 @@ def ignore_entry(entry):
 
 
 def incidents_from_query(ims, request):
-    if not hasattr(request, "ims_incidents"):
-        if request.args:
-            request.ims_incidents = ims.storage.search_incidents(
-                terms=terms_from_query(request),
-                show_closed=show_closed_from_query(request),
-                since=since_from_query(request),
-            )
-        else:
-            request.ims_incidents = ims.storage.list_incidents()
+    """
+    Look up the incidents matching a request's query.
+
+    @return: A deferred resulting in a L{list} of C{(number, etag)} tuples.
+    @rtype: L{Deferred}
+    """
+    if hasattr(request, "ims_incidents"):
+        return succeed(request.ims_incidents)
+
+    if request.args:
+        d = ims.storage.search_incidents(
+            terms=terms_from_query(request),
+            show_closed=show_closed_from_query(request),
+            since=since_from_query(request),
+            before=cursor_from_query(request),
+            limit=limit_from_query(request),
+        )
+    else:
+        d = ims.storage.search_incidents(show_closed=True)
+
+    def cache(incidents):
+        request.ims_incidents = incidents
+        return incidents
 
-    return request.ims_incidents
+    d.addCallback(cache)
+    return d
 
 
 def terms_from_query(request):
@@ -113,6 +134,132 @@ def num_shifts_from_query(request):
     return query_value(request, "num_shifts", "1")
 
 
+def cursor_from_query(request):
+    """
+    Get the cursor for a page of incidents from a request's query: the
+    page starts with the highest-numbered incident below the cursor.
+
+    @return: The cursor, or C{None} for the first page.
+    @rtype: L{int}
+
+    @raise: L{InvalidDataError} if the cursor is not a positive integer.
+    """
+    return _positive_int_from_query(request, "cursor")
+
+
+def limit_from_query(request):
+    """
+    Get the maximum number of incidents in a page from a request's query.
+
+    @return: The limit, or C{None} if there is no limit.
+    @rtype: L{int}
+
+    @raise: L{InvalidDataError} if the limit is not a positive integer.
+    """
+    return _positive_int_from_query(request, "limit")
+
+
+def fields_from_query(request):
+    """
+    Get the incident attributes to describe from a request's query, given
+    as a comma-separated list of JSON keys.
+
+    @return: The attributes, or C{None} if none were requested.
+    @rtype: L{list} of L{JSON} constants
+
+    @raise: L{InvalidDataError} if an attribute name is not the name of an
+        incident attribute.
+    """
+    names = query_value(request, "fields", "")
+    if not names:
+        return None
+
+    attributes = JSON.incident_attributes()
+    fields = []
+
+    for name in names.split(","):
+        try:
+            field = JSON.lookupByValue(name.strip())
+        except ValueError:
+            field = None
+
+        if field not in attributes:
+            raise InvalidDataError("Unknown field: {0}".format(name))
+
+        fields.append(field)
+
+    return fields
+
+
+def numbers_from_query(request):
+    """
+    Get the numbers of the incidents to fetch from a request's query, given
+    as one or more comma-separated lists of numbers.
+
+    @return: The incident numbers, without duplicates, in the order first
+        given, or C{None} if no numbers were given.
+    @rtype: L{list} of L{int}
+
+    @raise: L{InvalidDataError} if a number is invalid.
+    """
+    if not request.args or "numbers" not in request.args:
+        return None
+
+    numbers = []
+    seen = set()
+
+    for value in request.args["numbers"]:
+        for text in value.split(","):
+            if not text.strip():
+                continue
+            number = _positive_int(text)
+            if number is None:
+                raise InvalidDataError(
+                    "Invalid incident number: {0!r}".format(text)
+                )
+            if number not in seen:
+                seen.add(number)
+                numbers.append(number)
+
+    return numbers
+
+
+def sequence_from_query(request):
+    """
+    Get the point in the sequence of changes to storage to look for changes
+    after from a request's query (see
+    L{ims.store.ReadOnlyStorage.changes_since}).
+
+    @return: The sequence number, or C{None} if none was given.
+    @rtype: L{int}
+    """
+    return _positive_int(query_value(request, "since", ""))
+
+
+def _positive_int_from_query(request, key):
+    value = query_value(request, key, "")
+    if not value:
+        return None
+
+    number = _positive_int(value)
+    if number is None:
+        raise InvalidDataError("Invalid {0}: {1!r}".format(key, value))
+
+    return number
+
+
+def _positive_int(value):
+    try:
+        value = int(value)
+    except ValueError:
+        return None
+
+    if value < 1:
+        return None
+
+    return value
+
+
 def query_value(request, key, default, no_args_default=None):
     attr_name = "ims_qv_{0}".format(key)
 
@@ -0,0 +1,505 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+In-memory incident indexes
+"""
+
+__all__ = [
+    "search_strings_from_incident",
+    "state_from_incident",
+    "open_states",
+    "SearchIndex",
+    "AttributeIndex",
+    "TimeIndex",
+]
+
+from bisect import bisect_left, bisect_right, insort
+from itertools import chain
+
+
+
+def trigrams(string):
+    """
+    Find the trigrams in a string.
+
+    @param string: A string.
+    @type string: L{unicode}
+
+    @return: The distinct three-character substrings of C{string}.
+    @rtype: L{set} of L{unicode}
+    """
+    return set(string[i:i + 3] for i in xrange(len(string) - 2))
+
+
+
+def search_strings_from_incident(incident):
+    """
+    Find the strings in an incident that are matched by searches.
+
+    @param incident: An incident.
+    @type incident: L{Incident}
+
+    @return: The searchable strings in C{incident}.
+    @rtype: iterable of L{unicode}
+    """
+    yield incident.summary
+    yield incident.location.name
+    yield incident.location.address
+    for incident_type in incident.incident_types:
+        yield incident_type
+    for ranger in incident.rangers:
+        yield ranger.handle
+    for entry in incident.report_entries:
+        yield entry.text
+
+
+
+def state_from_incident(incident):
+    """
+    Determine the state of an incident.
+
+    @param incident: An incident.
+    @type incident: L{Incident}
+
+    @return: The name of the latest state the incident has reached:
+        C{"closed"}, C{"on_scene"}, C{"dispatched"} or C{"created"}.
+        Incidents with no state times are considered created.
+    @rtype: L{str}
+    """
+    if incident.closed is not None:
+        return "closed"
+    if incident.on_scene is not None:
+        return "on_scene"
+    if incident.dispatched is not None:
+        return "dispatched"
+    return "created"
+
+
+open_states = ("created", "dispatched", "on_scene")
+
+
+
+class SearchIndex(object):
+    """
+    Trigram index of the text in incidents.
+
+    A search term matches an incident if it is a case-insensitive substring
+    of any of the incident's searchable strings.  The index keeps a posting
+    set of incident numbers for each trigram, which is used to find candidate
+    incidents for a term; the candidates are then checked against the
+    (lower-cased) strings kept for each incident, so results are exactly
+    those of a brute force search.
+    """
+
+    def __init__(self):
+        self._strings = {}
+        self._postings = {}
+
+
+    def __len__(self):
+        return len(self._strings)
+
+
+    def __contains__(self, number):
+        return number in self._strings
+
+
+    def add(self, incident):
+        """
+        Add an incident to the index, replacing any prior version of it.
+
+        @param incident: An incident.
+        @type incident: L{Incident}
+        """
+        number = incident.number
+
+        self.remove(number)
+
+        strings = tuple(
+            string.lower()
+            for string in search_strings_from_incident(incident)
+            if string is not None
+        )
+        self._strings[number] = strings
+
+        postings = self._postings
+        for trigram in set(chain(*(trigrams(s) for s in strings))):
+            numbers = postings.get(trigram, None)
+            if numbers is None:
+                postings[trigram] = set((number,))
+            else:
+                numbers.add(number)
+
+
+    def remove(self, number):
+        """
+        Remove an incident from the index.
+
+        @param number: The number of an incident.
+        @type number: L{int}
+        """
+        strings = self._strings.pop(number, None)
+        if strings is None:
+            return
+
+        postings = self._postings
+        for trigram in set(chain(*(trigrams(s) for s in strings))):
+            numbers = postings.get(trigram, None)
+            if numbers is None:
+                continue
+            numbers.discard(number)
+            if not numbers:
+                del postings[trigram]
+
+
+    def _candidates(self, term):
+        """
+        Find the numbers of incidents which may match a (lower-cased) term.
+        """
+        term_trigrams = trigrams(term)
+
+        if not term_trigrams:
+            # Term is too short to have trigrams; everything is a candidate.
+            return self._strings.keys()
+
+        postings = self._postings
+        try:
+            sets = sorted(
+                (postings[trigram] for trigram in term_trigrams), key=len
+            )
+        except KeyError:
+            # Some trigram in the term isn't in any incident.
+            return ()
+
+        candidates = set(sets[0])
+        for numbers in sets[1:]:
+            candidates &= numbers
+            if not candidates:
+                break
+
+        return candidates
+
+
+    def search(self, term):
+        """
+        Find incidents matching a search term.
+
+        @param term: A search term.
+        @type term: L{unicode}
+
+        @return: The numbers of the incidents that match C{term}.
+        @rtype: L{set} of L{int}
+        """
+        if type(term) is bytes:
+            term = term.decode("utf-8")
+
+        term = term.lower()
+        strings = self._strings
+
+        return set(
+            number for number in self._candidates(term)
+            if any(term in string for string in strings[number])
+        )
+
+
+    def search_all(self, terms):
+        """
+        Find incidents matching all of the given search terms.
+
+        @param terms: Search terms.
+        @type terms: iterable of L{unicode}
+
+        @return: The numbers of the incidents that match all of C{terms}.
+        @rtype: L{set} of L{int}
+        """
+        numbers = None
+
+        for term in terms:
+            if numbers is None:
+                numbers = self.search(term)
+            else:
+                numbers &= self.search(term)
+
+            if not numbers:
+                break
+
+        if numbers is None:
+            numbers = set(self._strings)
+
+        return numbers
+
+
+
+class AttributeIndex(object):
+    """
+    Index of incident numbers by state, incident type, ranger handle and
+    priority.
+
+    For each indexed attribute value, the index keeps the set of numbers of
+    the incidents with that value, so that queries on several attributes are
+    answered by intersecting sets instead of reading incidents.
+    """
+
+    attributes = ("state", "incident_type", "ranger", "priority")
+
+
+    def __init__(self):
+        self._keys = {}
+        self._postings = {}
+
+
+    def __len__(self):
+        return len(self._keys)
+
+
+    def __contains__(self, number):
+        return number in self._keys
+
+
+    def _keys_from_incident(self, incident):
+        keys = set()
+
+        keys.add(("state", state_from_incident(incident)))
+        keys.add(("priority", incident.priority))
+        for incident_type in incident.incident_types or ():
+            keys.add(("incident_type", incident_type))
+        for ranger in incident.rangers or ():
+            keys.add(("ranger", ranger.handle))
+
+        return frozenset(keys)
+
+
+    def add(self, incident):
+        """
+        Add an incident to the index, replacing any prior version of it.
+
+        @param incident: An incident.
+        @type incident: L{Incident}
+        """
+        number = incident.number
+        keys = self._keys_from_incident(incident)
+
+        old_keys = self._keys.get(number, frozenset())
+        self._keys[number] = keys
+
+        postings = self._postings
+
+        for key in old_keys - keys:
+            numbers = postings[key]
+            numbers.discard(number)
+            if not numbers:
+                del postings[key]
+
+        for key in keys - old_keys:
+            numbers = postings.get(key, None)
+            if numbers is None:
+                postings[key] = set((number,))
+            else:
+                numbers.add(number)
+
+
+    def remove(self, number):
+        """
+        Remove an incident from the index.
+
+        @param number: The number of an incident.
+        @type number: L{int}
+        """
+        keys = self._keys.pop(number, None)
+        if keys is None:
+            return
+
+        postings = self._postings
+        for key in keys:
+            numbers = postings[key]
+            numbers.discard(number)
+            if not numbers:
+                del postings[key]
+
+
+    def _numbers(self, attribute, value):
+        if isinstance(value, (tuple, list, set, frozenset)):
+            numbers = set()
+            for v in value:
+                numbers |= self._postings.get((attribute, v), frozenset())
+            return numbers
+        else:
+            return self._postings.get((attribute, value), frozenset())
+
+
+    def query(self, **criteria):
+        """
+        Find incidents with the given attribute values.
+
+        For example, open Medical incidents assigned to Tool::
+
+            index.query(
+                state=open_states, incident_type=u"Medical", ranger=u"Tool"
+            )
+
+        @param criteria: A value to match for any of C{state},
+            C{incident_type}, C{ranger} (handle) and C{priority}.  A tuple,
+            list or set of values matches incidents with any of them.
+
+        @return: The numbers of the incidents matching all of C{criteria}.
+        @rtype: L{set} of L{int}
+        """
+        sets = []
+
+        for attribute, value in criteria.iteritems():
+            if attribute not in self.attributes:
+                raise TypeError(
+                    "Unknown attribute: {0!r}".format(attribute)
+                )
+            sets.append(self._numbers(attribute, value))
+
+        if not sets:
+            return set(self._keys)
+
+        sets.sort(key=len)
+
+        numbers = set(sets[0])
+        for other in sets[1:]:
+            if not numbers:
+                break
+            numbers &= other
+
+        return numbers
+
+
+
+class TimeIndex(object):
+    """
+    Index of incident numbers by time.
+
+    The index keeps a sorted list of C{(time, number, kind)} entries for the
+    created time of each report entry in an incident (kind C{"entry"}) and
+    each of the incident's state times (kinds C{"created"},
+    C{"dispatched"}, C{"on_scene"} and C{"closed"}), so that the incidents
+    with times in a range are found by bisecting the list.
+    """
+
+    kinds = ("entry", "created", "dispatched", "on_scene", "closed")
+
+
+    def __init__(self):
+        self._times = []
+        self._entries = {}
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def __contains__(self, number):
+        return number in self._entries
+
+
+    def _entries_from_incident(self, incident):
+        number = incident.number
+        entries = set()
+
+        for entry in incident.report_entries:
+            if entry.created is not None:
+                entries.add((entry.created, number, "entry"))
+
+        for kind in self.kinds[1:]:
+            time = getattr(incident, kind)
+            if time is not None:
+                entries.add((time, number, kind))
+
+        return entries
+
+
+    def add(self, incident):
+        """
+        Add an incident to the index, replacing any prior version of it.
+
+        @param incident: An incident.
+        @type incident: L{Incident}
+        """
+        number = incident.number
+        entries = self._entries_from_incident(incident)
+
+        old_entries = self._entries.get(number, frozenset())
+        self._entries[number] = frozenset(entries)
+
+        for entry in old_entries - entries:
+            self._remove_entry(entry)
+
+        for entry in entries - old_entries:
+            insort(self._times, entry)
+
+
+    def remove(self, number):
+        """
+        Remove an incident from the index.
+
+        @param number: The number of an incident.
+        @type number: L{int}
+        """
+        for entry in self._entries.pop(number, ()):
+            self._remove_entry(entry)
+
+
+    def _remove_entry(self, entry):
+        times = self._times
+        i = bisect_left(times, entry)
+        if i < len(times) and times[i] == entry:
+            del times[i]
+
+
+    def search(self, since=None, until=None, kinds=None):
+        """
+        Find incidents with times in a range.
+
+        @param since: The start of the range, inclusive, or C{None} for no
+            lower bound.
+        @type since: L{DateTime}
+
+        @param until: The end of the range, inclusive, or C{None} for no
+            upper bound.
+        @type until: L{DateTime}
+
+        @param kinds: The kinds of times to look at, or C{None} for all of
+            them.
+        @type kinds: iterable of L{str}
+
+        @return: The numbers of the incidents with a time of one of the given
+            kinds in the range.
+        @rtype: L{set} of L{int}
+        """
+        times = self._times
+
+        if since is None:
+            start = 0
+        else:
+            start = bisect_left(times, (since,))
+
+        if until is None:
+            end = len(times)
+        else:
+            end = bisect_right(times, (until, float("inf")))
+
+        if kinds is None:
+            return set(number for time, number, kind in times[start:end])
+
+        kinds = frozenset(kinds)
+        return set(
+            number for time, number, kind in times[start:end]
+            if kind in kinds
+        )
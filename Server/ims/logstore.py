@@ -0,0 +1,549 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Log-structured data store
+
+Incident versions are appended to a sequence of segment files.  Each record
+in a segment is a header (magic, incident number, data length and CRC-32 of
+the data) followed by the incident's JSON data.  An in-memory index maps
+each incident number to the location of its records; it is rebuilt at
+startup by replaying the segments in order, which also discards any record
+left incomplete by a crash.
+"""
+
+__all__ = [
+    "ReadOnlyLogStorage",
+    "LogStorage",
+]
+
+from hashlib import sha1 as etag_hash
+from os import fsync
+from struct import Struct
+from threading import RLock
+from zlib import crc32
+
+from twisted.python import log
+from twisted.internet.threads import deferToThread
+
+from ims.binary import data_formats, incident_from_data
+from ims.store import StorageError, NoSuchIncidentError
+from ims.store import ReadOnlyStorage, Storage, fsync_directory
+
+
+
+record_header = Struct(">4sIII")
+record_magic = b"IMSr"
+
+segment_prefix = "segment-"
+segment_suffix = ".log"
+
+
+
+class ReadOnlyLogStorage(ReadOnlyStorage):
+    """
+    Log-structured back-end storage
+    """
+
+    def __init__(self, path, cache_size=0):
+        ReadOnlyStorage.__init__(self, path, cache_size=cache_size)
+
+        self._lock = RLock()
+        self._versions = None
+        self._segments = []
+        self._read_handles = {}
+        self._total_bytes = 0
+        self._live_bytes = 0
+
+
+    def _segment_fp(self, segment):
+        return self.path.child(
+            "{0}{1:08d}{2}".format(segment_prefix, segment, segment_suffix)
+        )
+
+
+    def _list_segments(self):
+        segments = []
+
+        if not self.path.isdir():
+            return segments
+
+        for child in self.path.children():
+            name = child.basename()
+            if not (
+                name.startswith(segment_prefix) and
+                name.endswith(segment_suffix)
+            ):
+                continue
+            try:
+                segments.append(
+                    int(name[len(segment_prefix):-len(segment_suffix)])
+                )
+            except ValueError:
+                log.err("Invalid filename in data store: {0}".format(name))
+
+        return sorted(segments)
+
+
+    def _log_index(self):
+        """
+        Get the index of incident versions, replaying the log if necessary.
+
+        @return: A mapping of incident numbers to a list of
+            C{(segment, offset, length, etag)} locations for each stored
+            version of the incident, oldest first.
+        @rtype: L{dict}
+        """
+        with self._lock:
+            if self._versions is None:
+                self._replay()
+            return self._versions
+
+
+    def _replay(self):
+        versions = {}
+        segments = self._list_segments()
+
+        self._total_bytes = 0
+
+        for segment in segments:
+            is_last = (segment == segments[-1])
+
+            for number, location in self._read_segment(segment, is_last):
+                versions.setdefault(number, []).append(location)
+                self._total_bytes += record_header.size + location[2]
+
+        self._live_bytes = sum(
+            record_header.size + locations[-1][2]
+            for locations in versions.itervalues()
+        )
+
+        log.msg(
+            "Replayed {0} segments with {1} incidents from {2}"
+            .format(len(segments), len(versions), self.path.path)
+        )
+
+        self._segments = segments
+        self._versions = versions
+
+
+    def _read_segment(self, segment, is_last):
+        """
+        Read the records in a segment.
+
+        @return: An iterable of C{(number, location)} tuples.
+        """
+        segment_fp = self._segment_fp(segment)
+
+        with segment_fp.open("r") as handle:
+            offset = 0
+
+            while True:
+                header = handle.read(record_header.size)
+                if not header:
+                    return
+
+                problem = None
+
+                if len(header) < record_header.size:
+                    problem = "truncated record header"
+                else:
+                    magic, number, length, crc = record_header.unpack(header)
+
+                    if magic != record_magic:
+                        problem = "bad record magic"
+                    else:
+                        data = handle.read(length)
+
+                        if len(data) < length:
+                            problem = "truncated record data"
+                        elif crc32(data) & 0xffffffff != crc:
+                            problem = "bad record checksum"
+
+                if problem is not None:
+                    log.err(
+                        "Stopped reading {0} at offset {1}: {2}"
+                        .format(segment_fp.path, offset, problem)
+                    )
+                    if is_last:
+                        self._truncate_segment(segment, offset)
+                    return
+
+                yield (
+                    number,
+                    (
+                        segment,
+                        offset + record_header.size,
+                        length,
+                        etag_hash(data).hexdigest(),
+                    )
+                )
+
+                offset += record_header.size + length
+
+
+    def _truncate_segment(self, segment, offset):
+        """
+        Discard the end of a segment, starting at the given offset.
+        This is a no-op for read-only storage.
+        """
+        pass
+
+
+    def _read_location(self, location):
+        segment, offset, length, etag = location
+
+        with self._lock:
+            handle = self._read_handles.get(segment, None)
+            if handle is None:
+                handle = self._segment_fp(segment).open("r")
+                self._read_handles[segment] = handle
+
+            handle.seek(offset)
+            data = handle.read(length)
+
+        if len(data) != length:
+            raise StorageError(
+                "Unable to read {0} bytes at offset {1} in segment {2}"
+                .format(length, offset, segment)
+            )
+
+        return data
+
+
+    def _list_incidents(self):
+        return iter(list(self._log_index()))
+
+
+    def _locations(self, number):
+        number = self._incident_number(number)
+
+        try:
+            return self._log_index()[number]
+        except KeyError:
+            raise NoSuchIncidentError(number)
+
+
+    def _read_etag(self, number):
+        return self._locations(number)[-1][3]
+
+
+    def read_incident_with_number_raw(self, number):
+        with self._lock:
+            return self._read_location(self._locations(number)[-1])
+
+
+    def history_for_incident_with_number(self, number):
+        """
+        Look up the stored versions of an incident.
+
+        Compaction discards all but the latest version of each incident, so
+        the history only goes back to the last compaction.
+
+        @param number: The number of an incident.
+        @type number: L{int}
+
+        @return: The versions of the incident, oldest first.
+        @rtype: L{list} of L{ims.data.Incident}
+        """
+        number = self._incident_number(number)
+
+        with self._lock:
+            data = [
+                self._read_location(location)
+                for location in self._locations(number)
+            ]
+
+        return [incident_from_data(d, number=number) for d in data]
+
+
+    def close(self):
+        """
+        Close any open segment files.
+        """
+        with self._lock:
+            for handle in self._read_handles.itervalues():
+                handle.close()
+            self._read_handles.clear()
+
+
+
+class LogStorage(ReadOnlyLogStorage, Storage):
+    """
+    Log-structured back-end storage which supports writes and compaction.
+    """
+
+    def __init__(
+        self, path, cache_size=0,
+        segment_size=16 * 1024 * 1024,
+        compact_ratio=0.5,
+        compact_minimum=4 * 1024 * 1024,
+        sync=True,
+        data_format="json",
+    ):
+        """
+        @param segment_size: The size at which to stop appending to a segment
+            and start a new one.
+        @type segment_size: L{int}
+
+        @param compact_ratio: Compact the log in the background after a write
+            if the fraction of stored bytes that are no longer part of the
+            latest version of an incident exceeds this.  If C{None}, the log
+            is only compacted by calling L{compact}.
+        @type compact_ratio: L{float}
+
+        @param compact_minimum: Don't compact automatically unless the log is
+            at least this many bytes.
+        @type compact_minimum: L{int}
+
+        @param sync: If true, flush each record to disk before returning from
+            a write.
+        @type sync: L{bool}
+
+        @param data_format: The format to write incidents in; one of
+            L{ims.binary.data_formats}.  Incidents in any format can be read.
+        @type data_format: L{str}
+        """
+        if data_format not in data_formats:
+            raise StorageError(
+                "Unknown data format: {0!r}".format(data_format)
+            )
+
+        ReadOnlyLogStorage.__init__(self, path, cache_size=cache_size)
+
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self.compact_minimum = compact_minimum
+        self.sync = sync
+        self.data_format = data_format
+
+        self._active_segment = None
+        self._active_handle = None
+        self._next_segment = None
+        self._compacting = False
+
+
+    def _truncate_segment(self, segment, offset):
+        log.msg(
+            "Truncating {0} to {1} bytes"
+            .format(self._segment_fp(segment).path, offset)
+        )
+        with self._segment_fp(segment).open("r+") as handle:
+            handle.truncate(offset)
+
+
+    def _new_segment_number(self):
+        if self._next_segment is None:
+            if self._segments:
+                self._next_segment = self._segments[-1] + 1
+            else:
+                self._next_segment = 1
+
+        segment = self._next_segment
+        self._next_segment += 1
+        return segment
+
+
+    def _seal_active_segment(self):
+        if self._active_handle is not None:
+            self._active_handle.close()
+        self._active_handle = None
+        self._active_segment = None
+
+
+    def _append(self, handle, segment, number, data):
+        offset = handle.tell()
+
+        handle.write(record_header.pack(
+            record_magic, number, len(data), crc32(data) & 0xffffffff
+        ))
+        handle.write(data)
+
+        return (
+            segment,
+            offset + record_header.size,
+            len(data),
+            etag_hash(data).hexdigest(),
+        )
+
+
+    def _write_incident_data(self, incident, data):
+        number = incident.number
+
+        with self._lock:
+            versions = self._log_index()
+
+            new_segment = self._active_handle is None
+            if new_segment:
+                self._active_segment = self._new_segment_number()
+                self._active_handle = (
+                    self._segment_fp(self._active_segment).open("w")
+                )
+                self._segments.append(self._active_segment)
+
+            handle = self._active_handle
+            location = self._append(handle, self._active_segment, number, data)
+
+            handle.flush()
+            if self.sync:
+                fsync(handle.fileno())
+
+                # A new segment's data is only durable once its directory
+                # entry is.
+                if new_segment:
+                    fsync_directory(self.path)
+
+            locations = versions.setdefault(number, [])
+            if locations:
+                self._live_bytes -= record_header.size + locations[-1][2]
+            locations.append(location)
+
+            record_size = record_header.size + len(data)
+            self._total_bytes += record_size
+            self._live_bytes += record_size
+
+            if handle.tell() >= self.segment_size:
+                self._seal_active_segment()
+
+            compact = self._should_compact()
+            if compact:
+                self._compacting = True
+
+        if compact:
+            # Writes usually run in a storage thread (see
+            # L{ims.asyncstore.AsyncStorage}), and only the reactor thread
+            # may start a thread with deferToThread.
+            from twisted.internet import reactor
+            reactor.callFromThread(self._compact_in_background)
+
+
+    def _compact_in_background(self):
+        d = deferToThread(self._compact)
+        d.addErrback(log.err, "Unable to compact {0}".format(self))
+
+
+    def _write_etag(self, number, etag):
+        # Etags are computed from the log when it is replayed.
+        pass
+
+
+    def _should_compact(self):
+        if self.compact_ratio is None or self._compacting:
+            return False
+
+        if self._total_bytes < self.compact_minimum:
+            return False
+
+        dead_bytes = self._total_bytes - self._live_bytes
+        return dead_bytes > self._total_bytes * self.compact_ratio
+
+
+    def compact(self):
+        """
+        Rewrite the latest version of each incident into a new segment and
+        remove the segments they were copied from.
+
+        Writes may proceed while compaction is copying records; they are
+        appended to a segment that follows the compacted one.  If the store
+        is already being compacted, this does nothing.
+        """
+        with self._lock:
+            if self._compacting:
+                return
+            self._compacting = True
+
+        self._compact()
+
+
+    def _compact(self):
+        # The caller has set self._compacting, which is cleared when done.
+        try:
+            with self._lock:
+                versions = self._log_index()
+
+                # Seal the active segment so that every segment up to now is
+                # compacted, and allocate the compacted segment before the next
+                # active one, so that replay sees newer writes after it.
+                self._seal_active_segment()
+
+                old_segments = list(self._segments)
+                if not old_segments:
+                    return
+
+                segment = self._new_segment_number()
+                self._segments.append(segment)
+
+                latest = dict(
+                    (number, locations[-1])
+                    for number, locations in versions.iteritems()
+                )
+
+            new_locations = {}
+
+            segment_fp = self._segment_fp(segment)
+            with segment_fp.open("w") as handle:
+                for number, location in sorted(latest.iteritems()):
+                    data = self._read_location(location)
+                    new_locations[number] = self._append(
+                        handle, segment, number, data
+                    )
+                handle.flush()
+                fsync(handle.fileno())
+
+            # Make sure the compacted segment will be found after a crash
+            # before removing the segments it replaces.
+            fsync_directory(self.path)
+
+            with self._lock:
+                old = frozenset(old_segments)
+
+                for number, locations in versions.iteritems():
+                    newer = [l for l in locations if l[0] not in old]
+                    if number in new_locations:
+                        newer.insert(0, new_locations[number])
+                    locations[:] = newer
+
+                for old_segment in old_segments:
+                    handle = self._read_handles.pop(old_segment, None)
+                    if handle is not None:
+                        handle.close()
+                    self._segment_fp(old_segment).remove()
+                    self._segments.remove(old_segment)
+
+                self._total_bytes = sum(
+                    record_header.size + location[2]
+                    for locations in versions.itervalues()
+                    for location in locations
+                )
+                self._live_bytes = sum(
+                    record_header.size + locations[-1][2]
+                    for locations in versions.itervalues()
+                )
+
+            log.msg(
+                "Compacted {0} segments into {1}"
+                .format(len(old_segments), segment_fp.path)
+            )
+
+        finally:
+            with self._lock:
+                self._compacting = False
+
+
+    def close(self):
+        with self._lock:
+            self._seal_active_segment()
+            ReadOnlyLogStorage.close(self)
@@ -23,17 +23,21 @@ __all__ = [
 ]
 
 from datetime import datetime as DateTime
+from hashlib import sha1 as etag_hash
+from urllib import urlencode
 
+from twisted.python import log
 from twisted.python.zippath import ZipArchive
 from twisted.internet.defer import Deferred
+from twisted.internet.task import LoopingCall
 from twisted.web import http
 from twisted.web.static import File
 
 from klein import Klein
 
-from ims.data import JSON, to_json_text, from_json_io
-from ims.data import Incident, ReportEntry, IncidentType
-from ims.sauce import url_for, set_response_header
+from ims.data import JSON, to_json_text, to_json_data, from_json_io
+from ims.data import Incident, IncidentType, diff_incidents
+from ims.sauce import url_for, set_response_header, not_modified, if_match
 from ims.sauce import http_sauce
 from ims.sauce import HeaderName, ContentType
 from ims.element.file import FileElement
@@ -43,6 +47,8 @@ from ims.element.incident import IncidentElement
 from ims.element.report_daily import DailyReportElement
 from ims.element.report_shift import ShiftReportElement
 from ims.element.util import incidents_from_query
+from ims.element.util import limit_from_query, fields_from_query
+from ims.element.util import numbers_from_query, sequence_from_query
 from ims.util import http_download
 
 
@@ -56,10 +62,21 @@ class IncidentManagementSystem(object):
     protocol_version = "0.0"
 
 
-    def __init__(self, config):
+    # Seconds to wait for a change before answering a long poll without one
+    change_poll_timeout = 30
+
+    # Seconds between comments sent to keep an idle event stream open
+    change_keepalive_interval = 15
+
+
+    def __init__(self, config, reactor=None):
+        if reactor is None:
+            from twisted.internet import reactor
+
         self.config = config
+        self._reactor = reactor
         self.avatarId = None
-        self.storage = config.storage
+        self.storage = config.async_storage
         self.dms = config.dms
 
 
@@ -72,9 +89,8 @@ class IncidentManagementSystem(object):
     @http_sauce
     def ping(self, request):
         ack = "ack"
-        set_response_header(
-            request, HeaderName.etag, ack
-        )
+        if not_modified(request, ack):
+            return ""
         set_response_header(
             request, HeaderName.contentType, ContentType.JSON
         )
@@ -85,9 +101,8 @@ class IncidentManagementSystem(object):
     @app.route("/rangers/", methods=("GET",))
     @http_sauce
     def list_rangers(self, request):
-        set_response_header(
-            request, HeaderName.etag, str(self.dms.rangers_updated)
-        )
+        if not_modified(request, str(self.dms.rangers_updated)):
+            return ""
         set_response_header(
             request, HeaderName.contentType, ContentType.JSON
         )
@@ -112,7 +127,8 @@ class IncidentManagementSystem(object):
     @app.route("/incident_types/", methods=("GET",))
     @http_sauce
     def list_incident_types(self, request):
-        #set_response_header(request, HeaderName.etag, "*") # FIXME
+        if not_modified(request, self.config.IncidentTypesETag):
+            return ""
         set_response_header(request, HeaderName.contentType, ContentType.JSON)
         return self.config.IncidentTypesJSON
 
@@ -121,12 +137,319 @@ class IncidentManagementSystem(object):
     @app.route("/incidents/", methods=("GET",))
     @http_sauce
     def list_incidents(self, request):
-        #set_response_header(request, HeaderName.etag, "*") # FIXME
-        set_response_header(request, HeaderName.contentType, ContentType.JSON)
-        return to_json_text(sorted(
-            incidents_from_query(self, request),
-            cmp=lambda a, b: cmp(a[0], b[0]), reverse=True,
-        ))
+        numbers = numbers_from_query(request)
+        if numbers is not None:
+            return self.stream_incidents(request, numbers)
+
+        fields = fields_from_query(request)
+        limit = limit_from_query(request)
+
+        def respond(incidents):
+            # Search results are already in descending order by number.
+            # Each incident's etag is the hash of its data, which includes its
+            # number, so the etags in order identify the list.  Hashing them
+            # is much cheaper than encoding the list as JSON.
+            tag = "".join([e for n, e in incidents])
+            if fields is not None:
+                tag += ",".join([field.value for field in fields])
+            etag = etag_hash(tag).hexdigest()
+            if not_modified(request, etag):
+                return ""
+
+            if limit is not None and len(incidents) == limit:
+                args = dict(request.args)
+                args["cursor"] = [str(incidents[-1][0])]
+                set_response_header(
+                    request, HeaderName.link,
+                    '<{0}?{1}>; rel="next"'.format(
+                        request.path, urlencode(sorted(args.items()), True)
+                    )
+                )
+
+            set_response_header(
+                request, HeaderName.contentType, ContentType.JSON
+            )
+
+            if fields is None:
+                return to_json_data(incidents)
+
+            d = self.storage.read_incidents(
+                number for number, etag in incidents
+            )
+            d.addCallback(
+                lambda read: to_json_data([
+                    (incident.number, etag, incident.to_json_fields(fields))
+                    for incident, (number, etag) in zip(read, incidents)
+                ])
+            )
+            return d
+
+        d = incidents_from_query(self, request)
+        d.addCallback(respond)
+        return d
+
+
+    # Number of incidents to read in each trip to storage when streaming
+    batch_size = 100
+
+
+    def stream_incidents(self, request, numbers):
+        """
+        Respond with the given incidents as a JSON list of
+        C{[number, etag, incident]} lists.  The etag and incident are
+        C{null} for missing incidents, since the response status is sent
+        before all of the incidents have been read.
+
+        The response is written a batch of incidents at a time, so that
+        large responses are neither built up in memory nor hold up storage
+        while they are read.  If reading a batch after the first fails, the
+        connection is dropped, since the status has already been sent.
+
+        @param request: The request.
+        @type request: L{IRequest}
+
+        @param numbers: The numbers of the incidents to respond with.
+        @type numbers: L{list} of L{int}
+
+        @return: A deferred resulting in the end of the response body.
+        @rtype: L{Deferred}
+        """
+        set_response_header(
+            request, HeaderName.contentType, ContentType.JSON
+        )
+
+        if not numbers:
+            return "[]"
+
+        batches = [
+            numbers[start:start + self.batch_size]
+            for start in xrange(0, len(numbers), self.batch_size)
+        ]
+
+        disconnected = []
+        request.notifyFinish().addErrback(disconnected.append)
+
+        def write(incidents, index):
+            if disconnected:
+                return ""
+
+            # Incidents cache their JSON encoding, so splice it in rather
+            # than re-encoding the incidents as part of a list.
+            chunks = []
+            for number, etag, incident in incidents:
+                if incident is None:
+                    chunks.append("[{0},null,null]".format(number))
+                else:
+                    chunks.append(
+                        '[{0},"{1}",{2}]'.format(
+                            number, etag, incident.to_json_data()
+                        )
+                    )
+
+            request.write(("[" if index == 0 else ",") + ",".join(chunks))
+
+            index += 1
+            if index == len(batches):
+                return "]"
+
+            return read(index)
+
+        def abort(failure):
+            # The status and part of the body have been sent, so an error
+            # response is no longer possible.  Drop the connection instead,
+            # so that the client sees that the response is incomplete, and
+            # don't respond any further.
+            log.err(failure, "Unable to stream incidents")
+            request.transport.loseConnection()
+            return Deferred()
+
+        def read(index):
+            d = self.storage.read_incidents_with_etags(batches[index])
+            d.addCallback(write, index)
+            if index:
+                d.addErrback(abort)
+            return d
+
+        return read(0)
+
+
+    @app.route("/incidents/changes", methods=("GET",))
+    @app.route("/incidents/changes/", methods=("GET",))
+    @http_sauce
+    def incident_changes(self, request):
+        if ContentType.eventStream in request.accepts:
+            return self.stream_changes(request)
+        else:
+            return self.poll_changes(request)
+
+
+    def poll_changes(self, request):
+        """
+        Respond with the incidents that have changed since the point in the
+        sequence of changes given by the C{since} query argument, waiting
+        up to L{change_poll_timeout} seconds for a change if there are none
+        yet.
+
+        The response is a JSON object with the current C{sequence} number,
+        to give as C{since} in the next request, and the C{changes}: a list
+        of C{[number, etag, sequence]} lists.  Without C{since}, the
+        response is immediate and has no changes.  If C{since} is unknown
+        (for example, because the server has restarted), C{changes} is
+        C{null} and the client should assume that any incident may have
+        changed.
+
+        @param request: The request.
+        @type request: L{IRequest}
+
+        @return: A deferred resulting in the response body.
+        @rtype: L{Deferred}
+        """
+        since = sequence_from_query(request)
+        changed = Deferred()
+
+        def notify(number, etag, sequence):
+            if not changed.called:
+                changed.callback(None)
+
+        # Subscribe before looking for changes, so that none are missed in
+        # between.
+        self.storage.subscribe(notify)
+        timeout = self._reactor.callLater(
+            self.change_poll_timeout, notify, None, None, None
+        )
+
+        subscribed = [True]
+
+        def unsubscribe(result=None):
+            if subscribed:
+                subscribed.pop()
+                self.storage.unsubscribe(notify)
+                if timeout.active():
+                    timeout.cancel()
+            return result
+
+        # If the client goes away, stop waiting for a change.
+        request.notifyFinish().addErrback(lambda f: unsubscribe())
+
+        def respond(result, wait):
+            sequence, changes = result
+
+            if wait and since is not None and changes == []:
+                changed.addCallback(
+                    lambda _: self.storage.changes_since(since)
+                )
+                changed.addCallback(respond, False)
+                return changed
+
+            unsubscribe()
+
+            set_response_header(
+                request, HeaderName.contentType, ContentType.JSON
+            )
+            return to_json_data(dict(sequence=sequence, changes=changes))
+
+        d = self.storage.changes_since(since)
+        d.addCallback(respond, True)
+        d.addErrback(unsubscribe)
+        return d
+
+
+    def stream_changes(self, request):
+        """
+        Send the incidents that change as Server-Sent Events, starting with
+        those that have changed since the point in the sequence of changes
+        given by the C{Last-Event-ID} header or the C{since} query argument.
+
+        Each change is a message with the change's sequence number as its
+        ID and a C{[number, etag, sequence]} JSON list as its data.  If the
+        starting point is unknown (for example, because the server has
+        restarted), a C{reset} event is sent first, and the client should
+        assume that any incident may have changed.
+
+        @param request: The request.
+        @type request: L{IRequest}
+
+        @return: A deferred which doesn't fire, since the stream stays open
+            until the client closes it.
+        @rtype: L{Deferred}
+        """
+        since = None
+        for value in request.requestHeaders.getRawHeaders(
+            HeaderName.lastEventID.value, []
+        ):
+            try:
+                since = int(value)
+            except ValueError:
+                pass
+        if since is None:
+            since = sequence_from_query(request)
+
+        set_response_header(
+            request, HeaderName.contentType, ContentType.eventStream
+        )
+        set_response_header(request, HeaderName.cacheControl, "no-cache")
+
+        # The last sequence number sent, and changes waiting to be sent
+        # until the changes since the starting point have been.
+        last = [since]
+        pending = []
+        started = []
+
+        def send(number, etag, sequence):
+            if sequence > last[0]:
+                last[0] = sequence
+                request.write(
+                    'id: {2}\ndata: [{0},"{1}",{2}]\n\n'
+                    .format(number, etag, sequence)
+                )
+
+        def notify(*change):
+            if started:
+                send(*change)
+            else:
+                pending.append(change)
+
+        self.storage.subscribe(notify)
+
+        keepalive = LoopingCall(request.write, ":\n\n")
+        keepalive.clock = self._reactor
+        keepalive.start(self.change_keepalive_interval, now=False)
+
+        def stop(result=None):
+            if keepalive.running:
+                keepalive.stop()
+                self.storage.unsubscribe(notify)
+            return result
+
+        request.notifyFinish().addBoth(lambda result: stop())
+
+        def start(result):
+            sequence, changes = result
+
+            if changes is None:
+                request.write(
+                    "event: reset\nid: {0}\ndata: {0}\n\n".format(sequence)
+                )
+                last[0] = sequence
+            elif since is None:
+                # Tell the client where it is in the sequence.
+                request.write("id: {0}\n\n".format(sequence))
+                last[0] = sequence
+            else:
+                for change in changes:
+                    send(*change)
+
+            for change in pending:
+                send(*change)
+            del pending[:]
+            started.append(True)
+
+            return Deferred()
+
+        d = self.storage.changes_since(since)
+        d.addCallback(start)
+        d.addErrback(stop)
+        return d
 
 
     @app.route("/incidents/<number>", methods=("GET",))
@@ -136,28 +459,35 @@ class IncidentManagementSystem(object):
         #import time
         #time.sleep(0.3)
 
-        set_response_header(
-            request, HeaderName.etag,
-            self.storage.etag_for_incident_with_number(number)
-        )
-        set_response_header(
-            request, HeaderName.contentType, ContentType.JSON
-        )
+        def read(etag):
+            if not_modified(request, etag):
+                return ""
 
-        if False:
-            #
-            # This is faster, but doesn't benefit from any cleanup or
-            # validation code, so it's only OK if we know all data in the
-            # store is clean by this server version's standards.
-            #
-            return self.storage.read_incident_with_number_raw(number)
-        else:
-            #
-            # This parses the data from the store, validates it, then
-            # re-serializes it.
-            #
-            incident = self.storage.read_incident_with_number(number)
-            return incident.to_json_text()
+            set_response_header(
+                request, HeaderName.contentType, ContentType.JSON
+            )
+
+            if False:
+                #
+                # This is faster, but doesn't benefit from any cleanup or
+                # validation code, so it's only OK if we know all data in the
+                # store is clean by this server version's standards.
+                #
+                return self.storage.read_incident_with_number_raw(number)
+            else:
+                #
+                # This parses the data from the store, validates it, then
+                # re-serializes it.  The serialized data is cached on the
+                # incident, so incidents in the storage cache are only
+                # serialized once.
+                #
+                d = self.storage.read_incident_with_number(number)
+                d.addCallback(lambda incident: incident.to_json_data())
+                return d
+
+        d = self.storage.etag_for_incident_with_number(number)
+        d.addCallback(read)
+        return d
 
 
     @app.route("/incidents/<number>", methods=("POST",))
@@ -171,207 +501,102 @@ class IncidentManagementSystem(object):
             return "Server is in read-only mode."
 
         number = int(number)
-        incident = self.storage.read_incident_with_number(number)
-
-        #
-        # Handle the changes requested by the client
-        #
         edits_json = from_json_io(request.content)
-        edits = Incident.from_json(edits_json, number=number, validate=False)
 
-        user_entries = []
-
-        system_messages = []
-        state_changes = []
+        def respond(etag):
+            set_response_header(request, HeaderName.etag, etag)
+            set_response_header(
+                request, HeaderName.contentType, ContentType.JSON
+            )
+            request.setResponseCode(http.OK)
+            return ""
+
+        # The incident is read, edited and written with no other write to it
+        # in between, so concurrent edits are not lost; with If-Match, the
+        # edit is refused if the incident has changed since the client last
+        # read it.
+        d = self.storage.update_incident(
+            number,
+            lambda incident: self._apply_edits(incident, edits_json),
+            if_match(request),
+        )
+        d.addCallback(respond)
+        return d
 
-        def log_edit_value(key, old, new):
-            if key is JSON.number:
-                return
 
-            if old == new:
-                # print (
-                #     "Client submitted unchaged value for {0}: {1}"
-                #     .format(JSON.describe(key), new)
-                # )
-                return
+    def _apply_edits(self, incident, edits_json):
+        """
+        Apply edits submitted by a client to an incident.
 
-            if key in JSON.states():
-                state_changes.append((key, new))
-                return
+        @param incident: The incident to edit.
+        @type incident: L{Incident}
 
-            system_messages.append(
-                u"Changed {0} to: {1}"
-                .format(JSON.describe(key), new if new else u"<no value>")
-            )
+        @param edits_json: The edits, as incident JSON containing only the
+            attributes to change.
+        @type edits_json: L{dict}
 
-        def diff_set(key, old, new):
-            old = frozenset(old if old else ())
-            new = frozenset(new if new else ())
-            unchanged = old & new
-            removed = old ^ unchanged
-            added = new ^ unchanged
-            return added, removed
-
-        def log_edit_set(key, added, removed):
-            if added:
-                system_messages.append(
-                    u"Added to {0}: {1}"
-                    .format(JSON.describe(key), ", ".join(added))
-                )
-            if removed:
-                system_messages.append(
-                    u"Removed from {0}: {1}"
-                    .format(JSON.describe(key), ", ".join(removed))
-                )
+        @return: C{incident}, modified.
+        @rtype: L{Incident}
+        """
+        #
+        # Handle the changes requested by the client
+        #
+        edits = Incident.from_json(
+            edits_json, number=incident.number, validate=False
+        )
 
-        def close_incident(incident=incident, edits=edits):
+        keys = set(JSON.lookupByValue(key) for key in edits_json)
+        keys.discard(JSON.number)
+        keys.discard(JSON.report_entries)
+
+        if edits.created is None:
+            # If created is None, then we aren't editing state.
+            # (It would be weird if others were not None here.)
+            keys.difference_update(JSON.states())
+
+        # None values should not cause edits.
+        for key, value in (
+            (JSON.priority, edits.priority),
+            (JSON.summary, edits.summary),
+            (JSON.location_name, edits.location.name),
+            (JSON.location_address, edits.location.address),
+            (JSON.ranger_handles, edits.rangers),
+            (JSON.incident_types, edits.incident_types),
+        ):
+            if value is None:
+                keys.discard(key)
+
+        if (
+            JSON.incident_types in keys and
+            IncidentType.Junk.value in edits.incident_types and
+            IncidentType.Junk.value not in (incident.incident_types or ())
+        ):
+            # Junk was added as an incident type; let's close.
             now = DateTime.now()
-            for key in (
-                JSON.created,
-                JSON.dispatched,
-                JSON.on_scene,
-                JSON.closed,
-            ):
+            for key in JSON.states():
                 attr_name = key.name
 
                 if (
                     getattr(incident, attr_name) is None and
                     getattr(edits, attr_name) is None
                 ):
-                    log_edit_value(key, getattr(incident, attr_name), now)
-                    setattr(incident, attr_name, now)
-
-        for key in edits_json.keys():
-            key = JSON.lookupByValue(key)
-
-            if key is JSON.report_entries:
-                if edits.report_entries is not None:
-                    for entry in edits.report_entries:
-                        # Edit report entries to add author
-                        entry.author = self.avatarId.decode("utf-8")
-                        user_entries.append(entry)
-            elif key is JSON.location_name:
-                if edits.location.name is not None:
-                    log_edit_value(
-                        key, incident.location.name, edits.location.name
-                    )
-                    incident.location.name = edits.location.name
-            elif key is JSON.location_address:
-                if edits.location.address is not None:
-                    log_edit_value(
-                        key, incident.location.address, edits.location.address
-                    )
-                    incident.location.address = edits.location.address
-            elif key is JSON.ranger_handles:
-                if edits.rangers is not None:
-                    added, removed = diff_set(
-                        key, incident.rangers, edits.rangers
-                    )
-                    log_edit_set(
-                        key,
-                        [r.handle for r in added],
-                        [r.handle for r in removed]
-                    )
-                    incident.rangers = edits.rangers
-            elif key is JSON.incident_types:
-                if edits.incident_types is not None:
-                    log_edit_set(
-                        key, *diff_set(
-                            key, incident.incident_types, edits.incident_types
-                        )
-                    )
-
-                    if IncidentType.Junk.value in (
-                        frozenset(edits.incident_types) -
-                        frozenset(incident.incident_types)
-                    ):
-                        # Junk was added as an incident type; let's close.
-                        close_incident()
-
-                    incident.incident_types = edits.incident_types
-            else:
-                attr_name = key.name
-                attr_value = getattr(edits, attr_name)
+                    setattr(edits, attr_name, now)
+                    keys.add(key)
 
-                if key in (
-                    JSON.created,
-                    JSON.dispatched,
-                    JSON.on_scene,
-                    JSON.closed,
-                ):
-                    if edits.created is None:
-                        # If created is None, then we aren't editing state.
-                        # (It would be weird if others were not None here.)
-                        continue
-                elif attr_value is None:
-                    # None values should not cause edits.
-                    continue
+        changes = diff_incidents(incident, edits, keys)
 
-                log_edit_value(key, getattr(incident, attr_name), attr_value)
+        author = self.avatarId.decode("utf-8")
 
-                setattr(incident, attr_name, attr_value)
-
-        #
-        # Figure out what to report about state changes
-        #
-        highest_change = None
-        lowest_change = None
-        for state_changed, state_time in state_changes:
-            if state_time is None:
-                if (
-                    lowest_change is None or
-                    JSON.cmpStates(lowest_change, state_changed) > 0
-                ):
-                    lowest_change = state_changed
-            else:
-                if (
-                    highest_change is None or
-                    JSON.cmpStates(highest_change[0], state_changed) < 0
-                ):
-                    highest_change = (state_changed, state_time)
-
-        if highest_change is not None:
-            system_messages.append(
-                u"State changed to: {0}"
-                .format(JSON.describe(highest_change[0]))
-            )
-        elif lowest_change is not None:
-            # We need one state less than lowest_change
-            last = None
-            for state in JSON.states():
-                if state == lowest_change:
-                    break
-                last = state
-            system_messages.append(
-                u"State changed to: {0}"
-                .format(JSON.describe(last))
-            )
+        for entry in edits.report_entries:
+            # Edit report entries to add author
+            entry.author = author
+            changes.report_entries.append(entry)
 
         #
         # Add system report entries, then user entries
         #
-        if system_messages:
-            incident.report_entries.append(
-                ReportEntry(
-                    author=self.avatarId.decode("utf-8"),
-                    text=u"\n".join(system_messages),
-                    system_entry=True,
-                )
-            )
-        incident.report_entries.extend(user_entries)
-
-        #
-        # Write to disk
-        #
-        self.storage.write_incident(incident)
-
-        #
-        # Respond
-        #
-        set_response_header(request, HeaderName.contentType, ContentType.JSON)
-        request.setResponseCode(http.OK)
+        return changes.apply(incident, author=author)
 
-        return ""
 
 
     @app.route("/incidents/", methods=("POST",))
@@ -384,28 +609,37 @@ class IncidentManagementSystem(object):
             request.setResponseCode(http.FORBIDDEN)
             return "Server is in read-only mode."
 
-        incident = Incident.from_json_io(
-            request.content, number=self.storage.next_incident_number()
-        )
+        json = from_json_io(request.content)
 
-        # Edit report entrys to add author
-        for entry in incident.report_entries:
-            entry.author = self.avatarId.decode("utf-8")
+        def write(number):
+            incident = Incident.from_json(json, number=number)
 
-        self.storage.write_incident(incident)
+            # Edit report entrys to add author
+            for entry in incident.report_entries:
+                entry.author = self.avatarId.decode("utf-8")
 
-        request.setResponseCode(http.CREATED)
+            d = self.storage.write_incident(incident)
+            d.addCallback(lambda _: number)
+            return d
 
-        request.setHeader(
-            HeaderName.incidentNumber.value,
-            incident.number
-        )
-        request.setHeader(
-            HeaderName.location.value,
-            url_for(request, "get_incident", {"number": incident.number})
-        )
+        def respond(number):
+            request.setResponseCode(http.CREATED)
 
-        return ""
+            request.setHeader(
+                HeaderName.incidentNumber.value,
+                number
+            )
+            request.setHeader(
+                HeaderName.location.value,
+                url_for(request, "get_incident", {"number": number})
+            )
+
+            return ""
+
+        d = self.storage.next_incident_number()
+        d.addCallback(write)
+        d.addCallback(respond)
+        return d
 
 
     #
@@ -422,7 +656,15 @@ class IncidentManagementSystem(object):
         set_response_header(
             request, HeaderName.contentType, ContentType.HTML
         )
-        return DispatchQueueElement(self)
+
+        d = incidents_from_query(self, request)
+        d.addCallback(
+            lambda incidents: self.storage.read_incidents(
+                (number for number, etag in incidents), report_entries=True
+            )
+        )
+        d.addCallback(lambda incidents: DispatchQueueElement(self, incidents))
+        return d
 
 
     @app.route("/queue/incidents/<number>", methods=("GET",))
@@ -431,7 +673,10 @@ class IncidentManagementSystem(object):
         set_response_header(
             request, HeaderName.contentType, ContentType.HTML
         )
-        return IncidentElement(self, number)
+
+        d = self.storage.read_incidents((number,), report_entries=True)
+        d.addCallback(lambda incidents: IncidentElement(self, incidents[0]))
+        return d
 
 
     #
@@ -494,7 +739,10 @@ class IncidentManagementSystem(object):
         set_response_header(
             request, HeaderName.contentType, ContentType.HTML
         )
-        return DailyReportElement(self)
+
+        d = self.storage.read_incidents(report_entries=True)
+        d.addCallback(lambda incidents: DailyReportElement(self, incidents))
+        return d
 
 
     @app.route("/charts/daily", methods=("GET",))
@@ -503,7 +751,13 @@ class IncidentManagementSystem(object):
         set_response_header(
             request, HeaderName.contentType, ContentType.HTML
         )
-        return DailyReportElement(self, template_name="chart_daily")
+
+        d = self.storage.read_incidents(report_entries=True)
+        d.addCallback(
+            lambda incidents:
+            DailyReportElement(self, incidents, template_name="chart_daily")
+        )
+        return d
 
 
     @app.route("/reports/shift", methods=("GET",))
@@ -512,7 +766,10 @@ class IncidentManagementSystem(object):
         set_response_header(
             request, HeaderName.contentType, ContentType.HTML
         )
-        return ShiftReportElement(self)
+
+        d = self.storage.read_incidents(report_entries=True)
+        d.addCallback(lambda incidents: ShiftReportElement(self, incidents))
+        return d
 
 
     #
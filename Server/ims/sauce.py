@@ -21,6 +21,8 @@ Protocol utilities
 __all__ = [
     "url_for",
     "set_response_header",
+    "not_modified",
+    "if_match",
     "http_sauce",
     "HeaderName",
     "ContentType",
@@ -30,12 +32,14 @@ from functools import wraps
 
 from twisted.python import log
 from twisted.python.constants import Values, ValueConstant
+from twisted.python.failure import Failure
+from twisted.internet.defer import Deferred
 from twisted.web import http
 
 from klein.interfaces import IKleinRequest
 
 from ims.data import InvalidDataError
-from ims.store import NoSuchIncidentError
+from ims.store import NoSuchIncidentError, IncidentModifiedError
 from ims.dms import DatabaseError
 
 
@@ -51,6 +55,115 @@ def set_response_header(request, name, value):
     request.setHeader(name.value, value)
 
 
+def entity_tags(request, name):
+    """
+    Parse the entity tags in a request's C{If-Match} or C{If-None-Match}
+    header.  Tags may be quoted or not, since the etags we send are not
+    quoted.
+
+    @param request: The request.
+    @type request: L{IRequest}
+
+    @param name: The name of the header.
+    @type name: L{HeaderName}
+
+    @return: C{(tag, weak)} tuples for the tags in the header, where C{weak}
+        is true for weak tags.  C{"*"} is returned as a tag.
+    @rtype: L{list} of (L{str}, L{bool}) tuples
+    """
+    tags = []
+
+    for value in request.requestHeaders.getRawHeaders(name.value, []):
+        for tag in value.split(","):
+            tag = tag.strip()
+            if not tag:
+                continue
+
+            weak = tag.startswith("W/")
+            if weak:
+                tag = tag[2:]
+
+            if len(tag) >= 2 and tag.startswith('"') and tag.endswith('"'):
+                tag = tag[1:-1]
+
+            tags.append((tag, weak))
+
+    return tags
+
+
+def etag_matches(request, etag):
+    """
+    Determine whether a request's C{If-None-Match} header matches an etag.
+    Entity tags are compared weakly.
+
+    @param request: The request.
+    @type request: L{IRequest}
+
+    @param etag: The current etag for the requested resource.
+    @type etag: L{str}
+
+    @return: C{True} if the header matches C{etag}, C{False} otherwise.
+    @rtype: L{bool}
+    """
+    for tag, weak in entity_tags(request, HeaderName.ifNoneMatch):
+        if tag == "*" or tag == etag:
+            return True
+
+    return False
+
+
+def if_match(request):
+    """
+    Look up the etags that a request's C{If-Match} header requires the
+    requested resource to have.  Entity tags are compared strongly, so weak
+    tags are left out.
+
+    @param request: The request.
+    @type request: L{IRequest}
+
+    @return: The etags, or C{None} if any etag will do.
+    @rtype: L{set} of L{str}
+    """
+    tags = entity_tags(request, HeaderName.ifMatch)
+    if not tags:
+        return None
+
+    etags = set()
+    for tag, weak in tags:
+        if tag == "*":
+            return None
+        if not weak:
+            etags.add(tag)
+
+    return etags
+
+
+def not_modified(request, etag):
+    """
+    Set the etag for a response, and if the request is conditional on the
+    resource having changed from that etag, set up a I{Not Modified}
+    response.  Call this before doing the work of producing the response
+    body, and if it returns C{True}, return an empty body instead.
+
+    @param request: The request.
+    @type request: L{IRequest}
+
+    @param etag: The current etag for the requested resource.
+    @type etag: L{str}
+
+    @return: C{True} if the client already has the resource, C{False}
+        otherwise.
+    @rtype: L{bool}
+    """
+    set_response_header(request, HeaderName.etag, etag)
+
+    if etag_matches(request, etag):
+        request.setResponseCode(http.NOT_MODIFIED)
+        return True
+
+    return False
+
+
 def set_user_agent(request):
     # Get User-Agent
     values = request.requestHeaders.getRawHeaders(
@@ -72,10 +185,8 @@ def set_accepts(request):
     )
     for value in values:
         for media_type in value.split(","):
-            if ";" in media_type:
-                (mime_type, parameter) = media_type.split(";")
-            else:
-                mime_type = media_type
+            # Ignore parameters, such as q, and the spaces around types
+            mime_type = media_type.split(";", 1)[0].strip()
             try:
                 accepts.append(ContentType.lookupByValue(mime_type))
             except ValueError:
@@ -103,47 +214,79 @@ def http_sauce(f):
         request.user = self.avatarId
 
         try:
-            return f(self, request, *args, **kwargs)
-
-        except NoSuchIncidentError as e:
-            request.setResponseCode(http.NOT_FOUND)
-            set_response_header(
-                request, HeaderName.contentType, ContentType.plain
-            )
-            return "No such incident: {0}\n".format(e)
-
-        except InvalidDataError as e:
-            log.err(e)
-            request.setResponseCode(http.BAD_REQUEST)
-            set_response_header(
-                request, HeaderName.contentType, ContentType.plain
-            )
-            return "Invalid data: {0}\n".format(e)
-
-        except DatabaseError as e:
-            log.err(e)
-            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
-            set_response_header(
-                request, HeaderName.contentType, ContentType.plain
-            )
-            return "Database error."
-
-        except Exception as e:
-            log.err(e)
-            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
-            set_response_header(
-                request, HeaderName.contentType, ContentType.plain
-            )
-            return "Server error.\n"
+            response = f(self, request, *args, **kwargs)
+        except Exception:
+            return error_response(request, Failure())
+
+        if isinstance(response, Deferred):
+            response.addErrback(lambda f: error_response(request, f))
+
+        return response
 
     return wrapper
 
 
+def error_response(request, failure):
+    """
+    Set up a response for an error raised by a request handler.
+
+    @param request: The request.
+    @type request: L{IRequest}
+
+    @param failure: The error.
+    @type failure: L{Failure}
+
+    @return: The response body.
+    @rtype: L{str}
+    """
+    if failure.check(NoSuchIncidentError):
+        request.setResponseCode(http.NOT_FOUND)
+        set_response_header(
+            request, HeaderName.contentType, ContentType.plain
+        )
+        return "No such incident: {0}\n".format(failure.value)
+
+    if failure.check(IncidentModifiedError):
+        request.setResponseCode(http.PRECONDITION_FAILED)
+        set_response_header(
+            request, HeaderName.contentType, ContentType.plain
+        )
+        return "Incident has been modified: {0}\n".format(failure.value)
+
+    if failure.check(InvalidDataError):
+        log.err(failure)
+        request.setResponseCode(http.BAD_REQUEST)
+        set_response_header(
+            request, HeaderName.contentType, ContentType.plain
+        )
+        return "Invalid data: {0}\n".format(failure.value)
+
+    if failure.check(DatabaseError):
+        log.err(failure)
+        request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+        set_response_header(
+            request, HeaderName.contentType, ContentType.plain
+        )
+        return "Database error."
+
+    log.err(failure)
+    request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+    set_response_header(
+        request, HeaderName.contentType, ContentType.plain
+    )
+    return "Server error.\n"
+
+
 
 class HeaderName (Values):
+    cacheControl   = ValueConstant("Cache-Control")
     contentType    = ValueConstant("Content-Type")
     etag           = ValueConstant("ETag")
+    ifNoneMatch    = ValueConstant("If-None-Match")
+    ifMatch        = ValueConstant("If-Match")
+    lastEventID    = ValueConstant("Last-Event-ID")
     incidentNumber = ValueConstant("Incident-Number")
+    link           = ValueConstant("Link")
     location       = ValueConstant("Location")
     userAgent      = ValueConstant("User-Agent")
     accept         = ValueConstant("Accept")
@@ -151,7 +294,8 @@ class HeaderName (Values):
 
 
 class ContentType (Values):
-    HTML  = ValueConstant("text/html")
-    JSON  = ValueConstant("application/json")
-    XHTML = ValueConstant("application/xhtml+xml")
-    plain = ValueConstant("text/plain")
+    HTML        = ValueConstant("text/html")
+    JSON        = ValueConstant("application/json")
+    XHTML       = ValueConstant("application/xhtml+xml")
+    plain       = ValueConstant("text/plain")
+    eventStream = ValueConstant("text/event-stream")
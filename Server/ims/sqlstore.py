@@ -0,0 +1,490 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+SQLite data store
+"""
+
+__all__ = [
+    "ReadOnlySQLiteStorage",
+    "SQLiteStorage",
+    "migrate",
+]
+
+import os
+import sqlite3
+import sys
+from datetime import timedelta as TimeDelta
+from hashlib import sha1 as etag_hash
+from threading import RLock
+
+from twisted.python.filepath import FilePath
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.data import parse_rfc3339, render_rfc3339
+from ims.store import StorageError, NoSuchIncidentError
+from ims.store import ReadOnlyStorage, Storage
+
+
+
+schema = """
+create table if not exists incident (
+    number           integer primary key,
+    priority         integer not null,
+    summary          text,
+    location_name    text,
+    location_address text,
+    created          text,
+    dispatched       text,
+    on_scene         text,
+    closed           text,
+    etag             text not null
+);
+
+create index if not exists incident_created    on incident (created);
+create index if not exists incident_dispatched on incident (dispatched);
+create index if not exists incident_on_scene   on incident (on_scene);
+create index if not exists incident_closed     on incident (closed);
+
+create table if not exists incident_type (
+    incident_number integer not null references incident (number),
+    position        integer not null,
+    name            text    not null,
+
+    primary key (incident_number, position)
+);
+
+create index if not exists incident_type_name on incident_type (name);
+
+create table if not exists ranger_assignment (
+    incident_number integer not null references incident (number),
+    position        integer not null,
+    handle          text    not null,
+
+    primary key (incident_number, position)
+);
+
+create index if not exists ranger_assignment_handle
+    on ranger_assignment (handle);
+
+create table if not exists report_entry (
+    incident_number integer not null references incident (number),
+    position        integer not null,
+    author          text,
+    text            text    not null,
+    created         text    not null,
+    system_entry    integer not null,
+
+    primary key (incident_number, position)
+);
+
+create index if not exists report_entry_created on report_entry (created);
+"""
+
+database_name = "incidents.sqlite"
+
+
+
+def render_date(date_time):
+    if date_time is None:
+        return None
+    else:
+        return render_rfc3339(date_time)
+
+
+def parse_date(rfc3339):
+    if rfc3339 is None:
+        return None
+    else:
+        return parse_rfc3339(rfc3339)
+
+
+
+class ReadOnlySQLiteStorage(ReadOnlyStorage):
+    """
+    SQLite back-end storage
+    """
+
+    def __init__(self, path, cache_size=0):
+        ReadOnlyStorage.__init__(self, path, cache_size=cache_size)
+
+        self._lock = RLock()
+        self._connection = None
+
+
+    @property
+    def database_fp(self):
+        return self.path.child(database_name)
+
+
+    def _database(self):
+        with self._lock:
+            if self._connection is None:
+                if not self.path.exists():
+                    self.path.createDirectory()
+
+                connection = sqlite3.connect(
+                    self.database_fp.path, check_same_thread=False
+                )
+                connection.executescript(schema)
+                self._connection = connection
+
+            return self._connection
+
+
+    def _query(self, sql, *args):
+        with self._lock:
+            return self._database().execute(sql, args).fetchall()
+
+
+    def close(self):
+        """
+        Close the database connection.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+    def _list_incidents(self):
+        for (number,) in self._query("select number from incident"):
+            yield number
+
+
+    def list_incidents(self):
+        for number, etag in self._query("select number, etag from incident"):
+            yield (number, str(etag))
+
+
+    def search_incidents(
+        self,
+        terms=(),
+        show_closed=False,
+        since=None,
+        until=None,
+        before=None,
+        limit=None,
+    ):
+        if terms:
+            # Writes update the index in place.
+            with self._state_lock:
+                matching = self.search_index().search_all(terms)
+        else:
+            matching = None
+
+        sql = ["select number, etag from incident"]
+        where = []
+        args = []
+
+        #
+        # Filter out closed incidents if appropriate
+        #
+        if not show_closed:
+            where.append("closed is null")
+
+        #
+        # Filter out incidents with no report entries in the given time range
+        #
+        if since is not None or until is not None:
+            entry_where = ["incident_number = number"]
+
+            if since is not None:
+                # Timestamps are stored with a resolution of one second
+                if since.microsecond:
+                    since = (
+                        since.replace(microsecond=0) + TimeDelta(seconds=1)
+                    )
+                entry_where.append("created >= ?")
+                args.append(render_date(since))
+
+            if until is not None:
+                entry_where.append("created <= ?")
+                args.append(render_date(until))
+
+            where.append(
+                "exists (select 1 from report_entry where {0})"
+                .format(" and ".join(entry_where))
+            )
+
+        if before is not None:
+            where.append("number < ?")
+            args.append(before)
+
+        if where:
+            sql.append("where")
+            sql.append(" and ".join(where))
+
+        sql.append("order by number desc")
+
+        # Search terms are matched here, so the database can only apply the
+        # limit if there are none.
+        if limit is not None and matching is None:
+            sql.append("limit ?")
+            args.append(limit)
+
+        count = 0
+        for number, etag in self._query(" ".join(sql), *args):
+            if limit is not None and count >= limit:
+                break
+            if matching is not None and number not in matching:
+                continue
+            count += 1
+            yield (number, str(etag))
+
+
+    def _read_etag(self, number):
+        for (etag,) in self._query(
+            "select etag from incident where number = ?", number
+        ):
+            return str(etag)
+        return None
+
+
+    def read_incident_with_number_raw(self, number):
+        incident = self.read_incident_with_number(number)
+        return incident.to_json_data()
+
+
+    def _read_incident(self, number):
+        with self._lock:
+            rows = self._query(
+                """
+                select
+                    priority, summary, location_name, location_address,
+                    created, dispatched, on_scene, closed
+                from incident where number = ?
+                """,
+                number
+            )
+            if not rows:
+                raise NoSuchIncidentError(number)
+
+            (
+                priority, summary, location_name, location_address,
+                created, dispatched, on_scene, closed
+            ) = rows[0]
+
+            incident_types = [
+                name for (name,) in self._query(
+                    "select name from incident_type "
+                    "where incident_number = ? order by position",
+                    number
+                )
+            ]
+
+            rangers = [
+                Ranger(handle, None, None) for (handle,) in self._query(
+                    "select handle from ranger_assignment "
+                    "where incident_number = ? order by position",
+                    number
+                )
+            ]
+
+            report_entries = [
+                ReportEntry(
+                    author=author,
+                    text=text,
+                    created=parse_date(entry_created),
+                    system_entry=system_entry,
+                )
+                for (author, text, entry_created, system_entry)
+                in self._query(
+                    "select author, text, created, system_entry "
+                    "from report_entry "
+                    "where incident_number = ? order by position",
+                    number
+                )
+            ]
+
+        incident = Incident(
+            number=number,
+            priority=priority,
+            summary=summary,
+            location=Location(name=location_name, address=location_address),
+            rangers=rangers,
+            incident_types=incident_types,
+            report_entries=report_entries,
+            created=parse_date(created),
+            dispatched=parse_date(dispatched),
+            on_scene=parse_date(on_scene),
+            closed=parse_date(closed),
+        )
+
+        incident.validate()
+
+        return incident
+
+
+
+class SQLiteStorage(ReadOnlySQLiteStorage, Storage):
+    """
+    SQLite back-end storage which supports writes.
+    """
+
+    def _write_incident_data(self, incident, data):
+        number = incident.number
+
+        if incident.incident_types is None:
+            incident_types = ()
+        else:
+            incident_types = incident.incident_types
+
+        with self._lock:
+            database = self._database()
+
+            with database:
+                for table in (
+                    "incident_type", "ranger_assignment", "report_entry"
+                ):
+                    database.execute(
+                        "delete from {0} where incident_number = ?"
+                        .format(table),
+                        (number,)
+                    )
+
+                database.execute(
+                    """
+                    insert or replace into incident (
+                        number, priority, summary,
+                        location_name, location_address,
+                        created, dispatched, on_scene, closed,
+                        etag
+                    )
+                    values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        number,
+                        incident.priority,
+                        incident.summary,
+                        incident.location.name,
+                        incident.location.address,
+                        render_date(incident.created),
+                        render_date(incident.dispatched),
+                        render_date(incident.on_scene),
+                        render_date(incident.closed),
+                        etag_hash(data).hexdigest(),
+                    )
+                )
+
+                database.executemany(
+                    "insert into incident_type "
+                    "(incident_number, position, name) values (?, ?, ?)",
+                    (
+                        (number, position, name)
+                        for position, name in enumerate(incident_types)
+                    )
+                )
+
+                database.executemany(
+                    "insert into ranger_assignment "
+                    "(incident_number, position, handle) values (?, ?, ?)",
+                    (
+                        (number, position, ranger.handle)
+                        for position, ranger in enumerate(incident.rangers)
+                    )
+                )
+
+                database.executemany(
+                    "insert into report_entry ("
+                    "incident_number, position, "
+                    "author, text, created, system_entry"
+                    ") values (?, ?, ?, ?, ?, ?)",
+                    (
+                        (
+                            number, position,
+                            entry.author, entry.text,
+                            render_date(entry.created), entry.system_entry,
+                        )
+                        for position, entry
+                        in enumerate(incident.report_entries)
+                    )
+                )
+
+
+    def _write_etag(self, number, etag):
+        # Etags are stored along with the incident.
+        pass
+
+
+
+def migrate(source, destination):
+    """
+    Copy the incidents in a file store into a SQLite store.
+
+    @param source: The directory containing the file store.
+    @type source: L{FilePath}
+
+    @param destination: The directory containing the SQLite store.  It
+        may not be the file store's directory, where the database would be
+        mistaken for an invalid incident file.
+    @type destination: L{FilePath}
+
+    @return: The number of incidents copied.
+    @rtype: L{int}
+
+    @raise: L{StorageError} if C{destination} is the same as C{source}.
+    """
+    if os.path.realpath(source.path) == os.path.realpath(destination.path):
+        raise StorageError(
+            "SQLite store may not be in the file store's directory: {0}"
+            .format(source.path)
+        )
+
+    source_store = ReadOnlyStorage(source)
+    destination_store = SQLiteStorage(destination)
+
+    count = 0
+    try:
+        for number, etag in sorted(source_store.list_incidents()):
+            destination_store.write_incident(
+                source_store.read_incident_with_number(number)
+            )
+            count += 1
+    finally:
+        destination_store.close()
+
+    return count
+
+
+
+def main(argv):
+    if len(argv) != 3:
+        sys.stderr.write(
+            "Usage: {0} source_data_root destination_data_root\n"
+            .format(os.path.basename(argv[0]))
+        )
+        return 64
+
+    source = FilePath(argv[1])
+    destination = FilePath(argv[2])
+
+    try:
+        count = migrate(source, destination)
+    except StorageError as e:
+        sys.stderr.write("{0}\n".format(e))
+        return 1
+
+    print "Copied {0} incidents to {1}".format(
+        count, destination.child(database_name).path
+    )
+
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
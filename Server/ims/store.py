@@ -21,15 +21,26 @@ Data store
 __all__ = [
     "StorageError",
     "NoSuchIncidentError",
+    "IncidentModifiedError",
     "ReadOnlyStorage",
     "Storage",
+    "convert",
 ]
 
+import os
+import sys
+from bisect import bisect_left
+from collections import OrderedDict
 from hashlib import sha1 as etag_hash
+from threading import Condition, RLock
+from time import sleep, time
 
 from twisted.python import log
-from twisted.python.filepath import UnlistableError
-from ims.data import Incident
+from twisted.python.filepath import FilePath, UnlistableError
+from ims.data import InvalidDataError
+from ims.binary import data_formats, is_binary
+from ims.binary import incident_from_data, incident_to_data
+from ims.index import SearchIndex, AttributeIndex, TimeIndex, open_states
 
 
 
@@ -47,15 +58,148 @@ class NoSuchIncidentError(StorageError):
 
 
 
+class IncidentModifiedError(StorageError):
+    """
+    Incident was modified by someone else.
+    """
+
+
+
+def fsync_directory(path):
+    """
+    Flush a directory's entries to disk, so that files renamed into it
+    persist.
+
+    @param path: The directory.
+    @type path: L{FilePath}
+    """
+    fd = os.open(path.path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+
+class GroupCommit(object):
+    """
+    Shares directory syncs between concurrent writers.
+
+    The first writer to ask for a sync waits for the commit window, so that
+    other writers can join it, then syncs the directory once on behalf of
+    every writer that asked before the sync started.  Writers that ask
+    while a sync is in progress are covered by the next one.
+    """
+
+    def __init__(self, path, window=0.0):
+        """
+        @param path: The directory to sync.
+        @type path: L{FilePath}
+
+        @param window: How long, in seconds, to wait for other writers
+            before syncing.
+        @type window: L{float}
+        """
+        self.path = path
+        self.window = window
+        self.syncs = 0
+
+        self._condition = Condition()
+        self._requested = 0
+        self._synced = 0
+        self._syncing = False
+
+
+    def sync(self):
+        """
+        Block until the directory has been synced since this call was made.
+        """
+        condition = self._condition
+
+        condition.acquire()
+        try:
+            self._requested += 1
+            ticket = self._requested
+
+            while self._synced < ticket:
+                if self._syncing:
+                    condition.wait()
+                    continue
+
+                self._syncing = True
+                try:
+                    condition.release()
+                    try:
+                        if self.window:
+                            sleep(self.window)
+
+                        condition.acquire()
+                        try:
+                            covered = self._requested
+                        finally:
+                            condition.release()
+
+                        fsync_directory(self.path)
+                    finally:
+                        condition.acquire()
+
+                    self._synced = covered
+                    self.syncs += 1
+                finally:
+                    self._syncing = False
+                    condition.notify_all()
+        finally:
+            condition.release()
+
+
+
 class ReadOnlyStorage(object):
     """
     Back-end storage
     """
 
-    def __init__(self, path):
+    def __init__(self, path, cache_size=0):
+        """
+        @param path: The directory containing the incident data.
+        @type path: L{FilePath}
+
+        @param cache_size: The maximum number of parsed incidents to keep in
+            memory.  If C{0}, parsed incidents are not cached.
+        @type cache_size: L{int}
+        """
         self.path = path
+
+        # Guards the in-memory state below, which may be shared by threads
+        # (see L{ims.asyncstore.AsyncStorage}).
+        self._state_lock = RLock()
+
+        # Incident number -> [lock, number of threads using it]; see
+        # L{Storage.update_incident}.
+        self._incident_locks = {}
+
+        # Incident number -> (sequence, etag) of its latest change, in order
+        # of sequence; see L{changes_since}.  Sequences start from the time
+        # (in microseconds) that this object was created, so that they keep
+        # increasing when the server is restarted.
+        self._first_change = self._change_sequence = int(time() * 1000000)
+        self._changes = OrderedDict()
+        self._change_subscribers = []
+
         self.incidents = None
         self.incident_etags = {}
+
+        # The numbers in self.incidents, in order.
+        self._sorted_numbers = None
+
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._incident_cache = OrderedDict()
+
+        self._search_index = None
+        self._attribute_index = None
+        self._time_index = None
+
         log.msg("New data store: {0}".format(self))
 
 
@@ -64,6 +208,11 @@ class ReadOnlyStorage(object):
 
 
     def provision(self):
+        with self._state_lock:
+            self._provision()
+
+
+    def _provision(self):
         if hasattr(self, "_max_incident_number"):
             return
 
@@ -128,94 +277,221 @@ class ReadOnlyStorage(object):
             pass
 
 
+    def _known_incidents(self):
+        with self._state_lock:
+            if self.incidents is None:
+                incidents = {}
+                for number in self._list_incidents():
+                    # Here we cache that the number exists, but not the
+                    # incident itself.
+                    incidents[number] = None
+                self.incidents = incidents
+
+            return self.incidents
+
+
     def list_incidents(self):
-        if self.incidents is None:
-            incidents = {}
-            for number in self._list_incidents():
-                # Here we cache that the number exists, but not the incident
-                # itself.
-                incidents[number] = None
-            self.incidents = incidents
-
-        for number in self.incidents:
+        with self._state_lock:
+            numbers = list(self._known_incidents())
+
+        for number in numbers:
             yield (number, self.etag_for_incident_with_number(number))
 
 
+    def _incident_numbers(self):
+        """
+        Get the numbers of the incidents in this store, in order.  The list
+        is kept up to date as incidents are written, so don't modify it, and
+        only use it while holding C{self._state_lock}.
+
+        @rtype: L{list} of L{int}
+        """
+        with self._state_lock:
+            if self._sorted_numbers is None:
+                self._sorted_numbers = sorted(self._known_incidents())
+
+            return self._sorted_numbers
+
+
     def search_incidents(
         self,
         terms=(),
         show_closed=False,
         since=None,
         until=None,
+        before=None,
+        limit=None,
     ):
+        """
+        Find incidents matching search terms and filters.
+
+        @param terms: Search terms which must all match.
+        @type terms: iterable of L{unicode}
+
+        @param show_closed: Whether to include closed incidents.
+        @type show_closed: L{bool}
+
+        @param since: If not C{None}, only include incidents with report
+            entries created at or after this time.
+        @type since: L{DateTime}
+
+        @param until: If not C{None}, only include incidents with report
+            entries created at or before this time.
+        @type until: L{DateTime}
+
+        @param before: If not C{None}, only include incidents with numbers
+            less than this.
+        @type before: L{int}
+
+        @param limit: If not C{None}, stop after this many incidents.
+        @type limit: L{int}
+
+        @return: C{(number, etag)} tuples for the matching incidents, highest
+            number first.
+        @rtype: iterable of (L{int}, L{str}) tuples
+        """
         #log.msg("Searching for {0!r}, closed={1}".format(terms, show_closed))
 
-        #
-        # Brute force implementation for now.
-        #
-
-        def search_strings_from_incident(incident):
-            yield incident.summary
-            yield incident.location.name
-            yield incident.location.address
-            for incident_type in incident.incident_types:
-                yield incident_type
-            for ranger in incident.rangers:
-                yield ranger.handle
-            for entry in incident.report_entries:
-                yield entry.text
-
-        def in_time_bounds(when):
-            if since is not None and when < since:
-                return False
-            if until is not None and when > until:
-                return False
-            return True
-
-        for (number, etag) in self.list_incidents():
-            incident = self.read_incident_with_number(number)
+        with self._state_lock:
+            if terms:
+                matching = self.search_index().search_all(terms)
+            else:
+                matching = None
 
             #
             # Filter out closed incidents if appropriate
             #
-            if not show_closed and incident.closed:
-                continue
+            if not show_closed:
+                open_numbers = self.attribute_index().query(state=open_states)
+                if matching is None:
+                    matching = open_numbers
+                else:
+                    matching &= open_numbers
 
             #
-            # Filter out incidents outside of the given time range
+            # Filter out incidents with no report entries in the given time
+            # range
             #
             if since is not None or until is not None:
-                for entry in incident.report_entries:
-                    if in_time_bounds(entry.created):
-                        break
+                in_range = self.time_index().search(
+                    since, until, kinds=("entry",)
+                )
+                if matching is None:
+                    matching = in_range
                 else:
-                    continue
+                    matching &= in_range
 
             #
-            # Filter out incidents that don't match the given search terms
+            # Walk the incident numbers down from the cursor, so that a page
+            # of results doesn't cost more than it has to
             #
+            numbers = self._incident_numbers()
 
-            for term in terms:
-                for string in search_strings_from_incident(incident):
-                    if string is None:
-                        continue
-                    if term.lower() in string.lower():
-                        break
-                else:  # Didn't match term
-                    break
+            if before is None:
+                index = len(numbers)
             else:
-                yield (number, etag)
+                index = bisect_left(numbers, before)
+
+            selected = []
+            while index > 0 and (limit is None or len(selected) < limit):
+                index -= 1
+                number = numbers[index]
+                if matching is None or number in matching:
+                    selected.append(number)
+
+        for number in selected:
+            yield (number, self.etag_for_incident_with_number(number))
+
+
+    def search_index(self):
+        """
+        Get the search index for the incidents in this store, building it
+        if necessary.
+
+        @return: The search index.
+        @rtype: L{SearchIndex}
+        """
+        with self._state_lock:
+            if self._search_index is None:
+                self._search_index = self._build_index(SearchIndex())
+
+            return self._search_index
+
+
+    def attribute_index(self):
+        """
+        Get the index of incident states, types, rangers and priorities for
+        the incidents in this store, building it if necessary.
+
+        @return: The attribute index.
+        @rtype: L{AttributeIndex}
+        """
+        with self._state_lock:
+            if self._attribute_index is None:
+                self._attribute_index = self._build_index(AttributeIndex())
+
+            return self._attribute_index
+
+
+    def time_index(self):
+        """
+        Get the index of report entry and state times for the incidents in
+        this store, building it if necessary.
+
+        @return: The time index.
+        @rtype: L{TimeIndex}
+        """
+        with self._state_lock:
+            if self._time_index is None:
+                self._time_index = self._build_index(TimeIndex())
+
+            return self._time_index
+
+
+    def _build_index(self, index):
+        for number, etag in self.list_incidents():
+            # One bad incident shouldn't make every query fail.
+            try:
+                incident = self.read_incident_with_number(number)
+            except (InvalidDataError, StorageError, ValueError) as e:
+                log.err(
+                    "Unable to index incident {0}: {1}".format(number, e)
+                )
+                continue
+            index.add(incident)
+        return index
+
+
+    def query_incidents(self, **criteria):
+        """
+        Find incidents by state, incident type, ranger handle and priority.
+        See L{AttributeIndex.query}.
+
+        @return: The numbers of the matching incidents.
+        @rtype: L{set} of L{int}
+        """
+        with self._state_lock:
+            return self.attribute_index().query(**criteria)
 
 
     def etag_for_incident_with_number(self, number):
-        if number in self.incident_etags:
-            return self.incident_etags[number]
+        number = self._incident_number(number)
 
-        data = self.read_incident_with_number_raw(number)
-        etag = etag_hash(data).hexdigest()
+        with self._state_lock:
+            etag = self.incident_etags.get(number, None)
+        if etag is not None:
+            return etag
+
+        etag = self._read_etag(number)
+
+        if etag is None:
+            data = self.read_incident_with_number_raw(number)
+            etag = etag_hash(data).hexdigest()
+            self._write_etag(number, etag)
 
         if etag:
-            self.incident_etags[number] = etag
+            with self._state_lock:
+                self.incident_etags[number] = etag
             return etag
         else:
             raise StorageError(
@@ -223,6 +499,132 @@ class ReadOnlyStorage(object):
             )
 
 
+    def changes_since(self, sequence):
+        """
+        Find the incidents that have been written since a point in the
+        sequence of changes to this store.
+
+        @param sequence: A sequence number previously returned by this
+            method or given to a subscriber (see L{subscribe}), or C{None}.
+        @type sequence: L{int}
+
+        @return: The current sequence number and C{(number, etag, sequence)}
+            tuples for the incidents changed after C{sequence}, in order of
+            sequence.  An incident that has changed more than once is only
+            included once, with its latest etag.  If C{sequence} is C{None},
+            there are no changes.  If C{sequence} was not issued by this
+            object (for example, if it was issued before the server was
+            restarted), the changes are C{None}, and the caller should assume
+            that anything may have changed.
+        @rtype: 2-L{tuple} of L{int} and L{list}
+        """
+        with self._state_lock:
+            current = self._change_sequence
+
+            if sequence is None:
+                return (current, [])
+
+            if not self._first_change <= sequence <= current:
+                return (current, None)
+
+            changes = []
+            for number in reversed(self._changes):
+                change_sequence, etag = self._changes[number]
+                if change_sequence <= sequence:
+                    break
+                changes.append((number, etag, change_sequence))
+
+        changes.reverse()
+        return (current, changes)
+
+
+    def subscribe(self, subscriber):
+        """
+        Arrange to be told about writes to this store.
+
+        @param subscriber: A callable which is called with the number, etag
+            and sequence number (see L{changes_since}) of each incident that
+            is written, in the thread that wrote it, after it is written.
+        @type subscriber: callable
+        """
+        with self._state_lock:
+            self._change_subscribers.append(subscriber)
+
+
+    def unsubscribe(self, subscriber):
+        """
+        Stop telling a subscriber about writes to this store.
+
+        @param subscriber: A callable given to L{subscribe}.
+        @type subscriber: callable
+        """
+        with self._state_lock:
+            self._change_subscribers.remove(subscriber)
+
+
+    def _record_change(self, number, etag):
+        with self._state_lock:
+            self._change_sequence += 1
+            sequence = self._change_sequence
+
+            # Move the incident to the end, so that changes stay in order.
+            self._changes.pop(number, None)
+            self._changes[number] = (sequence, etag)
+
+            subscribers = tuple(self._change_subscribers)
+
+        for subscriber in subscribers:
+            try:
+                subscriber(number, etag, sequence)
+            except Exception:
+                log.err(None, "Error notifying subscriber of change")
+
+
+    def _incident_number(self, number):
+        try:
+            return int(number)
+        except ValueError:
+            raise NoSuchIncidentError(number)
+
+
+    def _read_etag(self, number):
+        """
+        Read the persisted etag for an incident.
+
+        @return: The etag, or C{None} if there is no persisted etag or it is
+            older than the incident data.
+        """
+        etag_fp = self._incident_fp(number, "etag")
+        incident_fp = self._incident_fp(number)
+
+        try:
+            if (
+                etag_fp.getModificationTime() <
+                incident_fp.getModificationTime()
+            ):
+                # Incident was modified by someone else
+                return None
+            etag = etag_fp.getContent().strip()
+        except (IOError, OSError):
+            return None
+
+        if len(etag) != etag_hash().digest_size * 2:
+            log.err(
+                "Invalid etag for incident {0}: {1!r}".format(number, etag)
+            )
+            return None
+
+        return etag
+
+
+    def _write_etag(self, number, etag):
+        """
+        Persist the etag for an incident.
+        This is a no-op for read-only storage.
+        """
+        pass
+
+
     def read_incident_with_number_raw(self, number):
         handle = self._open_incident(number, "r")
         try:
@@ -233,42 +635,329 @@ class ReadOnlyStorage(object):
 
 
     def read_incident_with_number(self, number):
-        handle = self._open_incident(number, "r")
+        number = self._incident_number(number)
+
+        incident = self._cached_incident(number)
+        if incident is not None:
+            return incident
+
+        incident = self._read_incident(number)
+
+        self._cache_incident(incident)
+
+        return incident
+
+
+    def _read_incident(self, number):
+        # Report entries are only needed by some callers; listing and
+        # aggregating incidents usually only look at the other fields.
+        return incident_from_data(
+            self.read_incident_with_number_raw(number), number=number,
+            lazy=True,
+        )
+
+
+    def _cached_incident(self, number):
+        if not self.cache_size:
+            return None
+
+        with self._state_lock:
+            try:
+                incident = self._incident_cache.pop(number)
+            except KeyError:
+                self.cache_misses += 1
+                return None
+
+            # Re-insert to mark as most recently used
+            self._incident_cache[number] = incident
+            self.cache_hits += 1
+
+        return incident
+
+
+    def _cache_incident(self, incident):
+        if not self.cache_size:
+            return
+
+        cache = self._incident_cache
+
+        with self._state_lock:
+            cache.pop(incident.number, None)
+            cache[incident.number] = incident
+
+            while len(cache) > self.cache_size:
+                # Evict the least recently used incident
+                cache.popitem(last=False)
+
+
+    def _uncache_incident(self, number):
+        with self._state_lock:
+            self._incident_cache.pop(number, None)
+
+
+
+class Storage(ReadOnlyStorage):
+    # Subclasses that store incidents themselves always write JSON.
+    data_format = "json"
+
+
+    def __init__(
+        self, path, cache_size=0, sync=True, group_commit=None,
+        data_format="json",
+    ):
+        """
+        @param sync: If true, flush incident data and the directory entry
+            for it to disk before returning from a write.
+        @type sync: L{bool}
+
+        @param group_commit: If not C{None}, concurrent writes share
+            directory syncs, waiting up to this many seconds for each other
+            (see L{GroupCommit}).  Otherwise, each write syncs the directory
+            itself.
+        @type group_commit: L{float}
+
+        @param data_format: The format to write incidents in; one of
+            L{ims.binary.data_formats}.  Incidents in any format can be read.
+        @type data_format: L{str}
+        """
+        if data_format not in data_formats:
+            raise StorageError(
+                "Unknown data format: {0!r}".format(data_format)
+            )
+
+        ReadOnlyStorage.__init__(self, path, cache_size=cache_size)
+
+        self.sync = sync
+        self.data_format = data_format
+
+        if group_commit is None:
+            self._group_commit = None
+        else:
+            self._group_commit = GroupCommit(path, window=group_commit)
+
+
+    def update_incident(self, number, edit, etags=None):
+        """
+        Read an incident, change it, and write it back.  No other write to
+        the same incident happens in between; writes to other incidents are
+        not held up.
+
+        @param number: The number of the incident to change.
+        @type number: L{int}
+
+        @param edit: A callable which is given a copy of the incident and
+            returns the changed incident.  Other readers keep seeing the
+            incident as it was until the change has been written.
+        @type edit: callable
+
+        @param etags: If not C{None}, the incident's current etag must be
+            one of these, otherwise L{IncidentModifiedError} is raised and
+            the incident is left alone.
+        @type etags: iterable of L{str}
+
+        @return: The etag of the changed incident.
+        @rtype: L{str}
+        """
+        number = self._incident_number(number)
+
+        self._lock_incident(number)
         try:
-            return Incident.from_json_io(handle, number=number)
+            if etags is not None:
+                if self.etag_for_incident_with_number(number) not in etags:
+                    raise IncidentModifiedError(number)
+
+            self.write_incident(
+                edit(self.read_incident_with_number(number).copy())
+            )
+
+            return self.etag_for_incident_with_number(number)
         finally:
-            handle.close()
+            self._unlock_incident(number)
 
 
+    def _lock_incident(self, number):
+        with self._state_lock:
+            entry = self._incident_locks.get(number, None)
+            if entry is None:
+                entry = self._incident_locks[number] = [RLock(), 0]
+            entry[1] += 1
+
+        entry[0].acquire()
+
+
+    def _unlock_incident(self, number):
+        with self._state_lock:
+            entry = self._incident_locks[number]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del self._incident_locks[number]
+
 
-class Storage(ReadOnlyStorage):
     def write_incident(self, incident):
-        incident.validate()
+        self._lock_incident(incident.number)
+        try:
+            self._write_incident(incident)
+        finally:
+            self._unlock_incident(incident.number)
 
-        self.provision()
 
+    def _write_incident(self, incident):
         number = incident.number
 
-        incident_fh = self._open_incident(number, "w")
         try:
-            incident_fh.write(incident.to_json_text())
-        finally:
-            incident_fh.close()
+            incident.validate()
+
+            self.provision()
+
+            data = incident_to_data(incident, self.data_format)
+            self._write_incident_data(incident, data)
+
+            etag = etag_hash(data).hexdigest()
+            with self._state_lock:
+                self.incident_etags[number] = etag
+            self._write_etag(number, etag)
+        except:
+            # The incident may be a cached one that the caller modified in
+            # place; don't keep serving changes that didn't make it to disk.
+            with self._state_lock:
+                self._uncache_incident(number)
+                self.incident_etags.pop(number, None)
+            raise
 
-        if self.incidents is not None:
-            self.incidents[number] = None
+        with self._state_lock:
+            self._cache_incident(incident)
+
+            if self._search_index is not None:
+                self._search_index.add(incident)
+
+            if self._attribute_index is not None:
+                self._attribute_index.add(incident)
+
+            if self._time_index is not None:
+                self._time_index.add(incident)
+
+            if self.incidents is not None:
+                self.incidents[number] = None
+
+            numbers = self._sorted_numbers
+            if numbers is not None:
+                index = bisect_left(numbers, number)
+                if index == len(numbers) or numbers[index] != number:
+                    numbers.insert(index, number)
+
+            if number > self._max_incident_number:
+                self._max_incident_number = number
+
+        self._record_change(number, etag)
+
+
+    def _write_incident_data(self, incident, data):
+        # Write to a temporary file and rename it into place, so that a
+        # crash never leaves a partially written incident behind.  The
+        # temporary file's name starts with "." so it isn't listed as an
+        # incident.
+        number = incident.number
+        incident_fp = self._incident_fp(number)
+        temp_fp = self._incident_fp(number, "new")
+
+        try:
+            with temp_fp.open("w") as handle:
+                handle.write(data)
+                handle.flush()
+                if self.sync:
+                    os.fsync(handle.fileno())
+
+            os.rename(temp_fp.path, incident_fp.path)
+        except (IOError, OSError) as e:
+            try:
+                temp_fp.remove()
+            except (IOError, OSError):
+                pass
+            raise StorageError(
+                "Unable to write incident {0}: {1}".format(number, e)
+            )
 
-        # Clear the cached etag
-        if number in self.incident_etags:
-            del self.incident_etags[number]
+        if self.sync:
+            try:
+                if self._group_commit is None:
+                    fsync_directory(self.path)
+                else:
+                    self._group_commit.sync()
+            except (IOError, OSError) as e:
+                raise StorageError(
+                    "Unable to sync incident {0}: {1}".format(number, e)
+                )
 
-        self.incidents[number] = None
 
-        if number > self._max_incident_number:
-            self._max_incident_number = number
+    def _write_etag(self, number, etag):
+        etag_fp = self._incident_fp(number, "etag")
+        try:
+            etag_fp.setContent(etag)
+        except (IOError, OSError) as e:
+            log.err(
+                "Unable to write etag for incident {0}: {1}"
+                .format(number, e)
+            )
 
 
     def next_incident_number(self):
-        self.provision()
-        self._max_incident_number += 1
-        return self._max_incident_number
+        with self._state_lock:
+            self.provision()
+            self._max_incident_number += 1
+            return self._max_incident_number
+
+
+
+def convert(path, data_format):
+    """
+    Rewrite the incidents in a file store in the given format.  Incidents
+    that are already in that format are left alone.
+
+    @param path: The directory containing the file store.
+    @type path: L{FilePath}
+
+    @param data_format: The format to convert to; one of
+        L{ims.binary.data_formats}.
+    @type data_format: L{str}
+
+    @return: The number of incidents converted.
+    @rtype: L{int}
+    """
+    storage = Storage(path, data_format=data_format)
+
+    count = 0
+    for number, etag in sorted(storage.list_incidents()):
+        data = storage.read_incident_with_number_raw(number)
+        if is_binary(data) == (data_format == "binary"):
+            continue
+
+        storage.write_incident(storage.read_incident_with_number(number))
+        count += 1
+
+    return count
+
+
+
+def main(argv):
+    if len(argv) != 3 or argv[1] not in data_formats:
+        sys.stderr.write(
+            "Usage: {0} {{{1}}} data_root\n"
+            .format(os.path.basename(argv[0]), ",".join(data_formats))
+        )
+        return 64
+
+    data_format, path = argv[1], FilePath(argv[2])
+
+    count = convert(path, data_format)
+
+    print "Converted {0} incidents in {1} to {2}".format(
+        count, path.path, data_format
+    )
+
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
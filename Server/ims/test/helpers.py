@@ -0,0 +1,139 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Helpers shared by tests.
+"""
+
+__all__ = [
+    "sourceRoot",
+    "incidentsArchive",
+    "corpus",
+    "extract_corpus",
+    "incident",
+    "StorageTestsMixin",
+]
+
+import tarfile
+
+from twisted.python.filepath import FilePath
+
+from ims.data import Incident, Location, Ranger
+
+
+
+sourceRoot = FilePath(__file__).parent().parent().parent()
+
+incidentsArchive = sourceRoot.child("test").child("incidents.tgz")
+
+
+
+def corpus():
+    """
+    Read the sample incidents.
+
+    @return: C{(number, data)} tuples for each sample incident, where
+        C{data} is the incident's JSON text.
+    @rtype: iterable of (L{int}, L{bytes}) tuples
+    """
+    archive = tarfile.open(incidentsArchive.path)
+    try:
+        for member in archive.getmembers():
+            if member.isfile():
+                yield (
+                    int(member.name.split("/")[-1]),
+                    archive.extractfile(member).read(),
+                )
+    finally:
+        archive.close()
+
+
+def extract_corpus(path):
+    """
+    Write the sample incidents into a directory, as a file store.
+
+    @param path: The directory, which is created if necessary.
+    @type path: L{FilePath}
+    """
+    if not path.exists():
+        path.createDirectory()
+
+    archive = tarfile.open(incidentsArchive.path)
+    try:
+        archive.extractall(path.path)
+    finally:
+        archive.close()
+
+
+def incident(number, summary=u"Something happened"):
+    """
+    Create a simple incident.
+
+    @param number: The number of the incident.
+    @type number: L{int}
+
+    @param summary: The summary of the incident.
+    @type summary: L{unicode}
+
+    @rtype: L{Incident}
+    """
+    return Incident(
+        number=number,
+        rangers=(Ranger(u"Tulsa", None, None),),
+        location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+        incident_types=(u"Medical",),
+        summary=summary,
+        report_entries=(),
+    )
+
+
+
+class StorageTestsMixin(object):
+    """
+    Mixin for L{twisted.trial.unittest.TestCase}s that test a storage class.
+    """
+
+    # The storage class to test, and default keyword arguments for it
+    storage_class = None
+    storage_kwargs = {}
+
+
+    def storage(self, path=None, **kwargs):
+        """
+        Create a store, which is closed when the test is done.
+
+        @param path: The directory for the store.  If C{None}, a new
+            temporary directory.
+        @type path: L{FilePath}
+
+        @return: The store.
+        """
+        if path is None:
+            path = FilePath(self.mktemp())
+
+        for key, value in self.storage_kwargs.iteritems():
+            kwargs.setdefault(key, value)
+
+        store = self.storage_class(path, **kwargs)
+
+        if hasattr(store, "close"):
+            self.addCleanup(store.close)
+
+        return store
+
+
+    def incident(self, number, summary=u"Something happened"):
+        return incident(number, summary)
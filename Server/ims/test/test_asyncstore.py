@@ -0,0 +1,250 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.asyncstore}.
+"""
+
+from threading import current_thread
+
+import twisted.trial.unittest
+from twisted.internet.defer import Deferred, inlineCallbacks
+
+from ims.store import NoSuchIncidentError, Storage
+from ims.asyncstore import AsyncStorage
+from ims.test.helpers import StorageTestsMixin
+
+
+
+class AsyncStoreTests(StorageTestsMixin, twisted.trial.unittest.TestCase):
+    """
+    Tests for L{ims.asyncstore.AsyncStorage}
+    """
+
+    storage_class = Storage
+    storage_kwargs = dict(sync=False)
+
+
+    def storage(self, max_threads=2):
+        storage = StorageTestsMixin.storage(self)
+        async_storage = AsyncStorage(storage, max_threads=max_threads)
+        self.addCleanup(async_storage.stop)
+        return async_storage
+
+
+    @inlineCallbacks
+    def test_write_read(self):
+        """
+        Incidents can be written and read back.
+        """
+        storage = self.storage()
+
+        number = yield storage.next_incident_number()
+        yield storage.write_incident(self.incident(number))
+
+        incident = yield storage.read_incident_with_number(number)
+        self.assertEquals(incident, self.incident(number))
+
+        incidents = yield storage.list_incidents()
+        self.assertEquals([n for n, etag in incidents], [number])
+
+
+    @inlineCallbacks
+    def test_update(self):
+        """
+        L{AsyncStorage.update_incident} edits an incident in a storage
+        thread, and results in its new etag.
+        """
+        storage = self.storage()
+        yield storage.write_incident(self.incident(1))
+
+        def edit(incident):
+            threads.append(current_thread())
+            incident.summary = u"Something else"
+            return incident
+
+        threads = []
+        etag = yield storage.update_incident(1, edit)
+
+        self.assertNotEquals(threads, [current_thread()])
+        self.assertEquals(
+            (yield storage.etag_for_incident_with_number(1)), etag
+        )
+        self.assertEquals(
+            (yield storage.read_incident_with_number(1)),
+            self.incident(1, summary=u"Something else"),
+        )
+
+
+    @inlineCallbacks
+    def test_read_incidents(self):
+        """
+        L{AsyncStorage.read_incidents} reads the given incidents, or all of
+        them.
+        """
+        storage = self.storage()
+        for number in (1, 2, 3):
+            yield storage.write_incident(self.incident(number))
+
+        incidents = yield storage.read_incidents((3, 1))
+        self.assertEquals([i.number for i in incidents], [3, 1])
+
+        incidents = yield storage.read_incidents()
+        self.assertEquals(
+            sorted(i.number for i in incidents), [1, 2, 3]
+        )
+
+
+    @inlineCallbacks
+    def test_read_incidents_report_entries(self):
+        """
+        L{AsyncStorage.read_incidents} creates the incidents' report entries
+        in the thread pool if asked to, and otherwise leaves them to be
+        created when they are first used.
+        """
+        storage = self.storage()
+        yield storage.write_incident(self.incident(1))
+
+        [incident] = yield storage.read_incidents((1,))
+        self.assertNotEquals(incident._lazy_report_entries, None)
+
+        [incident] = yield storage.read_incidents((1,), report_entries=True)
+        self.assertEquals(incident._lazy_report_entries, None)
+
+
+    @inlineCallbacks
+    def test_read_incidents_with_etags(self):
+        """
+        L{AsyncStorage.read_incidents_with_etags} reads the given incidents
+        and their etags, with C{None} for missing incidents.
+        """
+        storage = self.storage()
+        for number in (1, 2):
+            yield storage.write_incident(self.incident(number))
+
+        incidents = yield storage.read_incidents_with_etags((2, 3, 1))
+        self.assertEquals(
+            incidents,
+            [
+                (
+                    2, (yield storage.etag_for_incident_with_number(2)),
+                    self.incident(2),
+                ),
+                (3, None, None),
+                (
+                    1, (yield storage.etag_for_incident_with_number(1)),
+                    self.incident(1),
+                ),
+            ]
+        )
+
+
+    @inlineCallbacks
+    def test_read_incidents_with_etags_write(self):
+        """
+        L{AsyncStorage.read_incidents_with_etags} doesn't pair the etag of an
+        incident with an older version of the incident when the incident is
+        written while it is being read.
+        """
+        storage = self.storage(max_threads=0)
+        yield storage.write_incident(self.incident(1, u"Old"))
+
+        # Write a new version of the incident between the two reads
+        writes = []
+
+        def write_first(f):
+            def read(number):
+                result = f(number)
+                if not writes:
+                    writes.append(number)
+                    storage.storage.write_incident(self.incident(1, u"New"))
+                return result
+            return read
+
+        for name in (
+            "etag_for_incident_with_number", "read_incident_with_number"
+        ):
+            self.patch(
+                storage.storage, name,
+                write_first(getattr(storage.storage, name))
+            )
+
+        [(number, etag, incident)] = (
+            yield storage.read_incidents_with_etags((1,))
+        )
+        self.assertEquals(writes, [1])
+
+        if etag == storage.storage.etag_for_incident_with_number(1):
+            self.assertEquals(incident.summary, u"New")
+
+
+    @inlineCallbacks
+    def test_threads(self):
+        """
+        Storage operations run outside of the reactor thread, unless there
+        are no threads to run them in.
+        """
+        reactor_thread = current_thread()
+
+        thread = yield self.storage().run(lambda storage: current_thread())
+        self.assertNotEquals(thread, reactor_thread)
+
+        thread = yield self.storage(max_threads=0).run(
+            lambda storage: current_thread()
+        )
+        self.assertEquals(thread, reactor_thread)
+
+
+    @inlineCallbacks
+    def test_subscribe(self):
+        """
+        Subscribers are told about writes in the reactor thread, until they
+        unsubscribe.
+        """
+        storage = self.storage()
+        changed = Deferred()
+        changes = []
+
+        def subscriber(number, etag, sequence):
+            changes.append((current_thread(), number, etag, sequence))
+            if not changed.called:
+                changed.callback(None)
+
+        storage.subscribe(subscriber)
+        yield storage.write_incident(self.incident(1))
+        yield changed
+
+        etag = yield storage.etag_for_incident_with_number(1)
+        sequence = changes[0][3]
+
+        self.assertEquals(changes, [(current_thread(), 1, etag, sequence)])
+        self.assertEquals(
+            (yield storage.changes_since(sequence - 1)),
+            (sequence, [(1, etag, sequence)])
+        )
+
+        storage.unsubscribe(subscriber)
+        yield storage.write_incident(self.incident(2))
+
+        self.assertEquals(len(changes), 1)
+
+
+    def test_error(self):
+        """
+        Errors are delivered to the deferred.
+        """
+        d = self.storage().read_incident_with_number(1)
+        return self.assertFailure(d, NoSuchIncidentError)
@@ -0,0 +1,172 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.binary}.
+"""
+
+from datetime import datetime
+
+from twisted.trial import unittest
+
+from ims.data import InvalidDataError, Incident, ReportEntry
+from ims.data import Location, Ranger
+from ims.binary import (
+    binary_magic,
+    is_binary,
+    incident_to_binary,
+    incident_from_binary,
+    incident_from_data,
+)
+from ims.test.helpers import corpus
+
+
+
+class BinaryTests(unittest.TestCase):
+    """
+    Tests for the binary incident encoding.
+    """
+
+    def incident(self):
+        return Incident(
+            number=7,
+            rangers=(
+                Ranger(u"Tulsa", None, None),
+                Ranger(u"Splinter", None, None),
+            ),
+            location=Location(u"Ranger HQ", None),
+            incident_types=(u"Medical", u"Fire \u2603"),
+            summary=u"Something happened",
+            report_entries=(
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Once upon a time\nin \u2603land",
+                    created=datetime(2013, 8, 27, 13, 1, 2),
+                ),
+                ReportEntry(
+                    author=u"Tool",
+                    text=u"Changed priority",
+                    created=datetime(2013, 8, 27, 13, 5, 0),
+                    system_entry=True,
+                ),
+            ),
+            created=datetime(2013, 8, 27, 13, 0, 0),
+            dispatched=datetime(2013, 8, 27, 13, 0, 30),
+            priority=2,
+        )
+
+
+    def test_round_trip(self):
+        """
+        Decoding an encoded incident yields an equal incident.
+        """
+        incident = self.incident()
+        data = incident_to_binary(incident)
+
+        self.assertTrue(is_binary(data))
+        self.assertEquals(incident_from_binary(data, 7), incident)
+
+
+    def test_round_trip_corpus(self):
+        """
+        Each incident in the test corpus is equal to itself after being
+        encoded in the binary format and decoded, and is smaller encoded.
+        """
+        for number, text in corpus():
+            incident = Incident.from_json_text(text, number)
+            data = incident_to_binary(incident)
+            self.assertEquals(incident_from_binary(data, number), incident)
+            self.assertTrue(len(data) < len(text))
+
+
+    def test_lazy(self):
+        """
+        With C{lazy}, report entries are decoded when first accessed.
+        """
+        incident = self.incident()
+        lazy = incident_from_binary(
+            incident_to_binary(incident), 7, lazy=True
+        )
+
+        self.assertNotEquals(lazy._lazy_report_entries, None)
+        self.assertEquals(lazy.report_entries, incident.report_entries)
+        self.assertEquals(lazy._lazy_report_entries, None)
+
+
+    def test_microseconds(self):
+        """
+        Times are stored in whole seconds, as in JSON.
+        """
+        incident = self.incident()
+        incident.created = datetime(2013, 8, 27, 13, 0, 0, 500000)
+
+        decoded = incident_from_binary(incident_to_binary(incident), 7)
+
+        self.assertEquals(decoded.created, datetime(2013, 8, 27, 13, 0, 0))
+
+
+    def test_number_mismatch(self):
+        """
+        Decoding an incident with a different number than the one given
+        raises L{InvalidDataError}.
+        """
+        data = incident_to_binary(self.incident())
+        self.assertRaises(InvalidDataError, incident_from_binary, data, 8)
+
+
+    def test_unknown_field(self):
+        """
+        Fields with unknown tags are skipped.
+        """
+        incident = self.incident()
+        data = incident_to_binary(incident) + b"\xff\x03\x00\x00\x00abc"
+        self.assertEquals(incident_from_binary(data, 7), incident)
+
+
+    def test_truncated(self):
+        """
+        Decoding truncated data raises L{InvalidDataError}.
+        """
+        data = incident_to_binary(self.incident())
+        for length in (len(binary_magic) + 3, len(data) // 2, len(data) - 1):
+            self.assertRaises(
+                InvalidDataError, incident_from_binary, data[:length], 7
+            )
+
+
+    def test_invalid(self):
+        """
+        With C{validate}, decoding an invalid incident raises
+        L{InvalidDataError}.
+        """
+        incident = self.incident()
+        incident.priority = 9
+        data = incident_to_binary(incident)
+
+        self.assertRaises(InvalidDataError, incident_from_binary, data, 7)
+        self.assertEquals(
+            incident_from_binary(data, 7, validate=False).priority, 9
+        )
+
+
+    def test_from_data(self):
+        """
+        L{incident_from_data} decodes both binary and JSON incidents.
+        """
+        incident = self.incident()
+
+        for data in (incident_to_binary(incident), incident.to_json_data()):
+            self.assertEquals(incident_from_data(data, 7), incident)
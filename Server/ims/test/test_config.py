@@ -22,6 +22,7 @@ from twisted.python.filepath import FilePath
 import twisted.trial.unittest
 
 from ims.config import Configuration
+from ims.logstore import LogStorage
 
 
 
@@ -83,3 +84,41 @@ class ConfigurationTests(twisted.trial.unittest.TestCase):
         self.assertEquals(
             config.DMSPassword, "9F29BB2B-E775-489C-9C20-9FE3EFEE1F22"
         )
+
+
+    def test_storageBackend(self):
+        """
+        The storage backend is selected by C{Core.StorageBackend}.
+        """
+        serverRoot = FilePath(self.mktemp())
+        configFile = serverRoot.child("conf").child("imsd.conf")
+        configFile.parent().makedirs()
+        configFile.setContent(
+            "[Core]\n"
+            "StorageBackend = log\n"
+        )
+
+        config = Configuration(configFile)
+
+        self.assertEquals(config.StorageBackend, "log")
+        self.assertIsInstance(config.storage, LogStorage)
+        self.assertEquals(config.storage.path, serverRoot.child("data"))
+
+
+    def test_dataFormat(self):
+        """
+        The format incidents are written in is selected by
+        C{Core.DataFormat}.
+        """
+        serverRoot = FilePath(self.mktemp())
+        configFile = serverRoot.child("conf").child("imsd.conf")
+        configFile.parent().makedirs()
+        configFile.setContent(
+            "[Core]\n"
+            "DataFormat = binary\n"
+        )
+
+        config = Configuration(configFile)
+
+        self.assertEquals(config.DataFormat, "binary")
+        self.assertEquals(config.storage.data_format, "binary")
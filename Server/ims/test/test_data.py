@@ -18,11 +18,13 @@
 Tests for L{ims.data}.
 """
 
+import json
 from cStringIO import StringIO
 from datetime import datetime
 
 from twisted.trial import unittest
 
+import ims.data
 from ims.data import (
     JSON,
     InvalidDataError,
@@ -30,8 +32,16 @@ from ims.data import (
     ReportEntry,
     Ranger,
     Location,
+    IncidentChanges,
+    diff_incidents,
     from_json_text,
+    intern_text,
+    json_codecs,
+    parse_rfc3339,
+    render_rfc3339,
+    rfc3339_date_time_format,
 )
+from ims.test.helpers import corpus
 
 
 
@@ -55,6 +65,18 @@ class ConstantTests(unittest.TestCase):
         )
 
 
+    def test_JSON_incident_attributes(self):
+        """
+        L{JSON.incident_attributes} returns the keys in incident JSON.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+
+        self.assertEquals(
+            set(key.value for key in JSON.incident_attributes()),
+            set(json.loads(incident.to_json_data())),
+        )
+
+
     def test_JSON_cmpStates(self):
         states = tuple(JSON.states())
 
@@ -118,6 +140,56 @@ class IncidentTests(unittest.TestCase):
         )
 
 
+    def test_from_json_lazy(self):
+        """
+        L{ims.data.Incident.from_json} with C{lazy} creates report entries
+        when they are first accessed.
+        """
+        incident = Incident.from_json_text(incident1_text, 1, lazy=True)
+
+        self.assertNotEquals(incident._lazy_report_entries, None)
+        self.equals_1(incident)
+        self.assertEquals(incident._lazy_report_entries, None)
+        self.assertEquals(incident, Incident.from_json_text(incident1_text, 1))
+
+
+    def test_from_json_invalid_entry(self):
+        """
+        L{ims.data.Incident.from_json} validates report entries.
+        """
+        root = from_json_text(incident1_text)
+        root[JSON.report_entries.value][0][JSON.text.value] = 42
+
+        self.assertRaises(InvalidDataError, Incident.from_json, root, 1)
+        Incident.from_json(root, 1, validate=False)
+
+
+    def test_from_json_lazy_invalid(self):
+        """
+        L{ims.data.Incident.from_json} with C{lazy} validates report entries
+        when they are first accessed.
+        """
+        root = from_json_text(incident1_text)
+        root[JSON.report_entries.value][0][JSON.text.value] = 42
+
+        incident = Incident.from_json(root, 1, lazy=True)
+
+        self.assertRaises(
+            InvalidDataError, getattr, incident, "report_entries"
+        )
+
+
+    def test_from_json_lazy_assign(self):
+        """
+        Assigning to the report entries of a lazy incident replaces the
+        entries that have not been created yet.
+        """
+        incident = Incident.from_json_text(incident1_text, 1, lazy=True)
+        incident.report_entries = []
+
+        self.assertEquals(incident.report_entries, [])
+
+
     def test_str(self):
         """
         L{ims.data.Incident.__str__}
@@ -182,6 +254,42 @@ class IncidentTests(unittest.TestCase):
         self.assertNotEquals(incident, object())
 
 
+    def test_hash_equal(self):
+        """
+        Equal incidents have equal hashes.
+        """
+        incident1a = Incident.from_json_text(incident1_text, 1)
+        incident1b = Incident.from_json_text(incident1_text, 1, lazy=True)
+
+        self.assertEquals(hash(incident1a), hash(incident1b))
+        self.assertEquals(len(set((incident1a, incident1b))), 1)
+
+
+    def test_hash_mutation(self):
+        """
+        An incident can still be found in a set after its report entries are
+        changed in place.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+        incidents = set((incident,))
+
+        incident.report_entries.append(
+            ReportEntry(author=u"Tool", text=u"More")
+        )
+
+        self.assertIn(incident, incidents)
+
+
+    def test_slots(self):
+        """
+        L{ims.data.Incident} instances have no per-instance dictionary.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+
+        self.assertFalse(hasattr(incident, "__dict__"))
+        self.assertRaises(AttributeError, setattr, incident, "foo", None)
+
+
     def test_validate(self):
         """
         L{ims.data.Incident.validate} of valid incident.
@@ -303,6 +411,134 @@ class IncidentTests(unittest.TestCase):
         self.assertEquals(incident1a, incident1b)
 
 
+    def test_to_json_data_cached(self):
+        """
+        L{ims.data.Incident.to_json_data} reuses its result until the incident
+        changes.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+        data = incident.to_json_data()
+
+        self.assertIdentical(incident.to_json_data(), data)
+        self.assertEquals(incident.to_json_text(), data.decode("utf-8"))
+
+        incident.summary = u"Something else"
+
+        self.assertEquals(
+            Incident.from_json_text(incident.to_json_data(), 1).summary,
+            u"Something else"
+        )
+
+
+    def test_to_json_data_append(self):
+        """
+        After report entries are appended to an incident,
+        L{ims.data.Incident.to_json_data} includes the new entries, and
+        encodes only them.
+        """
+        encoded = []
+        to_json_data = ReportEntry.to_json_data
+
+        def record_to_json_data(entry):
+            encoded.append(entry)
+            return to_json_data(entry)
+
+        self.patch(ReportEntry, "to_json_data", record_to_json_data)
+
+        # Append to an incident with report entries, and to one without
+        for empty in (False, True):
+            incident = Incident.from_json_text(incident1_text, 1)
+            if empty:
+                incident.report_entries = []
+            incident.to_json_data()
+
+            del encoded[:]
+            new_entries = [
+                ReportEntry(
+                    author=u"Tool", text=text,
+                    created=datetime(2013, 3, 21, 23, 0, 0),
+                )
+                for text in (u"More", u"Still more")
+            ]
+            incident.report_entries.extend(new_entries)
+
+            data = incident.to_json_data()
+            self.assertEquals(encoded, new_entries)
+            self.assertEquals(Incident.from_json_text(data, 1), incident)
+            self.assertIdentical(incident.to_json_data(), data)
+
+
+    def test_to_json_data_entries_replaced(self):
+        """
+        L{ims.data.Incident.to_json_data} notices when report entries are
+        removed or replaced.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+        incident.to_json_data()
+
+        incident.report_entries = incident.report_entries[:1]
+        self.assertEquals(
+            Incident.from_json_text(incident.to_json_data(), 1), incident
+        )
+
+        incident.report_entries[-1] = ReportEntry(
+            author=u"Splinter", text=u"Replaced",
+            created=datetime(2013, 3, 21, 23, 0, 0),
+        )
+        self.assertEquals(
+            Incident.from_json_text(incident.to_json_data(), 1), incident
+        )
+
+
+    def test_copy(self):
+        """
+        L{ims.data.Incident.copy} returns an equal incident which can be
+        changed without changing the original.
+        """
+        incident = Incident.from_json_text(incident1_text, 1, lazy=True)
+        copy = incident.copy()
+
+        self.assertEquals(copy, incident)
+
+        copy.location.name = u"Somewhere else"
+        copy.rangers.append(Ranger(u"Splinter", None, None))
+        copy.incident_types.append(u"Fire")
+        copy.report_entries.append(
+            ReportEntry(author=u"Tool", text=u"More")
+        )
+
+        self.assertEquals(
+            incident, Incident.from_json_text(incident1_text, 1)
+        )
+
+
+    def test_to_json_fields(self):
+        """
+        L{ims.data.Incident.to_json_fields} describes the given attributes
+        as L{ims.data.Incident.to_json_data} does.
+        """
+        incident = Incident.from_json_text(incident1_text, 1)
+        data = json.loads(incident.to_json_data())
+
+        keys = [
+            key for key in JSON.iterconstants() if key.value in data
+        ]
+        self.assertEquals(len(keys), len(data))
+
+        for key in keys:
+            self.assertEquals(
+                incident.to_json_fields((key,)), {key.value: data[key.value]}
+            )
+
+        self.assertEquals(
+            incident.to_json_fields((JSON.number, JSON.summary)),
+            {u"number": 1, u"summary": data[u"summary"]}
+        )
+        self.assertRaises(
+            InvalidDataError, incident.to_json_fields, (JSON.author,)
+        )
+
+
     def equals_1(self, incident):
         self.assertEquals(incident.number, 1)
         self.assertEquals(incident.rangers, [Ranger(u"Tulsa", None, None)])
@@ -461,6 +697,16 @@ class ReportEntryTests(unittest.TestCase):
         self.assertNotEquals(entry, object())
 
 
+    def test_slots(self):
+        """
+        L{ims.data.ReportEntry} instances have no per-instance dictionary.
+        """
+        entry = ReportEntry(author=u"Tool", text=u"Something happened!")
+
+        self.assertFalse(hasattr(entry, "__dict__"))
+        self.assertRaises(AttributeError, setattr, entry, "foo", None)
+
+
     def test_validate(self):
         """
         L{ims.data.ReportEntry.validate} of valid entry.
@@ -502,6 +748,24 @@ class ReportEntryTests(unittest.TestCase):
         self.assertRaises(InvalidDataError, entry.validate)
 
 
+    def test_validate_changed(self):
+        """
+        L{ims.data.ReportEntry.validate} of an entry that validated before
+        and was then changed.
+        """
+        entry = ReportEntry(
+            author=u"Tool",
+            text=u"Something happened!",
+            created=datetime(1972, 06, 29, 12, 0, 0),
+        )
+        entry.validate()
+        entry.validate()
+
+        entry.text = b"Something happened!"
+
+        self.assertRaises(InvalidDataError, entry.validate)
+
+
     def test_validate_non_datetime_created(self):
         """
         L{ims.data.ReportEntry.validate} of entry with non-datetime
@@ -586,6 +850,14 @@ class RangerTests(unittest.TestCase):
         self.assertNotEquals(self.tool, object())
 
 
+    def test_slots(self):
+        """
+        L{ims.data.Ranger} instances have no per-instance dictionary.
+        """
+        self.assertFalse(hasattr(self.tool, "__dict__"))
+        self.assertRaises(AttributeError, setattr, self.tool, "foo", None)
+
+
     def test_validate(self):
         """
         L{ims.data.Ranger.validate} of valid ranger.
@@ -593,6 +865,13 @@ class RangerTests(unittest.TestCase):
         self.tool.validate()
 
 
+    def test_validate_handle_only(self):
+        """
+        L{ims.data.Ranger.validate} of Ranger with only a handle.
+        """
+        Ranger(handle=u"Tulsa", name=None, status=None).validate()
+
+
     def test_validate_non_unicode_handle(self):
         """
         L{ims.data.Ranger.validate} of Ranger with non-unicode
@@ -685,6 +964,14 @@ class LocationTests(unittest.TestCase):
         self.assertNotEquals(self.hq, object())
 
 
+    def test_slots(self):
+        """
+        L{ims.data.Location} instances have no per-instance dictionary.
+        """
+        self.assertFalse(hasattr(self.hq, "__dict__"))
+        self.assertRaises(AttributeError, setattr, self.hq, "foo", None)
+
+
     def test_validate(self):
         """
         L{ims.data.Location.validate} of valid location.
@@ -718,6 +1005,296 @@ class LocationTests(unittest.TestCase):
 
 
 
+class TimestampTests(unittest.TestCase):
+    """
+    Tests for L{ims.data.parse_rfc3339} and L{ims.data.render_rfc3339}
+    """
+
+    def test_parse(self):
+        """
+        L{ims.data.parse_rfc3339} parses the same times as
+        L{datetime.strptime}.
+        """
+        for text in (
+            u"2013-03-21T22:00:17Z",
+            "1972-06-29T00:00:00Z",
+            u"2013-3-1T2:00:17Z",
+        ):
+            self.assertEquals(
+                parse_rfc3339(text),
+                datetime.strptime(text, rfc3339_date_time_format)
+            )
+
+
+    def test_parse_invalid(self):
+        """
+        L{ims.data.parse_rfc3339} raises L{ValueError} for invalid
+        timestamps.
+        """
+        for text in (
+            u"2013-13-21T22:00:17Z",
+            u"2013-03-21 22:00:17Z",
+            u"2013-03-21T22:00:17",
+            u"2013-03-21T22:+0:17Z",
+            u"",
+        ):
+            self.assertRaises(ValueError, parse_rfc3339, text)
+
+
+    def test_render(self):
+        """
+        L{ims.data.render_rfc3339} renders the same text as
+        L{datetime.strftime}, and round-trips with L{ims.data.parse_rfc3339}.
+        """
+        for date_time in (
+            datetime(2013, 3, 21, 22, 0, 17),
+            datetime(1972, 6, 29, 0, 0, 0),
+        ):
+            text = render_rfc3339(date_time)
+            self.assertEquals(
+                text, date_time.strftime(rfc3339_date_time_format)
+            )
+            self.assertEquals(render_rfc3339(date_time), text)
+            self.assertEquals(parse_rfc3339(text), date_time)
+
+
+
+
+
+
+
+class InternTests(unittest.TestCase):
+    """
+    Tests for L{ims.data.intern_text}
+    """
+
+    def test_shared(self):
+        """
+        Incidents share ranger handles, incident types and report entry
+        authors.
+        """
+        incident1a = Incident.from_json_text(incident1_text, 1)
+        incident1b = Incident.from_json_text(incident1_text, 1)
+
+        for a, b in (
+            (incident1a.rangers[0].handle, incident1b.rangers[0].handle),
+            (incident1a.incident_types[0], incident1b.incident_types[0]),
+            (
+                incident1a.report_entries[0].author,
+                incident1b.report_entries[0].author,
+            ),
+        ):
+            self.assertEquals(a, b)
+            self.assertIdentical(a, b)
+
+
+    def test_not_unicode(self):
+        """
+        L{ims.data.intern_text} returns non-unicode values unchanged.
+        """
+        for value in (None, b"Tool", 1, [u"Tool"]):
+            self.assertIdentical(intern_text(value), value)
+
+
+    def test_full(self):
+        """
+        L{ims.data.intern_text} stops adding strings when the table is full.
+        """
+        self.patch(ims.data, "intern_table_size", 0)
+
+        text = u"".join((u"Not ", u"interned"))
+
+        self.assertIdentical(intern_text(text), text)
+        self.assertNotIn(text, ims.data._interned_text)
+
+
+
+class JSONCodecTests(unittest.TestCase):
+    """
+    Tests for L{ims.data.JSONCodec}
+    """
+
+    def test_encode(self):
+        """
+        Every available codec encodes the test corpus to the same bytes as
+        the standard library's L{json.dumps} with compact separators.
+        """
+        for number, data in corpus():
+            root = json.loads(data)
+            expected = json.dumps(root, separators=(",", ":"))
+
+            for codec in json_codecs:
+                self.assertEquals(codec.encode(root), expected, codec)
+
+
+    def test_decode(self):
+        """
+        Every available codec decodes the test corpus to the same objects as
+        the standard library's L{json.loads}, with unicode strings.
+        """
+        for number, data in corpus():
+            expected = json.loads(data)
+
+            for codec in json_codecs:
+                root = codec.decode(data)
+                self.assertEquals(root, expected, codec)
+                self.assertEquals(
+                    type(root[JSON.summary.value]), unicode, codec
+                )
+
+
+    def test_encode_string(self):
+        """
+        L{ims.data.JSONCodec.encode_string} encodes strings the same way
+        L{ims.data.JSONCodec.encode} does.
+        """
+        for codec in json_codecs:
+            for string in (u"Tool", u"Caf\xe9 \"Nowhere\"\n", b"Tool"):
+                self.assertEquals(
+                    codec.encode_string(string), codec.encode(string), codec
+                )
+
+
+
+class DiffTests(unittest.TestCase):
+    """
+    Tests for L{ims.data.diff_incidents} and L{ims.data.IncidentChanges}
+    """
+
+    def incident(self):
+        return Incident.from_json_text(incident1_text, 1)
+
+
+    def test_diff_none(self):
+        """
+        An incident has no changes from an equal one.
+        """
+        changes = diff_incidents(self.incident(), self.incident())
+
+        self.assertFalse(changes)
+        self.assertEquals(changes.system_message(), None)
+
+
+    def test_diff_apply(self):
+        """
+        Applying the changes between two versions of an incident to the
+        first version yields the second.
+        """
+        old = self.incident()
+        new = self.incident()
+
+        new.summary = u"Spire is fine"
+        new.location.name = None
+        new.rangers.append(Ranger(u"Splinter", None, None))
+        new.incident_types = [new.incident_types[0], u"Fire"]
+        new.report_entries.append(
+            ReportEntry(u"Tool", u"All done", datetime(2013, 3, 22))
+        )
+
+        changes = diff_incidents(old, new)
+
+        self.assertEquals(changes.apply(old), new)
+
+
+    def test_diff_order(self):
+        """
+        Reordering Rangers and incident types is not a change.
+        """
+        old = self.incident()
+        new = self.incident()
+        new.rangers.reverse()
+        new.incident_types.reverse()
+
+        self.assertFalse(diff_incidents(old, new))
+
+
+    def test_diff_keys(self):
+        """
+        Only the given attributes are compared.
+        """
+        old = self.incident()
+        new = self.incident()
+        new.summary = u"Spire is fine"
+        new.priority = 1
+
+        changes = diff_incidents(old, new, (JSON.priority,))
+
+        self.assertEquals(changes.values, [(JSON.priority, 1)])
+
+
+    def test_system_message(self):
+        """
+        L{IncidentChanges.system_message} describes each change.
+        """
+        changes = IncidentChanges(
+            1,
+            values=(
+                (JSON.summary, u"Spire is fine"),
+                (JSON.location_name, None),
+                (JSON.dispatched, datetime(2013, 3, 22)),
+                (JSON.on_scene, datetime(2013, 3, 22)),
+            ),
+            rangers_added=(Ranger(u"Splinter", None, None),),
+            incident_types_removed=(u"Fire", u"Medical"),
+        )
+
+        self.assertEquals(
+            changes.system_message(),
+            u"Changed summary to: Spire is fine\n"
+            u"Changed location name to: <no value>\n"
+            u"Added to ranger handles: Splinter\n"
+            u"Removed from incident types: Fire, Medical\n"
+            u"State changed to: on scene"
+        )
+
+
+    def test_system_message_reopen(self):
+        """
+        Clearing state times changes the state to the one before the
+        earliest one cleared.
+        """
+        changes = IncidentChanges(
+            1, values=((JSON.on_scene, None), (JSON.closed, None))
+        )
+
+        self.assertEquals(
+            changes.system_message(), u"State changed to: dispatched"
+        )
+
+
+    def test_apply_author(self):
+        """
+        With an author, L{IncidentChanges.apply} adds a system report entry
+        describing the changes, followed by the added report entries.
+        """
+        incident = self.incident()
+        count = len(incident.report_entries)
+        entry = ReportEntry(u"Tool", u"All done", datetime(2013, 3, 22))
+
+        IncidentChanges(
+            1, values=((JSON.priority, 1),), report_entries=(entry,)
+        ).apply(incident, author=u"Splinter")
+
+        system_entry = incident.report_entries[count]
+        self.assertEquals(system_entry.author, u"Splinter")
+        self.assertEquals(system_entry.text, u"Changed priority to: 1")
+        self.assertTrue(system_entry.system_entry)
+        self.assertEquals(incident.report_entries[count + 1:], [entry])
+
+
+    def test_apply_other_incident(self):
+        """
+        Applying changes to a different incident raises
+        L{InvalidDataError}.
+        """
+        self.assertRaises(
+            InvalidDataError,
+            IncidentChanges(2, values=((JSON.priority, 1),)).apply,
+            self.incident(),
+        )
+
+
+
 
 
 
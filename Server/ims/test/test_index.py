@@ -0,0 +1,346 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.index}.
+"""
+
+from datetime import datetime
+
+from twisted.trial import unittest
+
+from ims.data import Incident, ReportEntry, Ranger, Location
+from ims.index import trigrams, SearchIndex, AttributeIndex, TimeIndex
+from ims.index import open_states
+
+
+
+def incident(
+    number, summary=None, text=None, handles=(), types=(),
+    priority=3, closed=None,
+):
+    if text is None:
+        entries = ()
+    else:
+        entries = (
+            ReportEntry(
+                author=u"Tool", text=text,
+                created=datetime(2013, 8, 26, 12, 0, 0),
+            ),
+        )
+
+    return Incident(
+        number=number,
+        rangers=[Ranger(handle, None, None) for handle in handles],
+        location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+        incident_types=types,
+        summary=summary,
+        report_entries=entries,
+        priority=priority,
+        closed=closed,
+    )
+
+
+
+class TrigramTests(unittest.TestCase):
+    """
+    Tests for L{ims.index.trigrams}
+    """
+
+    def test_trigrams(self):
+        """
+        L{trigrams} finds the distinct trigrams in a string.
+        """
+        self.assertEquals(
+            trigrams(u"banana"), set((u"ban", u"ana", u"nan"))
+        )
+
+
+    def test_trigrams_short(self):
+        """
+        Strings shorter than three characters have no trigrams.
+        """
+        self.assertEquals(trigrams(u"ab"), set())
+
+
+
+class SearchIndexTests(unittest.TestCase):
+    """
+    Tests for L{ims.index.SearchIndex}
+    """
+
+    def index(self):
+        index = SearchIndex()
+        index.add(incident(1, summary=u"Lost bicycle", handles=(u"Tulsa",)))
+        index.add(incident(2, text=u"Art car fire", types=(u"Fire",)))
+        index.add(incident(3, summary=u"Fire at camp", handles=(u"Splinter",)))
+        return index
+
+
+    def test_search_word(self):
+        """
+        A whole word matches the incidents containing it.
+        """
+        self.assertEquals(self.index().search(u"fire"), set((2, 3)))
+
+
+    def test_search_case(self):
+        """
+        Searches are case-insensitive.
+        """
+        self.assertEquals(self.index().search(u"TULSA"), set((1,)))
+
+
+    def test_search_substring(self):
+        """
+        Part of a word matches the incidents containing that word.
+        """
+        self.assertEquals(self.index().search(u"cycl"), set((1,)))
+
+
+    def test_search_short(self):
+        """
+        Terms too short to have trigrams match by substring.
+        """
+        index = self.index()
+        self.assertEquals(index.search(u"ca"), set((2, 3)))
+        self.assertEquals(index.search(u""), set((1, 2, 3)))
+
+
+    def test_search_bytes(self):
+        """
+        Search terms may be UTF-8 encoded bytes.
+        """
+        self.assertEquals(self.index().search(b"TULSA"), set((1,)))
+
+
+    def test_search_phrase(self):
+        """
+        A term with several words must match as a substring.
+        """
+        index = self.index()
+        self.assertEquals(index.search(u"car fire"), set((2,)))
+        self.assertEquals(index.search(u"fire car"), set())
+
+
+    def test_search_punctuation(self):
+        """
+        A term with no words in it matches by substring.
+        """
+        self.assertEquals(self.index().search(u":45 &"), set((1, 2, 3)))
+
+
+    def test_search_all(self):
+        """
+        L{SearchIndex.search_all} matches incidents matching every term.
+        """
+        index = self.index()
+        self.assertEquals(index.search_all((u"fire", u"camp")), set((3,)))
+        self.assertEquals(index.search_all(()), set((1, 2, 3)))
+
+
+    def test_add_replaces(self):
+        """
+        Adding a new version of an incident replaces the old one.
+        """
+        index = self.index()
+        index.add(incident(1, summary=u"Found bicycle"))
+
+        self.assertEquals(index.search(u"lost"), set())
+        self.assertEquals(index.search(u"found"), set((1,)))
+        self.assertEquals(len(index), 3)
+
+
+    def test_remove(self):
+        """
+        Removed incidents no longer match.
+        """
+        index = self.index()
+        index.remove(3)
+
+        self.assertEquals(index.search(u"fire"), set((2,)))
+        self.assertNotIn(3, index)
+        self.assertNotIn(u"lin", index._postings)
+
+
+
+class AttributeIndexTests(unittest.TestCase):
+    """
+    Tests for L{ims.index.AttributeIndex}
+    """
+
+    def index(self):
+        index = AttributeIndex()
+        index.add(incident(
+            1, handles=(u"Tulsa", u"Tool"), types=(u"Medical",), priority=1
+        ))
+        index.add(incident(
+            2, handles=(u"Tool",), types=(u"Medical", u"Fire"),
+            closed=datetime(2013, 8, 26, 13, 0, 0),
+        ))
+        index.add(incident(3, handles=(u"Splinter",), types=(u"Fire",)))
+        return index
+
+
+    def test_query_one(self):
+        """
+        Querying one attribute finds the incidents with that value.
+        """
+        index = self.index()
+        self.assertEquals(index.query(ranger=u"Tool"), set((1, 2)))
+        self.assertEquals(index.query(incident_type=u"Fire"), set((2, 3)))
+        self.assertEquals(index.query(priority=1), set((1,)))
+        self.assertEquals(index.query(state=u"closed"), set((2,)))
+        self.assertEquals(index.query(ranger=u"Nobody"), set())
+
+
+    def test_query_several(self):
+        """
+        Querying several attributes finds the incidents with all of the
+        values.
+        """
+        self.assertEquals(
+            self.index().query(
+                state=open_states, incident_type=u"Medical", ranger=u"Tool"
+            ),
+            set((1,))
+        )
+
+
+    def test_query_any(self):
+        """
+        Querying for a collection of values finds the incidents with any of
+        them.
+        """
+        self.assertEquals(
+            self.index().query(ranger=(u"Tulsa", u"Splinter")), set((1, 3))
+        )
+
+
+    def test_query_all(self):
+        """
+        A query with no criteria finds every incident.
+        """
+        self.assertEquals(self.index().query(), set((1, 2, 3)))
+
+
+    def test_query_unknown(self):
+        """
+        Querying an unknown attribute is an error.
+        """
+        self.assertRaises(TypeError, self.index().query, color=u"Blue")
+
+
+    def test_add_replaces(self):
+        """
+        Adding a new version of an incident replaces the old one.
+        """
+        index = self.index()
+        index.add(incident(
+            2, handles=(u"Tool",), types=(u"Medical",), priority=2
+        ))
+
+        self.assertEquals(index.query(incident_type=u"Fire"), set((3,)))
+        self.assertEquals(index.query(state=u"closed"), set())
+        self.assertEquals(index.query(priority=2), set((2,)))
+        self.assertEquals(len(index), 3)
+
+
+    def test_remove(self):
+        """
+        Removed incidents no longer match.
+        """
+        index = self.index()
+        index.remove(3)
+
+        self.assertEquals(index.query(incident_type=u"Fire"), set((2,)))
+        self.assertNotIn(3, index)
+        self.assertNotIn(("ranger", u"Splinter"), index._postings)
+
+
+
+class TimeIndexTests(unittest.TestCase):
+    """
+    Tests for L{ims.index.TimeIndex}
+    """
+
+    def index(self):
+        index = TimeIndex()
+        index.add(incident(1, text=u"Noon"))
+        index.add(incident(
+            2, closed=datetime(2013, 8, 26, 14, 0, 0)
+        ))
+        index.add(incident(3, text=u"Noon", closed=datetime(2013, 8, 27)))
+        return index
+
+
+    def test_search(self):
+        """
+        Searches find incidents with times in the given range, inclusive.
+        """
+        index = self.index()
+        noon = datetime(2013, 8, 26, 12, 0, 0)
+
+        self.assertEquals(index.search(since=noon), set((1, 2, 3)))
+        self.assertEquals(index.search(until=noon), set((1, 3)))
+        self.assertEquals(
+            index.search(since=datetime(2013, 8, 26, 13), until=noon), set()
+        )
+        self.assertEquals(
+            index.search(since=datetime(2013, 8, 26, 13)), set((2, 3))
+        )
+        self.assertEquals(index.search(), set((1, 2, 3)))
+
+
+    def test_search_kinds(self):
+        """
+        Searches can be limited to some kinds of times.
+        """
+        index = self.index()
+
+        self.assertEquals(index.search(kinds=("entry",)), set((1, 3)))
+        self.assertEquals(
+            index.search(
+                since=datetime(2013, 8, 26, 13), kinds=("closed",)
+            ),
+            set((2, 3))
+        )
+
+
+    def test_add_replaces(self):
+        """
+        Adding a new version of an incident replaces the old one.
+        """
+        index = self.index()
+        index.add(incident(3, text=u"Noon"))
+
+        self.assertEquals(
+            index.search(since=datetime(2013, 8, 26, 13)), set((2,))
+        )
+        self.assertEquals(len(index._times), 3)
+
+
+    def test_remove(self):
+        """
+        Removed incidents no longer match.
+        """
+        index = self.index()
+        index.remove(1)
+        index.remove(3)
+
+        self.assertEquals(index.search(), set((2,)))
+        self.assertNotIn(1, index)
+        self.assertEquals(len(index._times), 1)
@@ -0,0 +1,316 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.logstore}.
+"""
+
+from hashlib import sha1 as etag_hash
+from threading import Event, Thread
+
+import twisted.trial.unittest
+
+import ims.logstore
+from ims.store import NoSuchIncidentError
+from ims.logstore import LogStorage, ReadOnlyLogStorage
+from ims.test.helpers import StorageTestsMixin
+
+
+
+class LogStoreTests(StorageTestsMixin, twisted.trial.unittest.TestCase):
+    """
+    Tests for L{ims.logstore.LogStorage}
+    """
+
+    storage_class = LogStorage
+    storage_kwargs = dict(sync=False)
+
+
+    def segments(self, store):
+        return sorted(
+            child.basename() for child in store.path.children()
+            if child.basename().startswith("segment-")
+        )
+
+
+    def test_write_read(self):
+        """
+        Incidents written to the log can be read back.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2, summary=u"Something else"))
+
+        self.assertEquals(
+            store.read_incident_with_number(2),
+            self.incident(2, summary=u"Something else")
+        )
+        self.assertEquals(
+            store.etag_for_incident_with_number(1),
+            etag_hash(store.read_incident_with_number_raw(1)).hexdigest()
+        )
+        self.assertRaises(
+            NoSuchIncidentError, store.read_incident_with_number, 3
+        )
+
+
+    def test_replay(self):
+        """
+        A new store replays the log to find the latest version of each
+        incident.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+        store.write_incident(self.incident(1, summary=u"Something else"))
+        etags = dict(store.list_incidents())
+        store.close()
+
+        store = self.storage(store.path)
+        store.provision()
+
+        self.assertEquals(dict(store.list_incidents()), etags)
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something else"
+        )
+        self.assertEquals(store.next_incident_number(), 3)
+
+
+    def test_replay_torn_write(self):
+        """
+        A record left incomplete at the end of the log is discarded, and the
+        log remains writable.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(1, summary=u"Something else"))
+        store.close()
+
+        segment_fp = store._segment_fp(1)
+        segment_fp.setContent(segment_fp.getContent()[:-10])
+
+        store = self.storage(store.path)
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something happened"
+        )
+
+        store.write_incident(self.incident(2))
+        store.close()
+
+        store = self.storage(store.path)
+        self.assertEquals(
+            sorted(number for number, etag in store.list_incidents()), [1, 2]
+        )
+
+
+    def test_read_only(self):
+        """
+        Read-only log storage reads the log written by log storage.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.close()
+
+        store = ReadOnlyLogStorage(store.path)
+        self.addCleanup(store.close)
+
+        self.assertEquals(store.read_incident_with_number(1), self.incident(1))
+
+
+    def test_history(self):
+        """
+        Every version of an incident is kept in the log.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1, summary=u"One"))
+        store.write_incident(self.incident(1, summary=u"Two"))
+
+        self.assertEquals(
+            [i.summary for i in store.history_for_incident_with_number(1)],
+            [u"One", u"Two"]
+        )
+
+
+    def test_segment_size(self):
+        """
+        A new segment is started when the active one reaches the maximum
+        segment size.
+        """
+        store = self.storage(segment_size=1)
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+
+        self.assertEquals(
+            self.segments(store),
+            ["segment-00000001.log", "segment-00000002.log"]
+        )
+
+
+    def test_compact(self):
+        """
+        Compaction keeps only the latest version of each incident.
+        """
+        store = self.storage(segment_size=1)
+        for summary in (u"One", u"Two", u"Three"):
+            store.write_incident(self.incident(1, summary=summary))
+        store.write_incident(self.incident(2))
+        etags = dict(store.list_incidents())
+
+        store.compact()
+
+        self.assertEquals(self.segments(store), ["segment-00000005.log"])
+        self.assertEquals(dict(store.list_incidents()), etags)
+        self.assertEquals(
+            [i.summary for i in store.history_for_incident_with_number(1)],
+            [u"Three"]
+        )
+        self.assertEquals(store._total_bytes, store._live_bytes)
+
+        store.write_incident(self.incident(1, summary=u"Four"))
+        store.close()
+
+        store = self.storage(store.path)
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Four"
+        )
+        self.assertEquals(store.read_incident_with_number(2), self.incident(2))
+
+
+    def test_compact_concurrent(self):
+        """
+        Compacting while the store is already being compacted does nothing,
+        and doesn't disturb the compaction in progress.
+        """
+        store = self.storage(segment_size=1)
+        for summary in (u"One", u"Two", u"Three"):
+            store.write_incident(self.incident(1, summary=summary))
+        store.write_incident(self.incident(2))
+        etags = dict(store.list_incidents())
+
+        # Pause the first compaction while it copies records
+        copying = Event()
+        resume = Event()
+        read_location = store._read_location
+
+        def paused_read_location(location):
+            if not copying.is_set():
+                copying.set()
+                resume.wait()
+            return read_location(location)
+
+        self.patch(store, "_read_location", paused_read_location)
+
+        thread = Thread(target=store.compact)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(resume.set)
+        copying.wait()
+
+        segments = self.segments(store)
+        store.compact()
+        self.assertEquals(self.segments(store), segments)
+
+        resume.set()
+        thread.join()
+
+        self.assertEquals(self.segments(store), ["segment-00000005.log"])
+        self.assertEquals(dict(store.list_incidents()), etags)
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Three"
+        )
+        self.assertFalse(store._compacting)
+
+
+    def test_compact_from_thread(self):
+        """
+        A write in another thread that makes compaction worthwhile asks the
+        reactor thread to start compacting.
+        """
+        from twisted.internet import reactor
+
+        calls = []
+        self.patch(
+            reactor, "callFromThread", lambda f, *a: calls.append((f, a))
+        )
+
+        store = self.storage(compact_ratio=0.1, compact_minimum=0)
+        store.write_incident(self.incident(1))
+
+        thread = Thread(target=store.write_incident, args=(self.incident(1),))
+        thread.start()
+        thread.join()
+
+        self.assertEquals(calls, [(store._compact_in_background, ())])
+        self.assertTrue(store._compacting)
+
+
+    def test_sync_directory(self):
+        """
+        With C{sync}, the directory is synced after a new segment is
+        created.  Compaction always syncs the directory before removing the
+        segments it has replaced.
+        """
+        synced = []
+
+        def fsync_directory(path):
+            synced.append(self.segments(store))
+
+        self.patch(ims.logstore, "fsync_directory", fsync_directory)
+
+        store = self.storage(segment_size=1, sync=True)
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(1))
+
+        self.assertEquals(
+            synced,
+            [
+                ["segment-00000001.log"],
+                ["segment-00000001.log", "segment-00000002.log"],
+            ]
+        )
+
+        del synced[:]
+        store.sync = False
+        store.compact()
+
+        self.assertEquals(
+            synced,
+            [[
+                "segment-00000001.log",
+                "segment-00000002.log",
+                "segment-00000003.log",
+            ]]
+        )
+        self.assertEquals(self.segments(store), ["segment-00000003.log"])
+
+
+    def test_should_compact(self):
+        """
+        Compaction is wanted once enough of the log is superseded versions.
+        """
+        store = self.storage(compact_ratio=0.5, compact_minimum=0)
+        store.provision()
+        store._compacting = True  # Don't actually start compacting
+
+        store.write_incident(self.incident(1))
+        store._compacting = False
+        self.assertFalse(store._should_compact())
+
+        store._compacting = True
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(1))
+        store._compacting = False
+        self.assertTrue(store._should_compact())
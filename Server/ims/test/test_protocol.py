@@ -0,0 +1,577 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.protocol}.
+"""
+
+import json
+from cStringIO import StringIO
+
+from twisted.trial import unittest
+from twisted.python.failure import Failure
+from twisted.internet.defer import Deferred, fail
+from twisted.internet.error import ConnectionDone
+from twisted.internet.task import Clock
+from twisted.test.proto_helpers import StringTransport
+from twisted.web import http
+from twisted.web.http_headers import Headers
+from twisted.web.test.requesthelper import DummyRequest
+
+from ims.data import InvalidDataError
+from ims.store import Storage
+from ims.asyncstore import AsyncStorage
+from ims.protocol import IncidentManagementSystem
+from ims.test.helpers import StorageTestsMixin
+
+
+
+class DummyConfig(object):
+    RejectClientsRegex = ()
+    ReadOnly = False
+    dms = None
+
+    def __init__(self, storage):
+        self.async_storage = storage
+
+
+
+class IMSTestCase(StorageTestsMixin, unittest.TestCase):
+    """
+    Base class for tests of L{IncidentManagementSystem} request handlers.
+    Storage operations run synchronously, and the reactor is a L{Clock}.
+    """
+
+    storage_class = Storage
+    storage_kwargs = dict(sync=False)
+
+
+    def setUp(self):
+        self.clock = Clock()
+        self.async_storage = AsyncStorage(self.storage(), max_threads=0)
+        self.ims = IncidentManagementSystem(
+            DummyConfig(self.async_storage), reactor=self.clock
+        )
+
+
+    def write(self, *numbers):
+        for number in numbers:
+            self.successResultOf(
+                self.async_storage.write_incident(self.incident(number))
+            )
+
+
+    def etag(self, number):
+        return self.successResultOf(
+            self.async_storage.etag_for_incident_with_number(number)
+        )
+
+
+    def request(self, path="/", args=None, headers=None, content=None):
+        request = DummyRequest([""])
+        request.path = path
+        request.args = dict(args or {})
+        request.requestHeaders = Headers(headers or {})
+        if content is not None:
+            request.content = StringIO(content)
+        return request
+
+
+    def body(self, request, response):
+        """
+        Get the body of a response: what the handler wrote, followed by
+        the result of the response's deferred, if it is one.
+        """
+        if isinstance(response, Deferred):
+            response = self.successResultOf(response)
+        return "".join(request.written) + response
+
+
+
+class ConditionalGetTests(IMSTestCase):
+    """
+    Tests for conditional GETs (C{If-None-Match}) on the JSON endpoints.
+    """
+
+    def test_incident(self):
+        """
+        An incident is sent with its etag, unless it matches
+        C{If-None-Match}.
+        """
+        self.write(1)
+        etag = self.etag(1)
+
+        request = self.request()
+        body = self.body(request, self.ims.get_incident(request, "1"))
+        self.assertEquals(request.responseCode, None)
+        self.assertEquals(request.outgoingHeaders["etag"], etag)
+        self.assertEquals(json.loads(body)["number"], 1)
+
+        request = self.request(headers={"If-None-Match": ['"' + etag + '"']})
+        body = self.body(request, self.ims.get_incident(request, "1"))
+        self.assertEquals(request.responseCode, http.NOT_MODIFIED)
+        self.assertEquals(body, "")
+
+
+    def test_incidents(self):
+        """
+        The incident list is sent with an etag, which changes when an
+        incident is written, unless it matches C{If-None-Match}.
+        """
+        self.write(1, 2)
+
+        request = self.request()
+        body = self.body(request, self.ims.list_incidents(request))
+        etag = request.outgoingHeaders["etag"]
+        self.assertEquals(
+            json.loads(body), [[2, self.etag(2)], [1, self.etag(1)]]
+        )
+
+        request = self.request(headers={"If-None-Match": [etag]})
+        body = self.body(request, self.ims.list_incidents(request))
+        self.assertEquals(request.responseCode, http.NOT_MODIFIED)
+        self.assertEquals(body, "")
+
+        self.successResultOf(self.async_storage.write_incident(
+            self.incident(1, u"Something else happened")
+        ))
+
+        request = self.request(headers={"If-None-Match": [etag]})
+        body = self.body(request, self.ims.list_incidents(request))
+        self.assertEquals(request.responseCode, None)
+        self.assertNotEquals(request.outgoingHeaders["etag"], etag)
+
+
+    def test_ping(self):
+        """
+        C{/ping} answers C{If-None-Match} with its fixed etag.
+        """
+        request = self.request(headers={"If-None-Match": ["ack"]})
+        self.assertEquals(self.body(request, self.ims.ping(request)), "")
+        self.assertEquals(request.responseCode, http.NOT_MODIFIED)
+
+
+
+class EditIncidentTests(IMSTestCase):
+    """
+    Tests for editing incidents with C{If-Match}.
+    """
+
+    def setUp(self):
+        IMSTestCase.setUp(self)
+        self.ims.avatarId = "Tool"
+
+
+    def edit(self, summary, *if_match):
+        headers = {}
+        if if_match:
+            headers["If-Match"] = list(if_match)
+        request = self.request(
+            headers=headers, content=json.dumps(dict(summary=summary))
+        )
+        body = self.body(request, self.ims.edit_incident(request, "1"))
+        return request, body
+
+
+    def summary(self):
+        return self.successResultOf(
+            self.async_storage.read_incident_with_number(1)
+        ).summary
+
+
+    def test_match(self):
+        """
+        An edit with a current etag in C{If-Match} is applied, and the
+        response carries the new etag.
+        """
+        self.write(1)
+
+        request, body = self.edit(u"New", '"{0}"'.format(self.etag(1)))
+
+        self.assertEquals(request.responseCode, http.OK)
+        self.assertEquals(self.summary(), u"New")
+        self.assertEquals(request.outgoingHeaders["etag"], self.etag(1))
+
+
+    def test_no_match(self):
+        """
+        An edit with a stale etag in C{If-Match} is refused with
+        I{Precondition Failed}, and the incident is unchanged.
+        """
+        self.write(1)
+        etag = self.etag(1)
+        self.edit(u"Newer")
+
+        request, body = self.edit(u"New", '"{0}"'.format(etag))
+
+        self.assertEquals(request.responseCode, http.PRECONDITION_FAILED)
+        self.assertEquals(self.summary(), u"Newer")
+
+
+    def test_unconditional(self):
+        """
+        Without C{If-Match}, an edit is applied to the latest version.
+        """
+        self.write(1)
+        self.edit(u"Newer")
+
+        request, body = self.edit(u"New")
+
+        self.assertEquals(request.responseCode, http.OK)
+        self.assertEquals(self.summary(), u"New")
+
+
+
+class PaginationTests(IMSTestCase):
+    """
+    Tests for paging through and projecting the incident list.
+    """
+
+    def list(self, **args):
+        request = self.request(
+            path="/incidents/",
+            args=dict((key, [value]) for key, value in args.items()),
+        )
+        body = self.body(request, self.ims.list_incidents(request))
+        return request, body
+
+
+    def test_pages(self):
+        """
+        With C{limit}, incidents are listed a page at a time, highest number
+        first.  A full page has a C{Link} to the next page, which starts
+        below the C{cursor}.
+        """
+        self.write(1, 2, 3, 4, 5)
+
+        request, body = self.list(limit="2")
+        self.assertEquals(
+            json.loads(body), [[5, self.etag(5)], [4, self.etag(4)]]
+        )
+        self.assertEquals(
+            request.outgoingHeaders["link"],
+            '</incidents/?cursor=4&limit=2>; rel="next"'
+        )
+
+        request, body = self.list(limit="2", cursor="4")
+        self.assertEquals([n for n, e in json.loads(body)], [3, 2])
+        self.assertEquals(
+            request.outgoingHeaders["link"],
+            '</incidents/?cursor=2&limit=2>; rel="next"'
+        )
+
+        request, body = self.list(limit="2", cursor="2")
+        self.assertEquals([n for n, e in json.loads(body)], [1])
+        self.assertNotIn("link", request.outgoingHeaders)
+
+
+    def test_fields(self):
+        """
+        With C{fields}, each incident is listed with the requested
+        attributes, and the etag of the list depends on them.
+        """
+        self.write(1)
+
+        request, body = self.list()
+        etag = request.outgoingHeaders["etag"]
+
+        request, body = self.list(fields="summary,priority")
+        self.assertEquals(
+            json.loads(body),
+            [[
+                1, self.etag(1),
+                dict(summary=u"Something happened", priority=5),
+            ]]
+        )
+        self.assertNotEquals(request.outgoingHeaders["etag"], etag)
+
+
+    def test_invalid(self):
+        """
+        Unknown fields and invalid limits and cursors are I{Bad Request}s,
+        which are sent without an etag.
+        """
+        self.write(1)
+
+        for args in (
+            dict(fields="author"), dict(fields="summary,nope"),
+            dict(limit="0"), dict(limit="x"), dict(cursor="-1"),
+        ):
+            request, body = self.list(**args)
+            self.assertEquals(request.responseCode, http.BAD_REQUEST, args)
+            self.assertNotIn("etag", request.outgoingHeaders)
+
+        self.flushLoggedErrors(InvalidDataError)
+
+
+
+class BatchTests(IMSTestCase):
+    """
+    Tests for fetching many incidents at once.
+    """
+
+    def setUp(self):
+        IMSTestCase.setUp(self)
+        self.ims.batch_size = 2
+        self.reads = []
+
+        read = self.async_storage.read_incidents_with_etags
+
+        def record_read(numbers):
+            self.reads.append(list(numbers))
+            return read(numbers)
+
+        self.patch(
+            self.async_storage, "read_incidents_with_etags", record_read
+        )
+
+
+    def test_incidents(self):
+        """
+        The incidents are sent, a batch at a time, as C{[number, etag,
+        incident]} lists, with C{null}s for missing incidents.
+        """
+        self.write(1, 2, 3)
+
+        request = self.request(args=dict(numbers=["3,9", "1,3"]))
+        response = self.ims.list_incidents(request)
+        incidents = json.loads(self.body(request, response))
+
+        self.assertEquals(self.reads, [[3, 9], [1]])
+        self.assertEquals(
+            [(number, etag) for number, etag, incident in incidents],
+            [(3, self.etag(3)), (9, None), (1, self.etag(1))]
+        )
+        self.assertEquals(incidents[0][2]["number"], 3)
+        self.assertEquals(incidents[1][2], None)
+
+
+    def test_disconnect(self):
+        """
+        Reading stops if the client goes away.
+        """
+        self.write(1, 2, 3)
+        request = self.request(args=dict(numbers=["1,2,3"]))
+
+        read = self.async_storage.read_incidents_with_etags
+
+        def read_and_disconnect(numbers):
+            request.processingFailed(Failure(ConnectionDone()))
+            return read(numbers)
+
+        self.patch(
+            self.async_storage, "read_incidents_with_etags",
+            read_and_disconnect,
+        )
+
+        self.ims.list_incidents(request)
+        self.assertEquals(self.reads, [[1, 2]])
+
+
+    def test_abort(self):
+        """
+        If reading a batch after the first fails, the error is logged and
+        the connection is dropped without finishing the response.
+        """
+        self.write(1, 2, 3)
+        request = self.request(args=dict(numbers=["1,2,3"]))
+        request.transport = StringTransport()
+
+        read = self.async_storage.read_incidents_with_etags
+
+        def fail_later(numbers):
+            if self.reads:
+                return fail(RuntimeError("Oops"))
+            return read(numbers)
+
+        self.patch(self.async_storage, "read_incidents_with_etags", fail_later)
+
+        response = self.ims.list_incidents(request)
+
+        self.assertNoResult(response)
+        self.assertTrue(request.transport.disconnecting)
+        self.assertEquals(request.responseCode, None)
+        self.assertTrue("".join(request.written).startswith("[[1,"))
+        self.assertEquals(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+
+
+class ChangeFeedTests(IMSTestCase):
+    """
+    Tests for the incident change feed.
+    """
+
+    def sequence(self):
+        return self.successResultOf(self.async_storage.changes_since(None))[0]
+
+
+    def changes(self, headers=None, **args):
+        request = self.request(
+            args=dict((key, [value]) for key, value in args.items()),
+            headers=headers,
+        )
+        return request, self.ims.incident_changes(request)
+
+
+    def poll(self, **args):
+        request, response = self.changes(**args)
+        return json.loads(self.body(request, response))
+
+
+    def assertUnsubscribed(self):
+        self.assertEquals(self.async_storage.storage._change_subscribers, [])
+        self.assertEquals(self.clock.getDelayedCalls(), [])
+
+
+    def test_poll_start(self):
+        """
+        Without C{since}, a poll is answered at once with the current
+        sequence number and no changes.
+        """
+        sequence = self.sequence()
+        self.assertEquals(self.poll(), dict(sequence=sequence, changes=[]))
+        self.assertUnsubscribed()
+
+
+    def test_poll_backlog(self):
+        """
+        If incidents have changed since C{since}, a poll is answered at once
+        with the changes.
+        """
+        sequence = self.sequence()
+        self.write(1)
+
+        result = self.poll(since=str(sequence))
+        self.assertEquals(
+            result["changes"], [[1, self.etag(1), self.sequence()]]
+        )
+        self.assertEquals(result["sequence"], self.sequence())
+        self.assertUnsubscribed()
+
+
+    def test_poll_wait(self):
+        """
+        If nothing has changed since C{since}, a poll is answered when an
+        incident is written.
+        """
+        request, response = self.changes(since=str(self.sequence()))
+        bodies = []
+        response.addCallback(bodies.append)
+        self.assertEquals(bodies, [])
+
+        self.write(1)
+
+        self.assertEquals(len(bodies), 1)
+        result = json.loads(bodies[0])
+        self.assertEquals(
+            result["changes"], [[1, self.etag(1), self.sequence()]]
+        )
+        self.assertUnsubscribed()
+
+
+    def test_poll_timeout(self):
+        """
+        If nothing changes, a poll is answered with no changes after
+        L{IncidentManagementSystem.change_poll_timeout} seconds.
+        """
+        sequence = self.sequence()
+        request, response = self.changes(since=str(sequence))
+
+        self.clock.advance(self.ims.change_poll_timeout)
+
+        self.assertEquals(
+            json.loads(self.body(request, response)),
+            dict(sequence=sequence, changes=[])
+        )
+        self.assertUnsubscribed()
+
+
+    def test_poll_unknown(self):
+        """
+        If C{since} is unknown, a poll is answered with C{null} changes.
+        """
+        self.assertEquals(self.poll(since="1")["changes"], None)
+
+
+    def test_poll_disconnect(self):
+        """
+        A poll stops waiting when the client goes away.
+        """
+        request, response = self.changes(since=str(self.sequence()))
+        request.processingFailed(Failure(ConnectionDone()))
+        self.assertUnsubscribed()
+
+
+    def test_stream(self):
+        """
+        With C{text/event-stream} among the accepted types, changes are sent
+        as Server-Sent Events as they happen, with comments to keep the
+        stream open, until the client goes away.
+        """
+        sequence = self.sequence()
+        request, response = self.changes(
+            headers={"Accept": ["application/json, text/event-stream"]}
+        )
+        self.assertNoResult(response)
+        self.assertEquals(
+            request.outgoingHeaders["content-type"], "text/event-stream"
+        )
+        self.assertEquals(request.written, ["id: {0}\n\n".format(sequence)])
+
+        self.write(1)
+        self.assertEquals(
+            request.written[1:],
+            ['id: {1}\ndata: [1,"{0}",{1}]\n\n'.format(
+                self.etag(1), self.sequence()
+            )]
+        )
+
+        self.clock.advance(self.ims.change_keepalive_interval)
+        self.assertEquals(request.written[2:], [":\n\n"])
+
+        request.processingFailed(Failure(ConnectionDone()))
+        self.assertUnsubscribed()
+
+
+    def test_stream_last_event_id(self):
+        """
+        A stream starts with the changes since C{Last-Event-ID}, or a
+        C{reset} event if it is unknown.
+        """
+        sequence = self.sequence()
+        self.write(1)
+
+        request, response = self.changes(headers={
+            "Accept": ["text/event-stream"],
+            "Last-Event-ID": [str(sequence)],
+        })
+        self.assertEquals(
+            request.written,
+            ['id: {1}\ndata: [1,"{0}",{1}]\n\n'.format(
+                self.etag(1), self.sequence()
+            )]
+        )
+        request.processingFailed(Failure(ConnectionDone()))
+
+        request, response = self.changes(headers={
+            "Accept": ["text/event-stream"], "Last-Event-ID": ["1"],
+        })
+        self.assertEquals(
+            request.written,
+            ["event: reset\nid: {0}\ndata: {0}\n\n".format(self.sequence())]
+        )
+        request.processingFailed(Failure(ConnectionDone()))
+        self.assertUnsubscribed()
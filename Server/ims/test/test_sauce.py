@@ -0,0 +1,243 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.sauce}.
+"""
+
+from twisted.trial import unittest
+from twisted.internet.defer import succeed, fail
+from twisted.web import http
+from twisted.web.http_headers import Headers
+from twisted.web.test.requesthelper import DummyRequest
+
+from ims.store import NoSuchIncidentError, IncidentModifiedError
+from ims.sauce import ContentType
+from ims.sauce import http_sauce, not_modified, if_match, set_accepts
+
+
+
+class DummyConfig(object):
+    RejectClientsRegex = ()
+
+
+
+class DummyIMS(object):
+    config = DummyConfig()
+    avatarId = None
+
+    def __init__(self, result):
+        self.result = result
+
+
+    @http_sauce
+    def handler(self, request):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+
+class HTTPSauceTests(unittest.TestCase):
+    """
+    Tests for L{ims.sauce.http_sauce}
+    """
+
+    def request(self, result):
+        request = DummyRequest([""])
+        request.requestHeaders = Headers()
+        return request, DummyIMS(result).handler(request)
+
+
+    def test_result(self):
+        """
+        Results from the handler are returned.
+        """
+        request, response = self.request("Hello")
+
+        self.assertEquals(response, "Hello")
+
+
+    def test_error(self):
+        """
+        Errors raised by the handler become error responses.
+        """
+        request, response = self.request(NoSuchIncidentError(1))
+
+        self.assertEquals(request.responseCode, http.NOT_FOUND)
+        self.assertEquals(response, "No such incident: 1\n")
+
+
+    def test_modified_error(self):
+        """
+        L{IncidentModifiedError}s become I{Precondition Failed} responses.
+        """
+        request, response = self.request(IncidentModifiedError(1))
+
+        self.assertEquals(request.responseCode, http.PRECONDITION_FAILED)
+        self.assertEquals(response, "Incident has been modified: 1\n")
+
+
+    def test_deferred_result(self):
+        """
+        Deferred results from the handler are returned.
+        """
+        request, response = self.request(succeed("Hello"))
+
+        self.assertEquals(self.successResultOf(response), "Hello")
+
+
+    def test_deferred_error(self):
+        """
+        Deferred errors from the handler become error responses.
+        """
+        request, response = self.request(fail(NoSuchIncidentError(1)))
+
+        self.assertEquals(
+            self.successResultOf(response), "No such incident: 1\n"
+        )
+        self.assertEquals(request.responseCode, http.NOT_FOUND)
+
+
+    def test_deferred_server_error(self):
+        """
+        Unexpected deferred errors become server errors, and are logged.
+        """
+        request, response = self.request(fail(RuntimeError("Oops")))
+
+        self.assertEquals(self.successResultOf(response), "Server error.\n")
+        self.assertEquals(request.responseCode, http.INTERNAL_SERVER_ERROR)
+        self.assertEquals(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+
+
+class NotModifiedTests(unittest.TestCase):
+    """
+    Tests for L{ims.sauce.not_modified}
+    """
+
+    def request(self, *if_none_match):
+        request = DummyRequest([""])
+        request.requestHeaders = Headers()
+        if if_none_match:
+            request.requestHeaders.setRawHeaders(
+                "If-None-Match", list(if_none_match)
+            )
+        return request
+
+
+    def test_unconditional(self):
+        """
+        Without C{If-None-Match}, the etag is set and the response is not
+        changed.
+        """
+        request = self.request()
+
+        self.assertFalse(not_modified(request, "abc"))
+        self.assertEquals(request.outgoingHeaders["etag"], "abc")
+        self.assertEquals(request.responseCode, None)
+
+
+    def test_match(self):
+        """
+        If C{If-None-Match} matches the etag, the response is set to
+        I{Not Modified}.
+        """
+        for value in ("abc", '"abc"', 'W/"abc"', '"xyz", "abc"', "*"):
+            request = self.request(value)
+
+            self.assertTrue(not_modified(request, "abc"), value)
+            self.assertEquals(request.outgoingHeaders["etag"], "abc")
+            self.assertEquals(request.responseCode, http.NOT_MODIFIED)
+
+
+    def test_no_match(self):
+        """
+        If C{If-None-Match} doesn't match the etag, the response is not
+        changed.
+        """
+        request = self.request('"xyz"', "ab")
+
+        self.assertFalse(not_modified(request, "abc"))
+        self.assertEquals(request.responseCode, None)
+
+
+
+class IfMatchTests(unittest.TestCase):
+    """
+    Tests for L{ims.sauce.if_match}
+    """
+
+    def request(self, *values):
+        request = DummyRequest([""])
+        request.requestHeaders = Headers()
+        if values:
+            request.requestHeaders.setRawHeaders("If-Match", list(values))
+        return request
+
+
+    def test_none(self):
+        """
+        Without C{If-Match}, or with C{*}, any etag will do.
+        """
+        self.assertEquals(if_match(self.request()), None)
+        self.assertEquals(if_match(self.request('"abc", *')), None)
+
+
+    def test_etags(self):
+        """
+        The strong tags in C{If-Match} are the required etags.
+        """
+        self.assertEquals(
+            if_match(self.request('"abc", W/"def"', "ghi")),
+            set(("abc", "ghi")),
+        )
+
+
+
+class SetAcceptsTests(unittest.TestCase):
+    """
+    Tests for L{ims.sauce.set_accepts}
+    """
+
+    def accepts(self, *values):
+        request = DummyRequest([""])
+        request.requestHeaders = Headers()
+        if values:
+            request.requestHeaders.setRawHeaders("Accept", list(values))
+        set_accepts(request)
+        return request.accepts
+
+
+    def test_none(self):
+        """
+        Without C{Accept}, no content types are accepted.
+        """
+        self.assertEquals(self.accepts(), [])
+
+
+    def test_values(self):
+        """
+        Each known media type in C{Accept} is accepted, ignoring spaces and
+        parameters.
+        """
+        self.assertEquals(
+            self.accepts(
+                "application/json, text/event-stream",
+                "text/html;q=0.9;level=1 , image/png",
+            ),
+            [ContentType.JSON, ContentType.eventStream, ContentType.HTML],
+        )
@@ -0,0 +1,239 @@
+##
+# See the file COPYRIGHT for copyright information.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+##
+
+"""
+Tests for L{ims.sqlstore}.
+"""
+
+from datetime import datetime, timedelta
+
+import twisted.trial.unittest
+from twisted.python.filepath import FilePath
+
+from ims.data import Incident, ReportEntry, Location, Ranger
+from ims.store import StorageError, NoSuchIncidentError, ReadOnlyStorage
+from ims.sqlstore import SQLiteStorage, database_name, migrate
+from ims.test.helpers import StorageTestsMixin, extract_corpus
+
+
+
+class SQLiteStoreTests(StorageTestsMixin, twisted.trial.unittest.TestCase):
+    """
+    Tests for L{ims.sqlstore.SQLiteStorage}
+    """
+
+    storage_class = SQLiteStorage
+
+
+    def incident(self, number, summary=u"Something happened", closed=None):
+        return Incident(
+            number=number,
+            rangers=(
+                Ranger(u"Tulsa", None, None), Ranger(u"Tool", None, None)
+            ),
+            location=Location(u"Ranger HQ", u"5:45 & Esplanade"),
+            incident_types=(u"Medical", u"Fire"),
+            summary=summary,
+            report_entries=(
+                ReportEntry(
+                    author=u"Tool", text=u"Something happened!",
+                    created=datetime(2013, 8, 26, 12, 0, 0),
+                ),
+                ReportEntry(
+                    author=u"Splinter", text=u"Code 4",
+                    created=datetime(2013, 8, 26, 13, 0, 0),
+                    system_entry=True,
+                ),
+            ),
+            created=datetime(2013, 8, 26, 11, 59, 0),
+            closed=closed,
+            priority=2,
+        )
+
+
+    def sample_data(self):
+        path = FilePath(self.mktemp())
+        extract_corpus(path)
+        return path
+
+
+    def test_write_read(self):
+        """
+        Incidents written to the database can be read back.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        store = self.storage(store.path)
+
+        self.assertEquals(store.read_incident_with_number(1), self.incident(1))
+        self.assertRaises(
+            NoSuchIncidentError, store.read_incident_with_number, 2
+        )
+
+
+    def test_rewrite(self):
+        """
+        Writing an incident again replaces its rows.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        incident = self.incident(1, summary=u"Something else")
+        incident.rangers = incident.rangers[:1]
+        incident.report_entries.append(
+            ReportEntry(
+                author=u"Tool", text=u"More",
+                created=datetime(2013, 8, 26, 14, 0, 0),
+            )
+        )
+        store.write_incident(incident)
+
+        self.assertEquals(
+            self.storage(store.path).read_incident_with_number(1), incident
+        )
+
+
+    def test_etag(self):
+        """
+        Etags are stored with each incident.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        etag = store.etag_for_incident_with_number(1)
+
+        store = self.storage(store.path)
+
+        self.assertEquals(list(store.list_incidents()), [(1, etag)])
+        self.assertEquals(store._read_etag(1), etag)
+
+
+    def test_search_closed(self):
+        """
+        Closed incidents are only found if asked for.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(
+            self.incident(2, closed=datetime(2013, 8, 26, 14, 0, 0))
+        )
+
+        def search(**kwargs):
+            return set(
+                number for number, etag in store.search_incidents(**kwargs)
+            )
+
+        self.assertEquals(search(), set((1,)))
+        self.assertEquals(search(show_closed=True), set((1, 2)))
+
+
+    def test_search_page(self):
+        """
+        Search results are in descending order by number, and can be paged
+        through with C{before} and C{limit}.
+        """
+        store = self.storage()
+        for number in (1, 2, 3, 5):
+            store.write_incident(self.incident(number))
+
+        def search(**kwargs):
+            return [
+                number for number, etag in store.search_incidents(**kwargs)
+            ]
+
+        self.assertEquals(search(), [5, 3, 2, 1])
+        self.assertEquals(search(limit=2), [5, 3])
+        self.assertEquals(search(before=3, limit=2), [2, 1])
+        self.assertEquals(
+            search(terms=(u"happened",), before=5, limit=2), [3, 2]
+        )
+
+
+    def test_search_locked(self):
+        """
+        The search index is only searched while holding the lock that
+        writes hold to update it.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        index = store.search_index()
+        search_all = index.search_all
+        locked = []
+
+        def locked_search_all(terms):
+            locked.append(store._state_lock._is_owned())
+            return search_all(terms)
+
+        self.patch(index, "search_all", locked_search_all)
+
+        self.assertEquals(
+            [n for n, etag in store.search_incidents((u"happened",))], [1]
+        )
+        self.assertEquals(locked, [True])
+
+
+    def test_migrate_same_directory(self):
+        """
+        L{migrate} won't put the SQLite store in the file store's directory.
+        """
+        path = self.sample_data()
+
+        self.assertRaises(StorageError, migrate, path, path)
+        self.assertFalse(path.child(database_name).exists())
+
+
+    def test_migrate(self):
+        """
+        L{migrate} copies the incidents in a file store into a SQLite store,
+        and searches of both match the same incidents.
+        """
+        path = self.sample_data()
+        destination = FilePath(self.mktemp())
+
+        self.assertEquals(migrate(path, destination), 16)
+
+        file_store = ReadOnlyStorage(path)
+        sql_store = self.storage(destination)
+
+        for number, etag in file_store.list_incidents():
+            self.assertEquals(
+                sql_store.read_incident_with_number(number),
+                file_store.read_incident_with_number(number)
+            )
+
+        def search(store, **kwargs):
+            return set(
+                number for number, etag in store.search_incidents(**kwargs)
+            )
+
+        midnight = datetime(2013, 3, 22, 0, 0, 0)
+        for kwargs in (
+            dict(),
+            dict(show_closed=True),
+            dict(terms=(u"the",)),
+            dict(show_closed=True, since=midnight),
+            dict(show_closed=True, until=midnight),
+            dict(
+                show_closed=True,
+                since=midnight - timedelta(hours=2, microseconds=1),
+                until=midnight + timedelta(hours=1),
+            ),
+        ):
+            self.assertEquals(
+                search(sql_store, **kwargs), search(file_store, **kwargs),
+                "Mismatch for search: {0!r}".format(kwargs)
+            )
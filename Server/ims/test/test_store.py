@@ -18,19 +18,31 @@
 Tests for L{ims.store}.
 """
 
+import os
+from datetime import datetime
+from hashlib import sha1 as etag_hash
+from os import utime
+from threading import Thread
+from time import sleep
+
 import twisted.trial.unittest
 from twisted.python.filepath import FilePath
 
-from ims.store import Storage
+from ims.data import InvalidDataError, ReportEntry, Ranger
+from ims.index import search_strings_from_incident, open_states
+from ims.binary import is_binary
+from ims.store import StorageError, IncidentModifiedError
+from ims.store import Storage, GroupCommit, convert
+from ims.test.helpers import StorageTestsMixin, extract_corpus
+
 
 
-class StoreTests(twisted.trial.unittest.TestCase):
+class StoreTests(StorageTestsMixin, twisted.trial.unittest.TestCase):
     """
     Tests for L{ims.store.Storage}
     """
 
-    def storage(self):
-        return Storage(FilePath(self.mktemp()))
+    storage_class = Storage
 
 
     def test_provision(self):
@@ -40,6 +52,704 @@ class StoreTests(twisted.trial.unittest.TestCase):
         self.assertTrue(store.path.isdir())
 
 
+    def test_provision_invalid(self):
+        """
+        Provisioning doesn't read incidents, so an invalid one doesn't stop
+        the store from starting, and indexes skip it.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.path.child("2").setContent("{")
+
+        store = self.storage(path=store.path)
+        store.provision()
+
+        self.assertEquals(
+            sorted(number for number, etag in store.list_incidents()), [1, 2]
+        )
+        self.assertEquals(store._time_index, None)
+        self.assertEquals(
+            [number for number, etag in store.search_incidents((u"happened",))],
+            [1]
+        )
+        self.assertTrue(1 in store.time_index())
+        self.assertFalse(2 in store.time_index())
+
+
     def test_list(self):
         store = self.storage()
         self.assertEquals(set(store.list_incidents()), set())
+
+
+    def test_read_uncached(self):
+        """
+        With no cache, each read parses the incident anew.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        incident1 = store.read_incident_with_number(1)
+        incident2 = store.read_incident_with_number(1)
+
+        self.assertEquals(incident1, incident2)
+        self.assertIsNot(incident1, incident2)
+        self.assertEquals((store.cache_hits, store.cache_misses), (0, 0))
+
+
+    def test_read_cached(self):
+        """
+        With a cache, repeated reads return the same parsed incident.
+        """
+        store = self.storage(cache_size=10)
+        store.write_incident(self.incident(1))
+        store._uncache_incident(1)
+
+        incident1 = store.read_incident_with_number(1)
+        incident2 = store.read_incident_with_number(1)
+
+        self.assertIs(incident1, incident2)
+        self.assertEquals((store.cache_hits, store.cache_misses), (1, 1))
+
+
+    def test_cache_eviction(self):
+        """
+        The least recently used incident is evicted when the cache is full.
+        """
+        store = self.storage(cache_size=2)
+        for number in (1, 2, 3):
+            store.write_incident(self.incident(number))
+
+        self.assertEquals(list(store._incident_cache), [2, 3])
+
+        store.read_incident_with_number(2)
+        store.write_incident(self.incident(4))
+
+        self.assertEquals(list(store._incident_cache), [2, 4])
+
+
+    def test_write_updates_cache(self):
+        """
+        Writing an incident replaces the cached copy.
+        """
+        store = self.storage(cache_size=10)
+        store.write_incident(self.incident(1))
+        store.read_incident_with_number(1)
+
+        store.write_incident(self.incident(1, summary=u"Something else"))
+
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something else"
+        )
+
+
+    def test_write_invalid_uncaches(self):
+        """
+        A failed write of an incident modified in place drops the cached copy.
+        """
+        store = self.storage(cache_size=10)
+        store.write_incident(self.incident(1))
+
+        incident = store.read_incident_with_number(1)
+        incident.summary = b"bytes"
+        self.assertRaises(InvalidDataError, store.write_incident, incident)
+
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something happened"
+        )
+
+
+    def test_search(self):
+        """
+        Searches match incidents written to the store, including those
+        written after the search index was built.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1, summary=u"Lost bicycle"))
+        store.write_incident(self.incident(2, summary=u"Found bicycle"))
+
+        def search(*terms):
+            return set(
+                number for number, etag in store.search_incidents(terms)
+            )
+
+        self.assertEquals(search(u"bicycle"), set((1, 2)))
+
+        store.write_incident(self.incident(2, summary=u"Found wallet"))
+        store.write_incident(self.incident(3, summary=u"Lost wallet"))
+
+        self.assertEquals(search(u"bicycle"), set((1,)))
+        self.assertEquals(search(u"lost", u"WALLET"), set((3,)))
+
+
+    def test_search_page(self):
+        """
+        Search results are in descending order by number, and can be paged
+        through with C{before} and C{limit}, including incidents written
+        after the first search.
+        """
+        store = self.storage()
+        for number in (1, 2, 3, 5):
+            store.write_incident(self.incident(number))
+
+        def search(**kwargs):
+            return [
+                number for number, etag
+                in store.search_incidents(show_closed=True, **kwargs)
+            ]
+
+        self.assertEquals(search(), [5, 3, 2, 1])
+        self.assertEquals(search(limit=2), [5, 3])
+        self.assertEquals(search(before=3, limit=2), [2, 1])
+        self.assertEquals(search(before=2, limit=2), [1])
+
+        store.write_incident(self.incident(4))
+
+        self.assertEquals(search(before=5, limit=2), [4, 3])
+
+
+    def test_changes(self):
+        """
+        L{Storage.changes_since} finds the incidents written after a point
+        in the sequence of changes, each once, with its latest etag.
+        """
+        store = self.storage()
+        start, changes = store.changes_since(None)
+        self.assertEquals(changes, [])
+
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+        middle, changes = store.changes_since(start)
+        self.assertEquals([number for number, e, s in changes], [1, 2])
+
+        store.write_incident(self.incident(1, summary=u"Something else"))
+        end, changes = store.changes_since(start)
+
+        self.assertEquals(
+            changes,
+            [
+                (2, store.etag_for_incident_with_number(2), middle),
+                (1, store.etag_for_incident_with_number(1), end),
+            ]
+        )
+        self.assertEquals(store.changes_since(middle)[1], [changes[1]])
+        self.assertEquals(store.changes_since(end), (end, []))
+
+
+    def test_changes_unknown(self):
+        """
+        L{Storage.changes_since} returns C{None} for the changes since a
+        sequence number it didn't issue, and sequence numbers keep
+        increasing in a new store object.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        sequence, changes = store.changes_since(None)
+
+        self.assertEquals(store.changes_since(sequence + 1), (sequence, None))
+
+        store = Storage(store.path)
+        self.assertEquals(store.changes_since(sequence)[1], None)
+        self.assertTrue(store.changes_since(None)[0] > sequence)
+
+
+    def test_subscribe(self):
+        """
+        Subscribers are told about each write, until they unsubscribe.  A
+        subscriber that fails doesn't stop the others from being told.
+        """
+        store = self.storage()
+        changes = []
+
+        def subscriber(*change):
+            changes.append(change)
+
+        def broken(*change):
+            raise RuntimeError("broken")
+
+        store.subscribe(broken)
+        store.subscribe(subscriber)
+
+        store.write_incident(self.incident(1))
+        sequence, recorded = store.changes_since(None)
+
+        self.assertEquals(
+            changes,
+            [(1, store.etag_for_incident_with_number(1), sequence)]
+        )
+        self.assertEquals(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+        store.unsubscribe(subscriber)
+        store.write_incident(self.incident(2))
+
+        self.assertEquals(len(changes), 1)
+        self.assertEquals(len(self.flushLoggedErrors(RuntimeError)), 1)
+
+
+    def test_query(self):
+        """
+        Queries match incidents written to the store, including those
+        written after the attribute index was built.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+
+        self.assertEquals(
+            store.query_incidents(ranger=u"Tulsa", incident_type=u"Medical"),
+            set((1, 2))
+        )
+
+        incident = self.incident(2)
+        incident.closed = datetime(2013, 8, 26, 13, 0, 0)
+        store.write_incident(incident)
+
+        self.assertEquals(
+            store.query_incidents(ranger=u"Tulsa", state=open_states),
+            set((1,))
+        )
+        self.assertEquals(
+            set(number for number, etag in store.search_incidents()),
+            set((1,))
+        )
+
+
+    def test_search_time(self):
+        """
+        Searches with a time range match incidents with report entries in
+        the range, including those written after the store was provisioned.
+        """
+        store = self.storage()
+        store.provision()
+
+        def write(number, *times):
+            incident = self.incident(number)
+            incident.report_entries = [
+                ReportEntry(author=u"Tool", text=u"Hello", created=time)
+                for time in times
+            ]
+            store.write_incident(incident)
+
+        def search(since=None, until=None):
+            return set(
+                number for number, etag
+                in store.search_incidents(since=since, until=until)
+            )
+
+        write(1, datetime(2013, 8, 26, 12, 0, 0))
+        write(2, datetime(2013, 8, 26, 13, 0, 0))
+
+        self.assertEquals(search(since=datetime(2013, 8, 26, 13)), set((2,)))
+        self.assertEquals(search(until=datetime(2013, 8, 26, 12)), set((1,)))
+
+        write(1, datetime(2013, 8, 26, 11), datetime(2013, 8, 26, 14))
+
+        self.assertEquals(
+            search(since=datetime(2013, 8, 26, 13)), set((1, 2))
+        )
+        self.assertEquals(
+            search(
+                since=datetime(2013, 8, 26, 12),
+                until=datetime(2013, 8, 26, 13),
+            ),
+            set((2,))
+        )
+
+
+    def test_search_corpus(self):
+        """
+        Searches using the search index match the same incidents as a brute
+        force search of the sample data.
+        """
+        store = self.storage()
+        extract_corpus(store.path)
+
+        incidents = [
+            store.read_incident_with_number(number)
+            for number, etag in store.list_incidents()
+        ]
+        self.assertEquals(len(incidents), 16)
+
+        def brute_force_search(term):
+            return set(
+                incident.number for incident in incidents
+                if any(
+                    term.lower() in string.lower()
+                    for string in search_strings_from_incident(incident)
+                    if string is not None
+                )
+            )
+
+        terms = set((u"", u"x", u"zz", u"qqq", u"a c", u"-", u"Man."))
+        for incident in incidents:
+            for string in search_strings_from_incident(incident):
+                if not string:
+                    continue
+                for word in string.split():
+                    terms.add(word)
+                    terms.add(word[1:4])
+                    terms.add(word[:-1].upper())
+                terms.add(string[2:12])
+
+        for term in terms:
+            self.assertEquals(
+                set(
+                    number for number, etag
+                    in store.search_incidents((term,), show_closed=True)
+                ),
+                brute_force_search(term),
+                "Mismatch for term: {0!r}".format(term)
+            )
+
+        self.assertEquals(
+            set(number for number, etag in store.search_incidents()),
+            set(
+                incident.number for incident in incidents
+                if not incident.closed
+            )
+        )
+
+        times = sorted(
+            entry.created
+            for incident in incidents
+            for entry in incident.report_entries
+        )
+        for since, until in (
+            (times[0], None),
+            (None, times[len(times) // 2]),
+            (times[len(times) // 3], times[len(times) // 2]),
+        ):
+            self.assertEquals(
+                set(
+                    number for number, etag in store.search_incidents(
+                        show_closed=True, since=since, until=until
+                    )
+                ),
+                set(
+                    incident.number for incident in incidents
+                    if any(
+                        (since is None or since <= entry.created) and
+                        (until is None or entry.created <= until)
+                        for entry in incident.report_entries
+                    )
+                ),
+                "Mismatch for range: {0} - {1}".format(since, until)
+            )
+
+
+    def test_etag_written(self):
+        """
+        Writing an incident records the hash of the data written as its etag.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        etag = etag_hash(store.read_incident_with_number_raw(1)).hexdigest()
+
+        self.assertEquals(store.etag_for_incident_with_number(1), etag)
+        self.assertEquals(store._incident_fp(1, "etag").getContent(), etag)
+
+
+    def test_etag_persisted(self):
+        """
+        A new store reads persisted etags rather than incident data.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        etag = store.etag_for_incident_with_number(1)
+
+        store = Storage(store.path)
+
+        def read(number):
+            self.fail("Read incident {0}".format(number))
+        store.read_incident_with_number_raw = read
+
+        self.assertEquals(list(store.list_incidents()), [(1, etag)])
+
+
+    def test_etag_stale(self):
+        """
+        A persisted etag older than the incident data is not used.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        store._incident_fp(1).setContent(b"{}")
+        mtime = store._incident_fp(1, "etag").getModificationTime()
+        utime(store._incident_fp(1).path, (mtime + 1, mtime + 1))
+
+        store = Storage(store.path)
+
+        self.assertEquals(
+            store.etag_for_incident_with_number(1),
+            etag_hash(b"{}").hexdigest()
+        )
+
+
+    def test_write_atomic(self):
+        """
+        A write that fails to complete leaves the previous version of the
+        incident in place, and no temporary file behind.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        def rename(source, destination):
+            raise OSError("Nope")
+
+        self.patch(os, "rename", rename)
+
+        self.assertRaises(
+            StorageError,
+            store.write_incident, self.incident(1, summary=u"Something else")
+        )
+
+        self.assertEquals(
+            sorted(child.basename() for child in store.path.children()),
+            [".1.etag", "1"]
+        )
+        self.assertEquals(
+            Storage(store.path).read_incident_with_number(1), self.incident(1)
+        )
+
+
+    def test_group_commit(self):
+        """
+        Concurrent writes with group commit share directory syncs.
+        """
+        store = self.storage(group_commit=0.05)
+        store.provision()
+
+        threads = [
+            Thread(target=store.write_incident, args=(self.incident(n),))
+            for n in range(1, 11)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(len(list(store.list_incidents())), 10)
+        self.assertTrue(1 <= store._group_commit.syncs < 10)
+
+
+    def test_update(self):
+        """
+        L{Storage.update_incident} writes the edited incident and returns its
+        new etag.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+
+        def edit(incident):
+            incident.summary = u"Something else"
+            return incident
+
+        etag = store.update_incident(1, edit)
+
+        self.assertEquals(store.etag_for_incident_with_number(1), etag)
+        self.assertEquals(
+            Storage(store.path).read_incident_with_number(1),
+            self.incident(1, summary=u"Something else"),
+        )
+
+
+    def test_update_copy(self):
+        """
+        L{Storage.update_incident} edits a copy of the cached incident, so
+        readers don't see the edit until it has been written, and never see
+        an edit that failed to be written.
+        """
+        store = self.storage(cache_size=10)
+        store.write_incident(self.incident(1))
+        cached = store.read_incident_with_number(1)
+
+        def edit(incident):
+            self.assertNotIdentical(incident, cached)
+            incident.summary = u"Something else"
+            incident.location.name = u"Somewhere else"
+            self.assertEquals(
+                store.read_incident_with_number(1), self.incident(1)
+            )
+            return incident
+
+        store.update_incident(1, edit)
+
+        self.assertEquals(cached, self.incident(1))
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something else"
+        )
+
+        def invalid(incident):
+            incident.summary = b"bytes"
+            return incident
+
+        self.assertRaises(
+            InvalidDataError, store.update_incident, 1, invalid
+        )
+        self.assertEquals(
+            store.read_incident_with_number(1).summary, u"Something else"
+        )
+
+
+    def test_update_etags(self):
+        """
+        L{Storage.update_incident} only edits an incident if its etag is one
+        of the given ones, and otherwise raises L{IncidentModifiedError}.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        etag = store.etag_for_incident_with_number(1)
+
+        def edit(incident):
+            incident.summary = u"Something else"
+            return incident
+
+        self.assertRaises(
+            IncidentModifiedError, store.update_incident, 1, edit, ("x",)
+        )
+        self.assertEquals(store.etag_for_incident_with_number(1), etag)
+
+        self.assertNotEquals(store.update_incident(1, edit, (etag,)), etag)
+        self.assertRaises(
+            IncidentModifiedError, store.update_incident, 1, edit, (etag,)
+        )
+
+
+    def test_update_concurrent(self):
+        """
+        Concurrent updates to an incident are applied one at a time, so none
+        are lost, and don't hold up updates to other incidents.
+        """
+        store = self.storage(cache_size=10)
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+
+        def edit(incident):
+            rangers = list(incident.rangers)
+            sleep(0.001)
+            handle = u"Ranger {0}".format(len(rangers))
+            rangers.append(Ranger(handle, None, None))
+            incident.rangers = rangers
+            return incident
+
+        threads = [
+            Thread(target=store.update_incident, args=(1, edit))
+            for n in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+
+        store.update_incident(2, edit)
+
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(len(store.read_incident_with_number(1).rangers), 11)
+        self.assertEquals(len(store.read_incident_with_number(2).rangers), 2)
+        self.assertEquals(store._incident_locks, {})
+
+
+    def test_update_other_incident(self):
+        """
+        An update to an incident doesn't wait for an update to another one.
+        """
+        store = self.storage()
+        store.write_incident(self.incident(1))
+        store.write_incident(self.incident(2))
+
+        store._lock_incident(1)
+        try:
+            thread = Thread(
+                target=store.update_incident, args=(2, lambda i: i)
+            )
+            thread.start()
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        finally:
+            store._unlock_incident(1)
+
+
+    def test_data_format(self):
+        """
+        Incidents are written in the store's data format, and incidents in
+        either format are read.
+        """
+        store = self.storage(data_format="binary")
+        store.write_incident(self.incident(1))
+
+        self.assertTrue(is_binary(store.read_incident_with_number_raw(1)))
+
+        store = Storage(store.path)
+        store.write_incident(self.incident(2))
+
+        self.assertFalse(is_binary(store.read_incident_with_number_raw(2)))
+        self.assertEquals(
+            [store.read_incident_with_number(n) for n in (1, 2)],
+            [self.incident(1), self.incident(2)],
+        )
+
+
+    def test_data_format_unknown(self):
+        """
+        Creating a store with an unknown data format raises
+        L{StorageError}.
+        """
+        self.assertRaises(StorageError, self.storage, data_format="xml")
+
+
+    def test_convert(self):
+        """
+        L{convert} rewrites incidents that are not in the given format.
+        """
+        store = self.storage()
+        extract_corpus(store.path)
+
+        incidents = [
+            store.read_incident_with_number(number)
+            for number, etag in sorted(store.list_incidents())
+        ]
+
+        self.assertEquals(convert(store.path, "binary"), 16)
+        self.assertEquals(convert(store.path, "binary"), 0)
+
+        store = Storage(store.path)
+        for incident in incidents:
+            self.assertTrue(
+                is_binary(store.read_incident_with_number_raw(incident.number))
+            )
+            self.assertEquals(
+                store.read_incident_with_number(incident.number), incident
+            )
+
+        self.assertEquals(convert(store.path, "json"), 16)
+
+
+
+class GroupCommitTests(twisted.trial.unittest.TestCase):
+    """
+    Tests for L{ims.store.GroupCommit}
+    """
+
+    def test_sync(self):
+        """
+        Each call to L{GroupCommit.sync} that doesn't overlap another one
+        syncs the directory.
+        """
+        path = FilePath(self.mktemp())
+        path.createDirectory()
+
+        group_commit = GroupCommit(path)
+        group_commit.sync()
+        group_commit.sync()
+
+        self.assertEquals(group_commit.syncs, 2)
+
+
+    def test_sync_error(self):
+        """
+        Errors syncing the directory are raised to the caller.
+        """
+        group_commit = GroupCommit(FilePath(self.mktemp()))
+
+        self.assertRaises(OSError, group_commit.sync)
+        self.assertFalse(group_commit._syncing)